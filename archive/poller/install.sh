@@ -16,6 +16,7 @@ set -e
 
 INSTALL_DIR="/opt/marstek-poller"
 SERVICE_NAME="marstek-poller"
+ROTATION_SERVICE_NAME="marstek-rotation"
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
 echo "========================================"
@@ -42,6 +43,10 @@ mkdir -p "$INSTALL_DIR"
 
 echo "[2/6] Copying files..."
 cp "$SCRIPT_DIR/marstek_poller.py" "$INSTALL_DIR/"
+cp -r "$SCRIPT_DIR/marstek_api" "$INSTALL_DIR/"
+cp "$SCRIPT_DIR/marstek_rotation_service.py" "$INSTALL_DIR/"
+cp -r "$SCRIPT_DIR/marstek_rotation" "$INSTALL_DIR/"
+cp -r "$SCRIPT_DIR/marstek_telemetry" "$INSTALL_DIR/"
 cp "$SCRIPT_DIR/requirements.txt" "$INSTALL_DIR/"
 
 # Copy config if it doesn't exist
@@ -57,13 +62,16 @@ pip3 install -r "$INSTALL_DIR/requirements.txt" --quiet
 
 echo "[4/6] Installing systemd service..."
 cp "$SCRIPT_DIR/marstek-poller.service" "/etc/systemd/system/"
+cp "$SCRIPT_DIR/marstek-rotation.service" "/etc/systemd/system/"
 systemctl daemon-reload
 
 echo "[5/6] Enabling service..."
 systemctl enable "$SERVICE_NAME"
+systemctl enable "$ROTATION_SERVICE_NAME"
 
 echo "[6/6] Starting service..."
 systemctl start "$SERVICE_NAME"
+systemctl start "$ROTATION_SERVICE_NAME"
 
 # Check status
 sleep 2
@@ -79,12 +87,14 @@ if systemctl is-active --quiet "$SERVICE_NAME"; then
     echo "  1. Edit config:    sudo nano /opt/marstek-poller/config.yaml"
     echo "  2. Restart:        sudo systemctl restart marstek-poller"
     echo "  3. Bekijk logs:    sudo journalctl -u marstek-poller -f"
+    echo "                     sudo journalctl -u marstek-rotation -f"
     echo "  4. Check status:   sudo systemctl status marstek-poller"
     echo ""
     echo "MQTT topics:"
     echo "  - marstek/marstek_fasea_d828/state"
     echo "  - marstek/marstek_faseb_9a7d/state"
     echo "  - marstek/marstek_fasec_deb8/state"
+    echo "  - marstek/rotation/{emptiest,fullest,all_full,decision}"
     echo ""
 else
     echo ""
@@ -0,0 +1,81 @@
+"""Marstek Local API (UDP JSON-RPC) client library."""
+
+from .client import (
+    MODE_AI,
+    MODE_AUTO,
+    MODE_MANUAL,
+    MODE_PASSIVE,
+    WEEK_ALL_DAYS,
+    MarstekApiError,
+    MarstekClient,
+)
+from .endpoint import (
+    LANE_POLL,
+    LANE_SWITCH,
+    MarstekEndpoint,
+    MarstekProtocol,
+    RequestStats,
+    get_endpoint,
+)
+from .executor import CommandResult, SwitchExecutor, SwitchResult
+from .metrics import (
+    DURATION_BUCKETS,
+    LATENCY_BUCKETS,
+    Counter,
+    Histogram,
+    MetricFamily,
+    MetricsRegistry,
+    MetricsServer,
+)
+from .models import BatteryStatus, DeviceInfo, EnergyStatus, ManualSlot, ModeStatus
+from .policy import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    RttEstimator,
+    TokenBucket,
+)
+from .schedule import SLOT_COUNT, ScheduleManager, ScheduleResult, slot_from_dict, week_set
+from .slot_cache import SlotCache
+
+__all__ = [
+    "DURATION_BUCKETS",
+    "LANE_POLL",
+    "LANE_SWITCH",
+    "LATENCY_BUCKETS",
+    "MODE_AI",
+    "MODE_AUTO",
+    "MODE_MANUAL",
+    "MODE_PASSIVE",
+    "SLOT_COUNT",
+    "WEEK_ALL_DAYS",
+    "BatteryStatus",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "CommandResult",
+    "Counter",
+    "DeviceInfo",
+    "EnergyStatus",
+    "Histogram",
+    "ManualSlot",
+    "MarstekApiError",
+    "MarstekClient",
+    "MarstekEndpoint",
+    "MarstekProtocol",
+    "MetricFamily",
+    "MetricsRegistry",
+    "MetricsServer",
+    "ModeStatus",
+    "RequestStats",
+    "RetryPolicy",
+    "RttEstimator",
+    "ScheduleManager",
+    "ScheduleResult",
+    "SlotCache",
+    "SwitchExecutor",
+    "SwitchResult",
+    "TokenBucket",
+    "get_endpoint",
+    "slot_from_dict",
+    "week_set",
+]
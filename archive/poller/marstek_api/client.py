@@ -0,0 +1,137 @@
+"""
+High-level client for one Marstek battery.
+
+Alle methodes bestaan in een sync en een async variant (`get_mode()` en
+`async_get_mode()`). Beide draaien over het gedeelde endpoint, dus elke client
+in het proces deelt dezelfde socket, rate limiter en circuit breaker.
+"""
+
+import asyncio
+import logging
+
+from .endpoint import DEFAULT_PORT, LANE_POLL, MarstekEndpoint, get_endpoint
+from .models import BatteryStatus, DeviceInfo, EnergyStatus, ManualSlot, ModeStatus
+from .policy import RetryPolicy, RttEstimator
+
+_LOGGER = logging.getLogger(__name__)
+
+MODE_AUTO = "Auto"
+MODE_AI = "AI"
+MODE_MANUAL = "Manual"
+MODE_PASSIVE = "Passive"
+
+WEEK_ALL_DAYS = 127  # 1+2+4+8+16+32+64
+
+
+class MarstekApiError(Exception):
+    """The battery answered with a JSON-RPC error."""
+
+    def __init__(self, method: str, error):
+        self.method = method
+        if isinstance(error, dict):
+            self.code = error.get("code")
+            self.message = error.get("message")
+        else:
+            self.code = None
+            self.message = str(error)
+        super().__init__(f"{method}: error {self.code}: {self.message}")
+
+
+class MarstekClient:
+    """Client for a single battery.
+
+    Timeouts return None; JSON-RPC errors raise MarstekApiError and an open
+    circuit breaker raises CircuitOpenError.
+    """
+
+    def __init__(self, ip: str, port: int = DEFAULT_PORT,
+                 endpoint: MarstekEndpoint | None = None,
+                 timeout: float | None = None,
+                 retry_policy: RetryPolicy | None = None,
+                 rtt_estimator: RttEstimator | None = None):
+        self.ip = ip
+        self.port = port
+        self.endpoint = endpoint or get_endpoint(port)
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rtt_estimator = rtt_estimator or RttEstimator()
+
+    def __repr__(self):
+        return f"MarstekClient({self.ip}:{self.port})"
+
+    async def async_call(self, method: str, params: dict, lane: str = LANE_POLL) -> dict | None:
+        """Send a request with retries; return the `result` or None on timeout."""
+        for attempt in range(self.retry_policy.attempts):
+            if attempt:
+                await asyncio.sleep(self.retry_policy.delay(attempt - 1))
+
+            response = await self.endpoint.request(
+                self.ip, method, params,
+                timeout=self.timeout, port=self.port, rtt_estimator=self.rtt_estimator, lane=lane
+            )
+            if response is None:
+                _LOGGER.debug(f"{self.ip} {method}: timeout (attempt {attempt + 1})")
+                continue
+            if "error" in response:
+                raise MarstekApiError(method, response["error"])
+            return response.get("result")
+
+        return None
+
+    def call(self, method: str, params: dict) -> dict | None:
+        """Blocking variant of async_call()."""
+        return self.endpoint.run_sync(self.async_call(method, params))
+
+    # Read methods
+
+    async def async_get_device(self) -> DeviceInfo | None:
+        result = await self.async_call("Marstek.GetDevice", {"ble_mac": "0"})
+        return DeviceInfo.from_result(result) if result is not None else None
+
+    async def async_get_mode(self, lane: str = LANE_POLL) -> ModeStatus | None:
+        result = await self.async_call("ES.GetMode", {"id": 0}, lane)
+        return ModeStatus.from_result(result) if result is not None else None
+
+    async def async_get_status(self) -> EnergyStatus | None:
+        result = await self.async_call("ES.GetStatus", {"id": 0})
+        return EnergyStatus.from_result(result) if result is not None else None
+
+    async def async_bat_status(self) -> BatteryStatus | None:
+        result = await self.async_call("Bat.GetStatus", {"id": 0})
+        return BatteryStatus.from_result(result) if result is not None else None
+
+    # Write methods
+
+    async def async_set_mode(self, mode: str, config: dict | None = None,
+                             lane: str = LANE_POLL) -> bool:
+        """Switch operating mode; `config` overrides the default *_cfg block."""
+        if config is None:
+            config = {"mode": mode}
+            if mode in (MODE_AUTO, MODE_AI):
+                config[f"{mode.lower()}_cfg"] = {"enable": 1}
+        result = await self.async_call("ES.SetMode", {"id": 0, "config": config}, lane)
+        return bool(result and result.get("set_result"))
+
+    async def async_set_manual_slot(self, slot: ManualSlot) -> bool:
+        """Write one manual schedule slot (puts the battery in Manual mode)."""
+        return await self.async_set_mode(
+            MODE_MANUAL, {"mode": MODE_MANUAL, "manual_cfg": slot.as_dict()}
+        )
+
+    def get_device(self) -> DeviceInfo | None:
+        return self.endpoint.run_sync(self.async_get_device())
+
+    def get_mode(self) -> ModeStatus | None:
+        return self.endpoint.run_sync(self.async_get_mode())
+
+    def get_status(self) -> EnergyStatus | None:
+        return self.endpoint.run_sync(self.async_get_status())
+
+    def bat_status(self) -> BatteryStatus | None:
+        return self.endpoint.run_sync(self.async_bat_status())
+
+    def set_mode(self, mode: str, config: dict | None = None) -> bool:
+        return self.endpoint.run_sync(self.async_set_mode(mode, config))
+
+    def set_manual_slot(self, slot: ManualSlot) -> bool:
+        return self.endpoint.run_sync(self.async_set_manual_slot(slot))
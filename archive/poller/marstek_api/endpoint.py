@@ -0,0 +1,332 @@
+"""
+Shared UDP endpoint for the Marstek Local API.
+
+Eén socket op de API port voor de hele levensduur van het proces. Alle
+requests (polling, schedule writes, diagnostics) lopen via dit endpoint, zodat
+er geen bind/close churn meer is en geen "port still in use" fouten.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+
+from .metrics import LATENCY_BUCKETS, Counter, Histogram, MetricFamily
+from .policy import CircuitBreaker, CircuitOpenError, RttEstimator, TokenBucket
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PORT = 30000
+DEFAULT_TIMEOUT = 3.0
+
+# Token bucket lanes: polls and schedule writes share one bucket per
+# battery; a mode switch and its read-back get their own, so a poll that
+# just emptied the first bucket does not delay the switch
+LANE_POLL = "poll"
+LANE_SWITCH = "switch"
+
+DEFAULT_GUARD_CONFIG = {
+    "rate_limit_per_second": 1.0,
+    "rate_limit_burst": 3,
+    "switch_rate_limit_per_second": 4.0,
+    "switch_rate_limit_burst": 4,
+    "breaker_failure_threshold": 3,
+    "breaker_reset_seconds": 60.0,
+}
+
+
+@dataclass(slots=True)
+class RequestStats:
+    """Per-battery request metrics, only updated on the endpoint loop."""
+
+    latency: Histogram = field(default_factory=lambda: Histogram(LATENCY_BUCKETS))
+    timeouts: Counter = field(default_factory=Counter)
+    refused: Counter = field(default_factory=Counter)
+
+
+class MarstekProtocol(asyncio.DatagramProtocol):
+    """Asyncio UDP protocol that dispatches replies to pending requests.
+
+    Pending requests are keyed by (ip, request id). Lookups, echo detection
+    and stale-reply drops are all O(1) per datagram.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.pending = {}
+        self.echoes_dropped = 0
+        self.stale_dropped = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            response = json.loads(data.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return
+
+        if not isinstance(response, dict):
+            return
+
+        entry = self.pending.get((addr[0], response.get("id")))
+        if entry is None:
+            # Reply to a request that already timed out (or was never ours)
+            self.stale_dropped += 1
+            _LOGGER.debug(f"Stale reply from {addr[0]}: {response}")
+            return
+
+        request, future = entry
+        # Skip echo (battery sometimes sends the request back, not always
+        # byte-for-byte): only a result or error answers a request
+        if response == request or ("result" not in response and "error" not in response):
+            self.echoes_dropped += 1
+            return
+        if not future.done():
+            future.set_result(response)
+
+    def error_received(self, exc):
+        _LOGGER.debug(f"UDP error: {exc}")
+
+
+class MarstekEndpoint:
+    """Long-lived UDP endpoint with a request-id demultiplexer.
+
+    The socket is served by a private event loop in a daemon thread, so the
+    endpoint can be used from blocking code (request_sync) as well as from
+    any asyncio event loop (request).
+
+    Every request first passes the battery's circuit breaker and token-bucket
+    rate limiter, so an unresponsive battery is not hammered and bursts that
+    lock up the firmware are spread out.
+    """
+
+    def __init__(self, port: int = DEFAULT_PORT, bind_host: str = "0.0.0.0"):
+        self.port = port
+        self.bind_host = bind_host
+        self.guard_config = dict(DEFAULT_GUARD_CONFIG)
+        self.buckets = {}
+        self.breakers = {}
+        self.protocol = None
+        self._transport = None
+        self._loop = None
+        self._thread = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # Metrics (see collect_metrics)
+        self.stats = {}
+        self.bind_failures = Counter()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Bind the socket and start the receive loop (idempotent)."""
+        with self._lock:
+            if self.running:
+                return
+
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind((self.bind_host, self.port))
+            except OSError:
+                self.bind_failures.inc()
+                sock.close()
+                raise
+
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._loop.run_forever,
+                name=f"marstek-endpoint-{self.port}",
+                daemon=True
+            )
+            self._thread.start()
+
+            future = asyncio.run_coroutine_threadsafe(self._open(sock), self._loop)
+            future.result()
+            _LOGGER.debug(f"Endpoint bound on {self.bind_host}:{self.port}")
+
+    async def _open(self, sock: socket.socket):
+        self._transport, self.protocol = await self._loop.create_datagram_endpoint(
+            MarstekProtocol, sock=sock
+        )
+
+    def close(self):
+        """Close the socket and stop the receive loop."""
+        with self._lock:
+            if not self.running:
+                return
+            self._loop.call_soon_threadsafe(self._transport.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=2)
+            self._loop.close()
+            self._thread = None
+
+    def configure_guards(self, **settings):
+        """Update rate limiter / breaker settings (keys of DEFAULT_GUARD_CONFIG).
+
+        Existing per-battery state is reset so the new settings apply.
+        """
+        for key, value in settings.items():
+            if key in self.guard_config and value is not None:
+                self.guard_config[key] = value
+        self.buckets = {}
+        self.breakers = {}
+
+    def breaker(self, ip: str) -> CircuitBreaker:
+        """Return the circuit breaker for a battery, creating it on first use."""
+        breaker = self.breakers.get(ip)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                failure_threshold=self.guard_config["breaker_failure_threshold"],
+                reset_timeout=self.guard_config["breaker_reset_seconds"]
+            )
+            self.breakers[ip] = breaker
+        return breaker
+
+    def _bucket(self, ip: str, lane: str = LANE_POLL) -> TokenBucket:
+        bucket = self.buckets.get((ip, lane))
+        if bucket is None:
+            prefix = "switch_" if lane == LANE_SWITCH else ""
+            bucket = TokenBucket(
+                rate=self.guard_config[f"{prefix}rate_limit_per_second"],
+                burst=self.guard_config[f"{prefix}rate_limit_burst"]
+            )
+            self.buckets[(ip, lane)] = bucket
+        return bucket
+
+    def run_sync(self, coro):
+        """Run a coroutine on the endpoint loop and block until it finishes."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def next_id(self) -> int:
+        """Return a process-wide unique request id."""
+        return next(self._ids)
+
+    async def _request(self, ip: str, port: int, request: dict, timeout: float | None,
+                       rtt_estimator: RttEstimator | None, lane: str = LANE_POLL) -> dict | None:
+        """Send a request and wait for the matching reply (endpoint loop only)."""
+        stats = self.stats.get(ip)
+        if stats is None:
+            stats = self.stats[ip] = RequestStats()
+        breaker = self.breaker(ip)
+        if not breaker.allow():
+            stats.refused.inc()
+            raise CircuitOpenError(f"Circuit open for {ip}, request {request['method']} refused")
+
+        delay = self._bucket(ip, lane).reserve()
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+
+        if timeout is None:
+            timeout = rtt_estimator.timeout if rtt_estimator else DEFAULT_TIMEOUT
+
+        key = (ip, request["id"])
+        payload = json.dumps(request).encode("utf-8")
+        future = self._loop.create_future()
+        self.protocol.pending[key] = (request, future)
+        try:
+            start = time.monotonic()
+            self._transport.sendto(payload, (ip, port))
+            response = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            stats.timeouts.inc()
+            if rtt_estimator:
+                rtt_estimator.on_timeout()
+            breaker.record_failure()
+            if breaker.state == CircuitBreaker.OPEN:
+                _LOGGER.warning(f"{ip}: circuit open after {breaker.failures} timeouts, "
+                                f"backing off {breaker.reset_timeout:.0f}s")
+            return None
+        except asyncio.CancelledError:
+            # Says nothing about the battery (a gather torn down, a shutdown)
+            breaker.release()
+            raise
+        finally:
+            self.protocol.pending.pop(key, None)
+
+        rtt = time.monotonic() - start
+        stats.latency.observe(rtt)
+        if rtt_estimator:
+            rtt_estimator.observe(rtt)
+        breaker.record_success()
+        return response
+
+    def collect_metrics(self) -> list:
+        """Metric families for a MetricsRegistry (request latency, timeouts, drops)."""
+        latency = MetricFamily("marstek_request_duration_seconds", "histogram",
+                               "Round-trip time of answered requests")
+        timeouts = MetricFamily("marstek_request_timeouts", "counter", "Requests without a reply in time")
+        refused = MetricFamily("marstek_requests_refused", "counter",
+                               "Requests refused while the circuit breaker was open")
+        for ip, stats in list(self.stats.items()):
+            latency.add(stats.latency, ip=ip)
+            timeouts.add(stats.timeouts.value, ip=ip)
+            refused.add(stats.refused.value, ip=ip)
+        protocol = self.protocol
+        return [
+            latency, timeouts, refused,
+            MetricFamily("marstek_echo_replies", "counter", "Echoed requests ignored by the endpoint")
+            .add(protocol.echoes_dropped if protocol else 0),
+            MetricFamily("marstek_stale_replies", "counter", "Replies to requests that already timed out")
+            .add(protocol.stale_dropped if protocol else 0),
+            MetricFamily("marstek_bind_failures", "counter", "Failed binds of the API port")
+            .add(self.bind_failures.value),
+        ]
+
+    def _submit(self, ip: str, method: str, params: dict, timeout: float | None,
+                port: int | None, rtt_estimator: RttEstimator | None, lane: str = LANE_POLL):
+        self.start()
+        request = {"id": self.next_id(), "method": method, "params": params}
+        return asyncio.run_coroutine_threadsafe(
+            self._request(ip, port or self.port, request, timeout, rtt_estimator, lane),
+            self._loop
+        )
+
+    async def request(self, ip: str, method: str, params: dict,
+                      timeout: float | None = None, port: int | None = None,
+                      rtt_estimator: RttEstimator | None = None,
+                      lane: str = LANE_POLL) -> dict | None:
+        """Send a JSON-RPC request from any event loop.
+
+        Without an explicit timeout the estimator's timeout is used; the
+        estimator is fed the RTT measured on the wire (rate-limit waits
+        excluded). `lane` picks the token bucket (LANE_POLL or LANE_SWITCH).
+        Returns the full response dict, or None on timeout. Raises
+        CircuitOpenError while the battery's breaker is open.
+        """
+        return await asyncio.wrap_future(
+            self._submit(ip, method, params, timeout, port, rtt_estimator, lane)
+        )
+
+    def request_sync(self, ip: str, method: str, params: dict,
+                     timeout: float | None = None, port: int | None = None,
+                     rtt_estimator: RttEstimator | None = None,
+                     lane: str = LANE_POLL) -> dict | None:
+        """Blocking variant of request()."""
+        return self._submit(ip, method, params, timeout, port, rtt_estimator, lane).result()
+
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint(port: int = DEFAULT_PORT) -> MarstekEndpoint:
+    """Return the process-wide endpoint for a port, creating it on first use."""
+    with _endpoints_lock:
+        endpoint = _endpoints.get(port)
+        if endpoint is None:
+            endpoint = MarstekEndpoint(port)
+            _endpoints[port] = endpoint
+        return endpoint
@@ -0,0 +1,194 @@
+"""
+Parallel ES.SetMode commands for a battery switch.
+
+Een switch zet eerst de nieuwe batterij op Auto en wacht tot die bevestigd
+is. Daarna gaan alle andere batterijen tegelijk naar Manual, elk met een
+eigen bevestiging. Zo is er nooit een moment zonder actieve batterij, zonder
+vaste delays: een switch duurt een paar round-trips in plaats van 5-10
+seconden.
+
+Bevestigd betekent: `set_result` ontvangen én ES.GetMode leest de nieuwe
+mode terug (read-after-write). De commando's en de controles gaan voor
+alle batterijen tegelijk; alleen een batterij die niet binnen
+verify_timeout de nieuwe mode toont krijgt het commando opnieuw.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+
+from .client import MODE_AUTO, MODE_MANUAL, MarstekApiError, MarstekClient
+from .endpoint import LANE_SWITCH
+from .models import ModeStatus
+from .policy import CircuitOpenError
+
+
+@dataclass(slots=True)
+class CommandResult:
+    """Outcome of one ES.SetMode command."""
+
+    ip: str
+    mode: str
+    acknowledged: bool = False
+    latency: float = 0.0
+    error: str | None = None
+    attempts: int = 0
+    # Read-after-write: last ES.GetMode result and how long the mode took
+    # to show up after the (last) ES.SetMode was sent
+    status: ModeStatus | None = None
+    time_to_effect: float | None = None
+
+    @property
+    def confirmed_mode(self) -> str | None:
+        return self.status.mode if self.status else None
+
+    @property
+    def converged(self) -> bool:
+        return self.confirmed_mode == self.mode
+
+    def as_dict(self) -> dict:
+        return {
+            "ip": self.ip,
+            "mode": self.mode,
+            "acknowledged": self.acknowledged,
+            "confirmed_mode": self.confirmed_mode,
+            "converged": self.converged,
+            "attempts": self.attempts,
+            "latency_ms": round(self.latency * 1000),
+            "time_to_effect_ms": None if self.time_to_effect is None else round(self.time_to_effect * 1000),
+            "error": self.error
+        }
+
+
+@dataclass(slots=True)
+class SwitchResult:
+    """Outcome of a switch: the activation plus the deactivations."""
+
+    active: str | None
+    commands: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.commands) and all(c.converged for c in self.commands)
+
+    def as_dict(self) -> dict:
+        return {
+            "active": self.active,
+            "ok": self.ok,
+            "elapsed_ms": round(self.elapsed * 1000),
+            "commands": [c.as_dict() for c in self.commands]
+        }
+
+
+class SwitchExecutor:
+    """Sends mode commands concurrently through MarstekClient objects."""
+
+    def __init__(self, verify_timeout: float = 5.0, verify_interval: float = 0.25,
+                 attempts: int = 2):
+        self.verify_timeout = verify_timeout
+        self.verify_interval = verify_interval
+        self.attempts = max(1, attempts)
+
+    async def _send(self, client: MarstekClient, result: CommandResult) -> float | None:
+        """Send the command; returns when it was sent if it was acknowledged."""
+        sent = time.monotonic()
+        try:
+            # Manual goes without a manual_cfg: every slot belongs to a schedule
+            # (see "Slot indeling" in docs/MQTT_POLLER.md), so none is rewritten
+            result.acknowledged = await client.async_set_mode(result.mode, lane=LANE_SWITCH)
+        except (MarstekApiError, CircuitOpenError) as e:
+            result.acknowledged = False
+            result.error = str(e)
+            return None
+        if not result.acknowledged:
+            result.error = "no acknowledgement"
+            return None
+        return sent
+
+    async def _verify(self, client: MarstekClient, result: CommandResult, sent: float,
+                      start: float) -> bool:
+        """Read the mode back until it matches or verify_timeout passes."""
+        deadline = sent + self.verify_timeout
+        try:
+            while True:
+                # Own token bucket: a poll that just used up the regular
+                # bucket must not hold the read-back for a second
+                status = await client.async_get_mode(lane=LANE_SWITCH)
+                now = time.monotonic()
+                if status is not None:
+                    result.status = status
+                    if status.mode == result.mode:
+                        result.time_to_effect = now - sent
+                        result.latency = now - start
+                        result.error = None
+                        return True
+                if now >= deadline:
+                    result.error = f"mode is {result.confirmed_mode or 'unknown'}"
+                    return False
+                await asyncio.sleep(self.verify_interval)
+        except (MarstekApiError, CircuitOpenError) as e:
+            result.error = str(e)
+            return False
+
+    async def async_fan_out(self, clients: list, mode: str) -> list:
+        """Send the same mode to all clients at once and confirm each of them.
+
+        Every round sends ES.SetMode to the pending batteries concurrently,
+        then reads them all back concurrently; only the batteries that did
+        not converge get the next attempt. The per-IP token bucket paces the
+        GetMode polls of each battery.
+        """
+        start = time.monotonic()
+        results = [CommandResult(client.ip, mode) for client in clients]
+        pending = list(zip(clients, results))
+        for attempt in range(1, self.attempts + 1):
+            if not pending:
+                break
+            for _, result in pending:
+                result.attempts = attempt
+            sent = await asyncio.gather(*(self._send(client, result) for client, result in pending))
+            sent = [(client, result, at) for (client, result), at in zip(pending, sent) if at is not None]
+            await asyncio.gather(*(self._verify(client, result, at, start) for client, result, at in sent))
+            pending = [(client, result) for client, result in pending if not result.converged]
+        now = time.monotonic()
+        for _, result in pending:
+            result.latency = now - start
+        return results
+
+    async def async_set_mode(self, client: MarstekClient, mode: str) -> CommandResult:
+        """Send one mode command and confirm it took effect, retrying if not."""
+        return (await self.async_fan_out([client], mode))[0]
+
+    async def async_activate(self, active: MarstekClient, others: list) -> SwitchResult:
+        """Auto on `active`, then Manual on all `others` concurrently.
+
+        The others are only deactivated once the new battery is confirmed in
+        Auto; if it is not, they are left alone so the old battery keeps
+        running.
+        """
+        start = time.monotonic()
+        switch = SwitchResult(active.ip)
+        activation = await self.async_set_mode(active, MODE_AUTO)
+        switch.commands.append(activation)
+        if activation.converged and others:
+            switch.commands.extend(await self.async_fan_out(others, MODE_MANUAL))
+        switch.elapsed = time.monotonic() - start
+        return switch
+
+    async def async_set_all(self, clients: list, mode: str) -> SwitchResult:
+        """Put every battery in the same mode (e.g. all Manual as emergency stop)."""
+        start = time.monotonic()
+        switch = SwitchResult(None, await self.async_fan_out(clients, mode))
+        switch.elapsed = time.monotonic() - start
+        return switch
+
+    def activate(self, active: MarstekClient, others: list) -> SwitchResult:
+        """Blocking variant of async_activate()."""
+        return active.endpoint.run_sync(self.async_activate(active, others))
+
+    def set_all(self, clients: list, mode: str) -> SwitchResult:
+        """Blocking variant of async_set_all()."""
+        if not clients:
+            return SwitchResult(None)
+        return clients[0].endpoint.run_sync(self.async_set_all(clients, mode))
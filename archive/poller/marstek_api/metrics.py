@@ -0,0 +1,186 @@
+"""
+Prometheus / OpenMetrics metrics for the poller.
+
+Tot nu toe waren de interne cijfers (latency per batterij, timeouts, echo's,
+duur van een poll cyclus of switch) alleen in de logs te zien. Deze module
+houdt ze bij in vooraf aangemaakte tellers en histogrammen en serveert ze
+als tekst op http://<host>:<port>/metrics.
+
+Elke teller heeft precies één schrijvende thread (de endpoint loop, de poll
+loop of de command worker), dus ophogen gebeurt zonder lock: één optelling
+op een bestaand object, geen allocatie. De HTTP thread leest alleen; een
+scrape kan hooguit één meting achterlopen.
+"""
+
+import bisect
+import logging
+import threading
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_LOGGER = logging.getLogger(__name__)
+
+# Request round-trips: fast batteries answer in tens of ms, V3 firmware
+# takes seconds
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0)
+# Poll cycles and switches span several round-trips
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    """Monotonic counter with a single writer."""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class Histogram:
+    """Fixed-bucket histogram with a single writer.
+
+    Bucket counts are stored per bucket and made cumulative when rendered.
+    """
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+@dataclass(slots=True)
+class MetricFamily:
+    """One metric name with its samples, built at scrape time by a collector."""
+
+    name: str
+    kind: str  # counter, gauge or histogram
+    help: str
+    samples: list = field(default_factory=list)  # (labels, value or Histogram)
+
+    def add(self, value, **labels):
+        self.samples.append((labels, value))
+        return self
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict, **extra) -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in {**labels, **extra}.items()]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        if value != value:
+            return "NaN"
+        if value in (float("inf"), float("-inf")):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(int(value))
+
+
+class MetricsRegistry:
+    """Collectors that return MetricFamily lists, rendered per scrape."""
+
+    def __init__(self):
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, collector):
+        """Add a callable that returns an iterable of MetricFamily."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def collect(self) -> list:
+        with self._lock:
+            collectors = list(self._collectors)
+        families = []
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                _LOGGER.warning(f"Metrics collector failed: {e}")
+        return families
+
+    def render(self, openmetrics: bool = True) -> str:
+        """Text exposition: OpenMetrics 1.0, or Prometheus 0.0.4 format."""
+        lines = []
+        for family in self.collect():
+            # Prometheus 0.0.4 names the counter family after its sample
+            name = family.name if openmetrics or family.kind != "counter" else f"{family.name}_total"
+            lines.append(f"# HELP {name} {family.help}")
+            lines.append(f"# TYPE {name} {family.kind}")
+            for labels, value in family.samples:
+                if family.kind == "histogram":
+                    cumulative = 0
+                    for bound, count in zip((*value.bounds, float("inf")), value.counts):
+                        cumulative += count
+                        le = _number(float(bound))
+                        lines.append(f"{family.name}_bucket{_labels(labels, le=le)} {cumulative}")
+                    lines.append(f"{family.name}_count{_labels(labels)} {cumulative}")
+                    lines.append(f"{family.name}_sum{_labels(labels)} {_number(float(value.sum))}")
+                elif family.kind == "counter":
+                    lines.append(f"{family.name}_total{_labels(labels)} {_number(value)}")
+                else:
+                    lines.append(f"{family.name}{_labels(labels)} {_number(value)}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serves a registry on /metrics from a daemon thread."""
+
+    def __init__(self, registry: MetricsRegistry, port: int = 9108, host: str = "127.0.0.1"):
+        self.registry = registry
+        self.port = port
+        self.host = host
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Bind and serve; raises OSError when the port is taken."""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+                body = registry.render(openmetrics).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics
+                                 else PROMETHEUS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                _LOGGER.debug(f"Metrics {self.address_string()}: {format % args}")
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        _LOGGER.info(f"Metrics on http://{self.host}:{self._server.server_address[1]}/metrics")
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,86 @@
+"""
+Typed responses for the Marstek Local API.
+
+Veldnamen volgen de JSON keys van de API. Velden die een firmware niet
+meestuurt blijven None.
+"""
+
+from dataclasses import dataclass, fields
+
+
+class _Model:
+    """Mixin that builds a dataclass from an API result dict."""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_result(cls, result: dict):
+        """Build from a JSON-RPC `result`, ignoring unknown keys."""
+        return cls(**{f.name: result.get(f.name) for f in fields(cls)})
+
+    def as_dict(self) -> dict:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+
+@dataclass(slots=True)
+class DeviceInfo(_Model):
+    """Marstek.GetDevice result."""
+
+    device: str | None = None
+    ver: int | None = None
+    ble_mac: str | None = None
+    wifi_mac: str | None = None
+    wifi_name: str | None = None
+    ip: str | None = None
+
+
+@dataclass(slots=True)
+class ModeStatus(_Model):
+    """ES.GetMode result (the only method that answers on every firmware)."""
+
+    mode: str | None = None
+    bat_soc: int | None = None
+    ongrid_power: int | None = None
+    offgrid_power: int | None = None
+
+
+@dataclass(slots=True)
+class EnergyStatus(_Model):
+    """ES.GetStatus result (times out on several firmwares, see README)."""
+
+    bat_soc: int | None = None
+    bat_cap: int | None = None
+    pv_power: int | None = None
+    ongrid_power: int | None = None
+    offgrid_power: int | None = None
+    total_grid_output_energy: int | None = None
+    total_grid_input_energy: int | None = None
+
+
+@dataclass(slots=True)
+class BatteryStatus(_Model):
+    """Bat.GetStatus result."""
+
+    soc: int | None = None
+    bat_temp: float | None = None
+    bat_capacity: float | None = None
+    rated_capacity: float | None = None
+    charg_flag: bool | None = None
+    dischrg_flag: bool | None = None
+
+
+@dataclass(slots=True)
+class ManualSlot(_Model):
+    """One manual_cfg schedule slot (time_num 0-9)."""
+
+    time_num: int
+    start_time: str = "00:00"
+    end_time: str = "00:00"
+    week_set: int = 0
+    power: int = 0
+    enable: int = 0
+
+    @classmethod
+    def disabled(cls, time_num: int) -> "ManualSlot":
+        """An empty, disabled slot (used to clear leftovers)."""
+        return cls(time_num=time_num)
@@ -0,0 +1,150 @@
+"""
+Timeout and retry policies for Marstek requests.
+
+De batterijen antwoorden niet even snel (Fase B met V3 firmware is merkbaar
+trager), dus de timeout wordt per batterij afgeleid van gemeten round-trips.
+"""
+
+import random
+import time
+
+
+class RttEstimator:
+    """Per-battery retransmission timeout estimator (RFC 6298 style).
+
+    Keeps a smoothed RTT (SRTT) and RTT variance (RTTVAR) and derives the
+    timeout as SRTT + 4 * RTTVAR, clamped to [min_timeout, max_timeout].
+    Every attempt uses a fresh request id, so each reply maps to exactly one
+    send and every sample is unambiguous.
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, initial_timeout: float = 3.0, min_timeout: float = 0.3,
+                 max_timeout: float = 10.0):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.srtt = None
+        self.rttvar = None
+        self._rto = self._clamp(initial_timeout)
+
+    def _clamp(self, value: float) -> float:
+        return max(self.min_timeout, min(self.max_timeout, value))
+
+    @property
+    def timeout(self) -> float:
+        """Current timeout in seconds."""
+        return self._rto
+
+    def observe(self, rtt: float):
+        """Feed a measured round-trip time (seconds)."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self._rto = self._clamp(self.srtt + self.K * self.rttvar)
+
+    def on_timeout(self):
+        """Back off the timeout after a request went unanswered."""
+        self._rto = self._clamp(self._rto * 2)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter between retries."""
+
+    def __init__(self, retries: int = 1, base_delay: float = 0.2, max_delay: float = 2.0):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @property
+    def attempts(self) -> int:
+        return self.retries + 1
+
+    def delay(self, attempt: int) -> float:
+        """Pause before retry number `attempt` (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class TokenBucket:
+    """Token-bucket rate limiter for requests to one battery.
+
+    Bursts of requests are known to lock up the firmware, so requests that
+    exceed the rate are delayed rather than sent back-to-back.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: int = 3):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token and return how long to wait before sending (seconds)."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class CircuitOpenError(Exception):
+    """Raised when a request is refused because the battery's breaker is open."""
+
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit breaker for one battery.
+
+    After `failure_threshold` consecutive timeouts the breaker opens and
+    requests are refused for `reset_timeout` seconds. Then a single probe is
+    let through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Return True if a request may be sent now."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release(self):
+        """Neither success nor failure (e.g. a cancelled request): free the probe slot."""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
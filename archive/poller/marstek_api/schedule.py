@@ -0,0 +1,260 @@
+"""
+Manual schedule slots with a local model per battery.
+
+De API kan slots niet teruglezen, dus tot nu toe schreef elk script en elke
+automation zijn slot blind, één per aanroep, en bleven slots die ooit in de
+app zijn gezet gewoon actief (PROBLEEM 4 in de troubleshooting doc).
+
+ScheduleManager houdt per batterij een model van alle 10 slots bij: de
+laatst bevestigde inhoud, of None als die onbekend is. Een gewenst plan
+wordt vergeleken met dat model en alleen de slots die verschillen worden
+geschreven. Met clear_unused worden alle slots buiten het plan
+uitgeschakeld, zodat oude slots automatisch verdwijnen. Batterijen worden
+tegelijk bijgewerkt, de slots van één batterij na elkaar met een pauze.
+
+Met een SlotCache overleeft het model een herstart (zie slot_cache.py);
+reconcile() controleert het bij startup rustig op de achtergrond.
+
+Let op: elke slot write zet de batterij in Manual mode.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+
+from .client import MODE_MANUAL, WEEK_ALL_DAYS, MarstekApiError, MarstekClient
+from .models import ManualSlot
+from .policy import CircuitOpenError
+from .slot_cache import SlotCache
+
+SLOT_COUNT = 10
+
+# week_set bits, as used by the Marstek app and HA integration
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def week_set(days) -> int:
+    """Convert day names ("mon", "Tuesday", ...) to a week_set bitmask."""
+    mask = 0
+    for day in days:
+        mask |= 1 << WEEKDAYS.index(str(day).lower()[:3])
+    return mask
+
+
+def slot_from_dict(data: dict) -> ManualSlot:
+    """Build a slot from a plan entry.
+
+    Accepts the API keys (`week_set`, `enable`) as well as the names of the
+    HA set_manual_schedule service (`days`, `enabled`). Only time_num is
+    required; a bare {"time_num": n} is a disabled slot.
+    """
+    if "week_set" in data:
+        days = int(data["week_set"])
+    elif data.get("days"):
+        days = week_set(data["days"])
+    else:
+        days = WEEK_ALL_DAYS
+    enable = data.get("enable", data.get("enabled", False))
+    if isinstance(enable, str):
+        enable = enable.lower() in ("1", "true", "on")
+    return ManualSlot(
+        time_num=int(data["time_num"]),
+        start_time=data.get("start_time", "00:00"),
+        end_time=data.get("end_time", "00:00"),
+        week_set=days if enable else 0,
+        power=int(data.get("power", 0)) if enable else 0,
+        enable=1 if enable else 0
+    )
+
+
+def _same(current: ManualSlot | None, desired: ManualSlot) -> bool:
+    if current is None:
+        return False
+    if not current.enable and not desired.enable:
+        # A disabled slot does nothing, whatever its times
+        return True
+    return current == desired
+
+
+@dataclass(slots=True)
+class ScheduleResult:
+    """Outcome of applying a plan to one battery."""
+
+    ip: str
+    written: list = field(default_factory=list)
+    failed: list = field(default_factory=list)
+    skipped: int = 0
+    elapsed: float = 0.0
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed and self.error is None
+
+    def as_dict(self) -> dict:
+        return {
+            "ip": self.ip,
+            "ok": self.ok,
+            "written": self.written,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed_ms": round(self.elapsed * 1000),
+            "error": self.error
+        }
+
+
+class ScheduleManager:
+    """Local model of the 10 manual slots per battery, written by diff."""
+
+    def __init__(self, pace_seconds: float = 0.5, attempts: int = 2,
+                 cache: SlotCache | None = None):
+        self.pace = pace_seconds
+        self.attempts = max(1, attempts)
+        self.cache = cache
+        # ip -> list of SLOT_COUNT entries (ManualSlot, or None if unknown)
+        self.slots = {}
+        # ip -> MAC address the cached slots belong to
+        self.macs = {}
+        if cache is not None:
+            for ip, entry in cache.load().items():
+                model = (entry["slots"] + [None] * SLOT_COUNT)[:SLOT_COUNT]
+                self.slots[ip] = model
+                self.macs[ip] = entry["mac"]
+
+    def model(self, ip: str) -> list:
+        return self.slots.setdefault(ip, [None] * SLOT_COUNT)
+
+    def unknown(self, ip: str) -> list:
+        """Slot numbers whose content is not known."""
+        return [n for n, slot in enumerate(self.model(ip)) if slot is None]
+
+    def save(self):
+        if self.cache is not None:
+            self.cache.save(self.slots, self.macs)
+
+    def record(self, ip: str, slot: ManualSlot):
+        """Remember a slot the battery acknowledged (also from other writers)."""
+        self.model(ip)[slot.time_num] = slot
+        self.save()
+
+    def forget(self, ip: str):
+        """Mark all slots of a battery unknown (e.g. after a change in the app)."""
+        self.slots[ip] = [None] * SLOT_COUNT
+        self.save()
+
+    def diff(self, ip: str, plan: list, clear_unused: bool = False) -> list:
+        """Return the slots to write so the battery matches `plan`.
+
+        Cleanup writes (slots outside the plan) come first, so a stale slot
+        never runs alongside the new plan.
+        """
+        model = self.model(ip)
+        desired = {slot.time_num: slot for slot in plan}
+        writes = []
+        if clear_unused:
+            writes.extend(
+                ManualSlot.disabled(n) for n in range(SLOT_COUNT)
+                if n not in desired and not _same(model[n], ManualSlot.disabled(n))
+            )
+        writes.extend(slot for slot in desired.values() if not _same(model[slot.time_num], slot))
+        return writes
+
+    async def async_apply(self, client: MarstekClient, plan: list,
+                          clear_unused: bool = False) -> ScheduleResult:
+        """Write the changed slots of one battery, one after another."""
+        result = ScheduleResult(client.ip)
+        start = time.monotonic()
+        writes = self.diff(client.ip, plan, clear_unused)
+        planned = len({slot.time_num for slot in plan})
+        result.skipped = (SLOT_COUNT if clear_unused else planned) - len(writes)
+        model = self.model(client.ip)
+        for index, slot in enumerate(writes):
+            if index and self.pace:
+                await asyncio.sleep(self.pace)
+            try:
+                for _ in range(self.attempts):
+                    if await client.async_set_manual_slot(slot):
+                        model[slot.time_num] = slot
+                        result.written.append(slot.time_num)
+                        break
+                else:
+                    # Unknown now: the next plan writes it again
+                    model[slot.time_num] = None
+                    result.failed.append(slot.time_num)
+            except (MarstekApiError, CircuitOpenError) as e:
+                model[slot.time_num] = None
+                result.failed.extend(s.time_num for s in writes[index:])
+                result.error = str(e)
+                break
+        if writes:
+            self.save()
+        result.elapsed = time.monotonic() - start
+        return result
+
+    async def async_apply_all(self, plans: dict, clear_unused: bool = False) -> list:
+        """Apply {client: [slots]} to all batteries concurrently."""
+        return list(await asyncio.gather(*(
+            self.async_apply(client, plan, clear_unused) for client, plan in plans.items()
+        )))
+
+    async def async_reconcile(self, clients: list, pace_seconds: float = 2.0,
+                              clear_unknown: bool = False) -> dict:
+        """Check the (cached) model against the batteries, one at a time.
+
+        Drops batteries that are no longer configured and forgets the slots
+        of an IP that now answers with a different MAC address. With
+        clear_unknown, unknown slots of a battery that is in Manual mode are
+        disabled (those could be running an old schedule); batteries in
+        Auto are never written. Returns a status per IP.
+        """
+        configured = {client.ip for client in clients}
+        for ip in set(self.slots) - configured:
+            del self.slots[ip]
+            self.macs.pop(ip, None)
+
+        status = {}
+        for index, client in enumerate(clients):
+            if index and pace_seconds:
+                await asyncio.sleep(pace_seconds)
+            ip = client.ip
+            try:
+                device = await client.async_get_device()
+                if device is None:
+                    status[ip] = "unreachable"
+                    continue
+                mac = device.wifi_mac or device.ble_mac
+                if self.macs.get(ip) and mac and self.macs[ip] != mac:
+                    self.slots[ip] = [None] * SLOT_COUNT
+                    status[ip] = "replaced"
+                else:
+                    status[ip] = "ok" if ip in self.slots else "new"
+                self.macs[ip] = mac
+
+                unknown = self.unknown(ip)
+                if clear_unknown and unknown:
+                    mode = await client.async_get_mode()
+                    if mode is not None and mode.mode == MODE_MANUAL:
+                        known = [slot for slot in self.model(ip) if slot is not None and slot.enable]
+                        result = await self.async_apply(client, known, clear_unused=True)
+                        status[ip] = f"cleared {result.written}"
+            except (MarstekApiError, CircuitOpenError) as e:
+                status[ip] = str(e)
+        self.save()
+        return status
+
+    def reconcile(self, clients: list, pace_seconds: float = 2.0, clear_unknown: bool = False) -> dict:
+        """Blocking variant of async_reconcile()."""
+        if not clients:
+            return {}
+        return clients[0].endpoint.run_sync(self.async_reconcile(clients, pace_seconds, clear_unknown))
+
+    def apply(self, client: MarstekClient, plan: list, clear_unused: bool = False) -> ScheduleResult:
+        """Blocking variant of async_apply()."""
+        return client.endpoint.run_sync(self.async_apply(client, plan, clear_unused))
+
+    def apply_all(self, plans: dict, clear_unused: bool = False) -> list:
+        """Blocking variant of async_apply_all()."""
+        if not plans:
+            return []
+        endpoint = next(iter(plans)).endpoint
+        return endpoint.run_sync(self.async_apply_all(plans, clear_unused))
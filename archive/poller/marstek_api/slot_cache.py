@@ -0,0 +1,95 @@
+"""
+On-disk cache of the manual schedule slot model.
+
+Zonder cache begint elke (her)start van de poller met 10 onbekende slots
+per batterij, en schrijft het eerste plan dus alles opnieuw. De cache
+bewaart per batterij de laatst bevestigde slots, samen met het MAC adres
+van de batterij. Zo herkent de reconciliation bij startup een batterij die
+een ander IP heeft gekregen (of vervangen is) en vergeet alleen die slots.
+
+Het bestand wordt atomair vervangen (tijdelijk bestand + rename), zodat een
+crash of stroomuitval tijdens het schrijven nooit een half bestand achterlaat.
+"""
+
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from .models import ManualSlot
+
+_LOGGER = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+
+class SlotCache:
+    """JSON file with the last confirmed slots per battery IP."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+
+    def load(self) -> dict:
+        """Return {ip: {"mac": str|None, "slots": [ManualSlot|None, ...]}}.
+
+        A missing, unreadable or outdated file counts as empty: every slot
+        is then simply unknown.
+        """
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            _LOGGER.warning(f"Ignoring slot cache {self.path}: {e}")
+            return {}
+        if not isinstance(data, dict):
+            _LOGGER.warning(f"Ignoring slot cache {self.path}: not a JSON object")
+            return {}
+        if data.get("version") != CACHE_VERSION:
+            return {}
+
+        batteries = {}
+        try:
+            for ip, entry in data.get("batteries", {}).items():
+                batteries[ip] = {
+                    "mac": entry.get("mac"),
+                    "slots": [
+                        ManualSlot(**slot) if slot is not None else None
+                        for slot in entry.get("slots", [])
+                    ]
+                }
+        except (AttributeError, TypeError) as e:
+            _LOGGER.warning(f"Ignoring slot cache {self.path}: {e}")
+            return {}
+        return batteries
+
+    def save(self, slots: dict, macs: dict):
+        """Atomically write the slot model ({ip: [ManualSlot|None]})."""
+        data = {
+            "version": CACHE_VERSION,
+            "updated": datetime.now().isoformat(timespec="seconds"),
+            "batteries": {
+                ip: {
+                    "mac": macs.get(ip),
+                    "slots": [slot.as_dict() if slot is not None else None for slot in model]
+                }
+                for ip, model in slots.items()
+            }
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=f".{self.path.name}.", dir=self.path.parent)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=1)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            _LOGGER.warning(f"Could not write slot cache {self.path}: {e}")
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Marstek Transport Benchmark
+
+Vervangt de losse debug_*.py / verify_hypothesis.py experimenten. Draait
+verschillende transport strategieën (plugins) tegen echte batterijen of de
+simulator en rapporteert p50/p95/p99 latency, success ratio en throughput als
+JSON, zodat transport wijzigingen met cijfers vergeleken kunnen worden.
+
+Gebruik:
+    python marstek_bench.py --targets 192.168.6.80 192.168.6.213 192.168.6.144
+    python marstek_bench.py --simulator 50 --rounds 20 --strategies drained asyncio
+    python marstek_bench.py --plugin my_strategies --strategies my_transport
+    python marstek_bench.py --targets 192.168.6.80 --ring /opt/marstek-poller/telemetry.ring
+
+Author: Marstek Battery Rotation Project
+License: MIT
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import select
+import socket
+import sys
+import time
+from datetime import datetime
+
+from marstek_api import MarstekEndpoint
+from marstek_telemetry import MODE_NAMES, TelemetryRing
+
+DEFAULT_METHOD = "Marstek.GetDevice"
+DEFAULT_PARAMS = {"ble_mac": "0"}
+
+# Strategy registry; plugins register with @register_strategy
+STRATEGIES = {}
+
+
+def register_strategy(cls):
+    """Class decorator that makes a transport strategy selectable by name."""
+    STRATEGIES[cls.name] = cls
+    return cls
+
+
+class Strategy:
+    """Base class for transport strategies.
+
+    Blocking strategies implement query(); strategies with `concurrent = True`
+    implement query_async() and get all targets of a round in flight at once.
+    Both return True when a matching `result` was received in time.
+    """
+
+    name = None
+    concurrent = False
+
+    def __init__(self, port: int, timeout: float, guards: bool = False):
+        self.port = port
+        self.timeout = timeout
+        self.guards = guards
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def query(self, ip: str, request: dict) -> bool:
+        raise NotImplementedError
+
+    async def query_async(self, ip: str, request: dict) -> bool:
+        raise NotImplementedError
+
+
+def _bound_socket(port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind(("0.0.0.0", port))
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def _wait_for_reply(sock: socket.socket, ip: str, request: dict, timeout: float) -> bool:
+    """Read from a non-blocking socket until the matching reply or timeout."""
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        ready, _, _ = select.select([sock], [], [], remaining)
+        if not ready:
+            return False
+        try:
+            data, addr = sock.recvfrom(65535)
+            response = json.loads(data.decode("utf-8"))
+        except (OSError, UnicodeDecodeError, json.JSONDecodeError):
+            continue
+        if addr[0] == ip and isinstance(response, dict) and response.get("id") == request["id"] \
+                and "method" not in response:
+            return "result" in response
+
+
+@register_strategy
+class FreshSocketStrategy(Strategy):
+    """New socket bound per request, closed after the reply.
+
+    Covers the old debug_fresh_socket.py / debug_socket_recycle.py tests.
+    """
+
+    name = "fresh"
+
+    def query(self, ip: str, request: dict) -> bool:
+        try:
+            sock = _bound_socket(self.port)
+        except OSError:
+            return False
+        try:
+            sock.setblocking(False)
+            sock.sendto(json.dumps(request).encode("utf-8"), (ip, self.port))
+            return _wait_for_reply(sock, ip, request, self.timeout)
+        finally:
+            sock.close()
+
+
+@register_strategy
+class PersistentSocketStrategy(Strategy):
+    """One socket for the whole run, no draining (old debug_persistent_socket.py)."""
+
+    name = "persistent"
+    drain = False
+
+    def open(self):
+        self.sock = _bound_socket(self.port)
+        self.sock.setblocking(False)
+
+    def close(self):
+        self.sock.close()
+
+    def _drain(self):
+        while select.select([self.sock], [], [], 0)[0]:
+            try:
+                self.sock.recvfrom(65535)
+            except OSError:
+                break
+
+    def query(self, ip: str, request: dict) -> bool:
+        if self.drain:
+            self._drain()
+        self.sock.sendto(json.dumps(request).encode("utf-8"), (ip, self.port))
+        return _wait_for_reply(self.sock, ip, request, self.timeout)
+
+
+@register_strategy
+class DrainedSocketStrategy(PersistentSocketStrategy):
+    """Persistent socket, buffer drained before every request (old debug_buffer_drain.py)."""
+
+    name = "drained"
+    drain = True
+
+
+@register_strategy
+class AsyncioStrategy(Strategy):
+    """marstek_api endpoint: one socket, request-id demultiplexing, concurrent."""
+
+    name = "asyncio"
+    concurrent = True
+
+    def open(self):
+        self.endpoint = MarstekEndpoint(self.port)
+        if not self.guards:
+            self.endpoint.configure_guards(
+                rate_limit_per_second=1e9,
+                rate_limit_burst=1e9,
+                switch_rate_limit_per_second=1e9,
+                switch_rate_limit_burst=1e9,
+                breaker_failure_threshold=1e9
+            )
+        self.endpoint.start()
+
+    def close(self):
+        self.endpoint.close()
+
+    async def query_async(self, ip: str, request: dict) -> bool:
+        response = await self.endpoint.request(
+            ip, request["method"], request["params"], timeout=self.timeout
+        )
+        return response is not None and "result" in response
+
+
+def percentile(sorted_values: list, pct: float) -> float | None:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(samples: list, duration: float) -> dict:
+    """Turn (ok, latency_ms) samples into a stats dict."""
+    latencies = sorted(round(latency, 2) for ok, latency in samples if ok)
+    total = len(samples)
+    return {
+        "requests": total,
+        "success": len(latencies),
+        "success_ratio": round(len(latencies) / total, 4) if total else None,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "throughput_rps": round(len(latencies) / duration, 2) if duration > 0 else None
+    }
+
+
+def run_strategy(strategy: Strategy, targets: list, args: argparse.Namespace) -> dict:
+    """Run all rounds for one strategy and return its report."""
+    samples = {ip: [] for ip in targets}
+    request_id = 0
+
+    def next_request():
+        nonlocal request_id
+        request_id += 1
+        return {"id": request_id, "method": args.method, "params": args.params}
+
+    async def timed_async(ip):
+        start = time.perf_counter()
+        ok = await strategy.query_async(ip, next_request())
+        samples[ip].append((ok, (time.perf_counter() - start) * 1000))
+
+    async def round_async():
+        await asyncio.gather(*(timed_async(ip) for ip in targets))
+
+    strategy.open()
+    started = time.perf_counter()
+    try:
+        for _ in range(args.rounds):
+            if strategy.concurrent:
+                asyncio.run(round_async())
+            else:
+                for ip in targets:
+                    start = time.perf_counter()
+                    ok = strategy.query(ip, next_request())
+                    samples[ip].append((ok, (time.perf_counter() - start) * 1000))
+                    if args.pause:
+                        time.sleep(args.pause)
+            if args.round_pause:
+                time.sleep(args.round_pause)
+    finally:
+        duration = time.perf_counter() - started
+        strategy.close()
+
+    # Pauses are part of the run but not of the transport cost
+    pause_time = args.rounds * args.round_pause
+    if not strategy.concurrent:
+        pause_time += args.rounds * len(targets) * args.pause
+    active = max(duration - pause_time, 1e-9)
+
+    all_samples = [sample for per_ip in samples.values() for sample in per_ip]
+    return {
+        "overall": summarize(all_samples, active),
+        "per_target": {ip: summarize(per_ip, active) for ip, per_ip in samples.items()},
+        "duration_s": round(duration, 3)
+    }
+
+
+def summarize_ring(ring: TelemetryRing, records: list) -> dict:
+    """Per battery: the poller samples that came in during the benchmark."""
+    names = ring.names
+    batteries = {}
+    for ts, battery, mode, soc, ongrid, _offgrid in records:
+        name = names[battery] if battery < len(names) else str(battery)
+        entry = batteries.setdefault(name, {"samples": 0, "first": ts, "last": ts,
+                                            "soc_min": soc, "soc_max": soc, "ongrid_sum": 0, "mode": None})
+        entry["samples"] += 1
+        entry["last"] = ts
+        entry["soc_min"] = min(entry["soc_min"], soc)
+        entry["soc_max"] = max(entry["soc_max"], soc)
+        entry["ongrid_sum"] += ongrid
+        entry["mode"] = MODE_NAMES.get(mode, "Unknown")
+    return {
+        name: {
+            "samples": e["samples"],
+            "interval_s": round((e["last"] - e["first"]) / (e["samples"] - 1), 3) if e["samples"] > 1 else None,
+            "soc_min": round(e["soc_min"], 1),
+            "soc_max": round(e["soc_max"], 1),
+            "ongrid_power_mean": round(e["ongrid_sum"] / e["samples"]),
+            "mode": e["mode"]
+        }
+        for name, e in batteries.items()
+    }
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Marstek transport benchmark")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--targets", nargs="+", help="Battery IPs")
+    target.add_argument("--simulator", type=int, metavar="N",
+                        help="Use N simulator batteries (see marstek_simulator.py)")
+    parser.add_argument("--simulator-base-ip", default="127.0.1.1")
+    parser.add_argument("--port", type=int, default=30000)
+    parser.add_argument("--strategies", nargs="+", help="Strategies to run (default: all)")
+    parser.add_argument("--plugin", action="append", default=[],
+                        help="Import a module that registers extra strategies")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=3.0)
+    parser.add_argument("--pause", type=float, default=0.0, help="Pause between requests (blocking strategies)")
+    parser.add_argument("--round-pause", type=float, default=0.2, help="Pause between rounds")
+    parser.add_argument("--method", default=DEFAULT_METHOD)
+    parser.add_argument("--params", type=json.loads, default=DEFAULT_PARAMS, help="JSON params")
+    parser.add_argument("--guards", action="store_true",
+                        help="Keep the production rate limiter / circuit breaker (asyncio)")
+    parser.add_argument("--output", "-o", help="Write JSON report to file instead of stdout")
+    parser.add_argument("--ring", help="Poller telemetry.ring: add the samples recorded during the run")
+    args = parser.parse_args()
+
+    for module in args.plugin:
+        importlib.import_module(module)
+
+    names = args.strategies or list(STRATEGIES)
+    unknown = [name for name in names if name not in STRATEGIES]
+    if unknown:
+        print(f"ERROR: unknown strategies {unknown}, available: {list(STRATEGIES)}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.simulator:
+        from marstek_simulator import battery_ips
+        targets = battery_ips(args.simulator_base_ip, args.simulator)
+    else:
+        targets = args.targets
+
+    report = {
+        "started": datetime.now().isoformat(),
+        "config": {
+            "targets": targets,
+            "rounds": args.rounds,
+            "timeout_s": args.timeout,
+            "pause_s": args.pause,
+            "round_pause_s": args.round_pause,
+            "method": args.method,
+            "guards": args.guards
+        },
+        "results": {}
+    }
+
+    ring = TelemetryRing(args.ring) if args.ring else None
+    position = ring.written if ring else 0
+
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        strategy = STRATEGIES[name](args.port, args.timeout, args.guards)
+        report["results"][name] = run_strategy(strategy, targets, args)
+
+    if ring:
+        records, _ = ring.read(position)
+        report["telemetry"] = summarize_ring(ring, records)
+        ring.close()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,8 +12,11 @@ Author: Marstek Battery Rotation Project
 License: MIT
 """
 
-import socket
+import asyncio
+import hashlib
 import json
+import queue
+import threading
 import time
 import signal
 import sys
@@ -22,6 +25,30 @@ import argparse
 from pathlib import Path
 from datetime import datetime
 
+from marstek_api import (
+    DURATION_BUCKETS,
+    MODE_AUTO,
+    MODE_MANUAL,
+    SLOT_COUNT,
+    CircuitOpenError,
+    Histogram,
+    MarstekApiError,
+    MarstekClient,
+    MetricFamily,
+    MetricsRegistry,
+    MetricsServer,
+    ModeStatus,
+    RetryPolicy,
+    RttEstimator,
+    ScheduleManager,
+    SlotCache,
+    SwitchExecutor,
+    get_endpoint,
+    slot_from_dict,
+)
+from marstek_rotation import battery_key
+from marstek_telemetry import TelemetryRing, TelemetryStore, mode_code
+
 # Optional imports
 try:
     import paho.mqtt.client as mqtt
@@ -70,10 +97,55 @@ DEFAULT_CONFIG = {
     },
     "polling": {
         "interval_seconds": 30,
-        "timeout_seconds": 3
+        "timeout_seconds": 3,
+        "min_timeout_seconds": 0.3,
+        "retries": 1,
+        "retry_backoff_seconds": 0.2,
+        "transport": "asyncio"
+    },
+    "publishing": {
+        "state_format": "json",
+        "deadband": {
+            "soc": 1,
+            "ongrid_power": 25,
+            "offgrid_power": 25
+        },
+        "heartbeat_cycles": 10,
+        "discovery_settle_seconds": 2,
+        "discovery_batch_size": 10,
+        "discovery_batch_interval_seconds": 0.5
     },
     "api": {
-        "port": 30000
+        "port": 30000,
+        "rate_limit_per_second": 1.0,
+        "rate_limit_burst": 3,
+        "switch_rate_limit_per_second": 4.0,
+        "switch_rate_limit_burst": 4,
+        "breaker_failure_threshold": 3,
+        "breaker_reset_seconds": 60
+    },
+    "switching": {
+        "verify_timeout_seconds": 5,
+        "verify_interval_seconds": 0.25,
+        "attempts": 2
+    },
+    "schedule": {
+        "pace_seconds": 0.5,
+        "attempts": 2,
+        "cache_file": "slot_cache.json",
+        "reconcile_pace_seconds": 2,
+        "reconcile_clear_unknown": False
+    },
+    "telemetry": {
+        "path": "telemetry",
+        "flush_seconds": 60,
+        "retention_days": {"raw": 7, "1m": 31, "15m": 400, "1h": 0},
+        "ring_file": "telemetry.ring",
+        "ring_capacity": 65536
+    },
+    "metrics": {
+        "port": 9108,
+        "host": "127.0.0.1"
     },
     "logging": {
         "level": "INFO"
@@ -86,10 +158,6 @@ class MarstekPoller:
 
     def __init__(self, config: dict):
         self.config = config
-        self.running = False
-        self.mqtt_client = None
-        self.mqtt_connected = False
-        self.request_id = 1
 
         # Setup logging
         log_level = config.get("logging", {}).get("level", "INFO")
@@ -100,6 +168,128 @@ class MarstekPoller:
         )
         self.logger = logging.getLogger("marstek_poller")
 
+        self.running = False
+        self.mqtt_client = None
+        self.mqtt_connected = False
+        # Publishes handed to paho and not yet sent (see _publish)
+        self._mqtt_in_flight = 0
+        self._mqtt_lock = threading.Lock()
+
+        # Last published state / availability per device_id, for change-only
+        # publishing, and cycles since each device's last state publish
+        self.last_published = {}
+        self.last_availability = {}
+        self.cycles_since_publish = {}
+
+        # Discovery payloads are built once; retained copies on the broker
+        # are read back after (re)connect and only differing ones republished
+        self.discovery_payloads = {}
+        self.discovery_hashes = {}
+        self.retained_discovery_hashes = {}
+        self._discovery_lock = threading.Lock()
+        self._discovery_generation = 0
+
+        api_config = config.get("api", {})
+        self.endpoint = get_endpoint(api_config.get("port", 30000))
+        self.endpoint.configure_guards(**api_config)
+
+        # Per-battery clients (keyed by IP, each with its own RTT estimator)
+        # and a shared retry policy
+        polling_config = config.get("polling", {})
+        self.clients = {}
+        self.retry_policy = RetryPolicy(
+            retries=polling_config.get("retries", 1),
+            base_delay=polling_config.get("retry_backoff_seconds", 0.2),
+            max_delay=polling_config.get("timeout_seconds", 3)
+        )
+
+        # Mode switches and schedule writes requested over MQTT, executed one
+        # at a time in arrival order by a worker thread. Mode commands are
+        # read back with ES.GetMode; the outcome drives the mismatch sensor
+        schedule_config = config.get("schedule", {})
+        cache_file = schedule_config.get("cache_file", "slot_cache.json")
+        if cache_file and not Path(cache_file).is_absolute():
+            cache_file = Path(__file__).resolve().parent / cache_file
+        self.schedule = ScheduleManager(
+            pace_seconds=schedule_config.get("pace_seconds", 0.5),
+            attempts=schedule_config.get("attempts", 2),
+            cache=SlotCache(cache_file) if cache_file else None
+        )
+        switching_config = config.get("switching", {})
+        self.executor = SwitchExecutor(
+            verify_timeout=switching_config.get("verify_timeout_seconds", 5),
+            verify_interval=switching_config.get("verify_interval_seconds", 0.25),
+            attempts=switching_config.get("attempts", 2)
+        )
+        self._commands = queue.Queue()
+        # Switch end-to-end time, from MQTT command to confirmed result
+        self.switch_duration = {command: Histogram(DURATION_BUCKETS) for command in ("activate", "mode")}
+        # Polls and commands both publish battery state
+        self._state_lock = threading.Lock()
+        # device_id that should be in Auto after the last activate command
+        self.expected_active = None
+        self.switch_state = None
+
+        # Telemetry store and ring buffer, opened by open_telemetry() in
+        # service mode only (a --test run must not become a second writer)
+        self.telemetry = None
+        self.ring = None
+        self.ring_index = {}
+
+        # Prometheus / OpenMetrics endpoint (started in run())
+        self.poll_duration = Histogram(DURATION_BUCKETS)
+        self.metrics = MetricsRegistry()
+        self.metrics.register(self.endpoint.collect_metrics)
+        self.metrics.register(self._collect_metrics)
+        self.metrics_server = None
+
+        self._build_discovery()
+
+        # Started last: the worker uses the logger, locks and state above
+        threading.Thread(target=self._command_worker, name="commands", daemon=True).start()
+
+    def open_telemetry(self):
+        """Open the telemetry store and ring buffer (service mode only).
+
+        Every sample goes to the on-disk store (with 1m/15m/1h rollups)
+        unless telemetry.path is empty, and to a crash-safe ring of the
+        most recent samples for readers that attach to the file directly
+        (marstek_bench.py --ring) unless telemetry.ring_file is empty.
+        """
+        telemetry_config = self.config.get("telemetry", {})
+        telemetry_path = telemetry_config.get("path", "telemetry")
+        if telemetry_path and not Path(telemetry_path).is_absolute():
+            telemetry_path = Path(__file__).resolve().parent / telemetry_path
+        telemetry = TelemetryStore(
+            telemetry_path,
+            flush_seconds=telemetry_config.get("flush_seconds", 60),
+            retention_days=telemetry_config.get("retention_days")
+        ) if telemetry_path else None
+
+        ring_file = telemetry_config.get("ring_file", "telemetry.ring")
+        if ring_file and not Path(ring_file).is_absolute():
+            ring_file = Path(__file__).resolve().parent / ring_file
+        device_ids = [
+            b.get("device_id", b.get("name", "Unknown").lower().replace(" ", "_"))
+            for b in self.config.get("batteries", [])
+        ]
+        ring = None
+        if ring_file:
+            try:
+                ring = TelemetryRing(
+                    ring_file,
+                    capacity=telemetry_config.get("ring_capacity", 65536),
+                    names=device_ids,
+                    writable=True
+                )
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Telemetry ring disabled: {e}")
+
+        with self._state_lock:
+            self.telemetry = telemetry
+            self.ring_index = {device_id: index for index, device_id in enumerate(device_ids)}
+            self.ring = ring
+
     def setup_mqtt(self) -> bool:
         """Initialize MQTT connection."""
         if not MQTT_AVAILABLE:
@@ -121,6 +311,8 @@ class MarstekPoller:
         # Set callbacks
         self.mqtt_client.on_connect = self._on_mqtt_connect
         self.mqtt_client.on_disconnect = self._on_mqtt_disconnect
+        self.mqtt_client.on_message = self._on_mqtt_message
+        self.mqtt_client.on_publish = self._on_mqtt_publish
 
         # Set credentials if provided
         username = mqtt_config.get("username", "")
@@ -150,6 +342,21 @@ class MarstekPoller:
             self.logger.error(f"MQTT connection failed: {e}")
             return False
 
+    def _publish(self, topic: str, payload, retain: bool = False):
+        """Publish through paho and count it as in flight until on_publish."""
+        with self._mqtt_lock:
+            self._mqtt_in_flight += 1
+        info = self.mqtt_client.publish(topic, payload, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            with self._mqtt_lock:
+                self._mqtt_in_flight -= 1
+        return info
+
+    def _on_mqtt_publish(self, client, userdata, mid, *args):
+        """MQTT publish callback: the message left the client (QoS 0) or was acknowledged."""
+        with self._mqtt_lock:
+            self._mqtt_in_flight = max(self._mqtt_in_flight - 1, 0)
+
     def _on_mqtt_connect(self, client, userdata, flags, reason_code, properties=None):
         """MQTT connect callback (VERSION2 compatible)."""
         # reason_code is 0 or ReasonCode object with value 0 on success
@@ -157,8 +364,17 @@ class MarstekPoller:
         if rc_value == 0:
             self.mqtt_connected = True
             self.logger.info("Connected to MQTT broker")
-            # Publish discovery configs
+            # QoS 0 messages queued before the disconnect are gone
+            with self._mqtt_lock:
+                self._mqtt_in_flight = 0
+            # Broker may have lost non-retained state: republish everything
+            self.last_published.clear()
+            self.last_availability.clear()
+            # Compare discovery configs with the broker's retained copies
             self._publish_discovery()
+            client.subscribe([
+                (f"{self._command_prefix()}/{command}", 0) for command in ("activate", "mode", "schedule")
+            ])
         else:
             self.logger.error(f"MQTT connection failed with code {rc_value}")
 
@@ -169,8 +385,21 @@ class MarstekPoller:
         rc = reason_code if reason_code is not None else flags_or_rc
         self.logger.warning(f"Disconnected from MQTT broker (rc={rc})")
 
-    def _publish_discovery(self):
-        """Publish Home Assistant MQTT auto-discovery configs."""
+    def _per_field_topics(self) -> bool:
+        return self.config.get("publishing", {}).get("state_format", "json") == "fields"
+
+    def _discovery_state(self, state_prefix: str, device_id: str, field: str) -> dict:
+        """State topic (and template, in JSON mode) for one discovered sensor."""
+        if self._per_field_topics():
+            # Raw scalar per topic: HA needs no template rendering
+            return {"state_topic": f"{state_prefix}/{device_id}/{field}"}
+        return {
+            "state_topic": f"{state_prefix}/{device_id}/state",
+            "value_template": f"{{{{ value_json.{field} }}}}"
+        }
+
+    def _build_discovery(self):
+        """Build Home Assistant MQTT auto-discovery payloads and their hashes."""
         discovery_prefix = self.config.get("mqtt", {}).get("discovery_prefix", "homeassistant")
         state_prefix = self.config.get("mqtt", {}).get("state_topic_prefix", "marstek")
 
@@ -182,8 +411,7 @@ class MarstekPoller:
             # SOC sensor discovery
             soc_config = {
                 "name": f"{name} SOC",
-                "state_topic": f"{state_prefix}/{device_id}/state",
-                "value_template": "{{ value_json.soc }}",
+                **self._discovery_state(state_prefix, device_id, "soc"),
                 "unit_of_measurement": "%",
                 "device_class": "battery",
                 "state_class": "measurement",
@@ -206,8 +434,7 @@ class MarstekPoller:
             mode_entity_id = entity_id.replace("state_of_charge", "mode").replace("_soc", "_mode")
             mode_config = {
                 "name": f"{name} Mode",
-                "state_topic": f"{state_prefix}/{device_id}/state",
-                "value_template": "{{ value_json.mode }}",
+                **self._discovery_state(state_prefix, device_id, "mode"),
                 "unique_id": mode_entity_id,
                 "object_id": mode_entity_id,
                 "icon": "mdi:battery-sync",
@@ -223,8 +450,7 @@ class MarstekPoller:
             power_entity_id = entity_id.replace("state_of_charge", "power").replace("_soc", "_power")
             power_config = {
                 "name": f"{name} Power",
-                "state_topic": f"{state_prefix}/{device_id}/state",
-                "value_template": "{{ value_json.ongrid_power }}",
+                **self._discovery_state(state_prefix, device_id, "ongrid_power"),
                 "unit_of_measurement": "W",
                 "device_class": "power",
                 "state_class": "measurement",
@@ -238,140 +464,465 @@ class MarstekPoller:
                 }
             }
 
-            # Publish discovery configs
-            self.mqtt_client.publish(
-                f"{discovery_prefix}/sensor/{device_id}_soc/config",
-                json.dumps(soc_config),
-                retain=True
-            )
-            self.mqtt_client.publish(
-                f"{discovery_prefix}/sensor/{device_id}_mode/config",
-                json.dumps(mode_config),
-                retain=True
-            )
-            self.mqtt_client.publish(
-                f"{discovery_prefix}/sensor/{device_id}_power/config",
-                json.dumps(power_config),
-                retain=True
-            )
+            for suffix, payload in (("soc", soc_config), ("mode", mode_config), ("power", power_config)):
+                self._add_discovery(f"{discovery_prefix}/sensor/{device_id}_{suffix}/config", payload)
+
+        # Replaces the "Marstek Active Battery Mismatch" template sensor:
+        # set from the read-back of each switch instead of re-scanning modes
+        switch_topic = f"{self._command_prefix()}/switch"
+        mismatch_config = {
+            "name": "Marstek Active Battery Mismatch",
+            "state_topic": switch_topic,
+            "value_template": "{{ 'ON' if value_json.mismatch else 'OFF' }}",
+            "json_attributes_topic": switch_topic,
+            "device_class": "problem",
+            "unique_id": "marstek_active_battery_mismatch",
+            "object_id": "marstek_active_battery_mismatch"
+        }
+        self._add_discovery(f"{discovery_prefix}/binary_sensor/marstek_active_battery_mismatch/config", mismatch_config)
 
-            self.logger.info(f"Published discovery config for {name}")
+    def _add_discovery(self, topic: str, payload: dict):
+        encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+        self.discovery_payloads[topic] = encoded
+        self.discovery_hashes[topic] = hashlib.sha256(encoded.encode("utf-8")).hexdigest()
 
-    def query_battery(self, ip: str, sock: socket.socket = None) -> dict | None:
-        """Query a single battery using ES.GetMode."""
-        api_port = self.config.get("api", {}).get("port", 30000)
-        timeout = self.config.get("polling", {}).get("timeout_seconds", 3)
-
-        # Create request
-        request = {
-            "id": self.request_id,
-            "method": "ES.GetMode",
-            "params": {"id": 0}
+    def _publish_discovery(self):
+        """Republish discovery configs whose retained copy differs.
+
+        Subscribing to our own config topics makes the broker send its
+        retained copies; after a short settle time only missing or changed
+        payloads are published, in paced batches.
+        """
+        if not self.discovery_payloads:
+            return
+
+        settle = self.config.get("publishing", {}).get("discovery_settle_seconds", 2)
+        with self._discovery_lock:
+            self.retained_discovery_hashes = {}
+            # A newer reconnect supersedes any sync still waiting to run
+            self._discovery_generation += 1
+            generation = self._discovery_generation
+        self.mqtt_client.subscribe([(topic, 0) for topic in self.discovery_payloads])
+        timer = threading.Timer(settle, self._sync_discovery, args=(generation,))
+        timer.daemon = True
+        timer.start()
+
+    def _on_mqtt_message(self, client, userdata, message):
+        """Handle commands and retained discovery configs read back from the broker."""
+        command_prefix = self._command_prefix() + "/"
+        if message.topic.startswith(command_prefix):
+            # A retained command would replay on every reconnect
+            if not message.retain:
+                command = message.topic[len(command_prefix):]
+                payload = message.payload.decode("utf-8", "replace").strip()
+                self._commands.put((command, payload, time.monotonic()))
+            return
+
+        if message.topic in self.discovery_payloads:
+            with self._discovery_lock:
+                self.retained_discovery_hashes[message.topic] = hashlib.sha256(message.payload).hexdigest()
+
+    def _sync_discovery(self, generation: int):
+        """Publish discovery configs that are missing or outdated on the broker."""
+        publishing_config = self.config.get("publishing", {})
+        batch_size = max(1, publishing_config.get("discovery_batch_size", 10))
+        batch_interval = publishing_config.get("discovery_batch_interval_seconds", 0.5)
+
+        with self._discovery_lock:
+            if generation != self._discovery_generation:
+                return
+            retained = dict(self.retained_discovery_hashes)
+        self.mqtt_client.unsubscribe(list(self.discovery_payloads))
+
+        outdated = [
+            topic for topic, digest in self.discovery_hashes.items()
+            if retained.get(topic) != digest
+        ]
+        if not outdated:
+            self.logger.info("Discovery configs up to date on broker")
+            return
+
+        for i in range(0, len(outdated), batch_size):
+            if i:
+                time.sleep(batch_interval)
+            for topic in outdated[i:i + batch_size]:
+                self._publish(topic, self.discovery_payloads[topic], retain=True)
+
+        self.logger.info(f"Published {len(outdated)}/{len(self.discovery_payloads)} discovery configs")
+
+    def _command_worker(self):
+        while True:
+            command, payload, received = self._commands.get()
+            try:
+                self._run_command(command, payload, received)
+            except Exception as e:
+                self.logger.error(f"Command {command} failed: {e}")
+
+    def _command_prefix(self) -> str:
+        state_prefix = self.config.get("mqtt", {}).get("state_topic_prefix", "marstek")
+        return f"{state_prefix}/command"
+
+    def _run_command(self, command: str, payload: str, received: float | None = None):
+        """Execute a command and publish its result.
+
+        activate <key|device_id>: that battery to Auto, then all others to
+        Manual concurrently. mode auto|manual: all batteries at once.
+        schedule <json>: see _run_schedule().
+        """
+        if command == "schedule":
+            self._run_schedule(payload)
+            return
+        if command == "reconcile":
+            self._reconcile_slots()
+            return
+
+        batteries = self._configured_batteries()
+        if command == "activate":
+            target = self._find_battery(batteries, payload)
+            if target is None:
+                self.logger.warning(f"Activate: unknown battery '{payload}'")
+                return
+            others = [self._client(b["ip"]) for b in batteries if b is not target]
+            result = self.executor.activate(self._client(target["ip"]), others)
+            self.expected_active = target.get("device_id", target["name"].lower().replace(" ", "_"))
+        elif command == "mode" and payload.lower() in ("auto", "manual"):
+            mode = MODE_AUTO if payload.lower() == "auto" else MODE_MANUAL
+            result = self.executor.set_all([self._client(b["ip"]) for b in batteries], mode)
+            self.expected_active = None
+        else:
+            self.logger.warning(f"Unknown command {command} '{payload}'")
+            return
+
+        if received is not None:
+            self.switch_duration[command].observe(time.monotonic() - received)
+        summary = ", ".join(
+            f"{c.ip} {c.mode} {'OK' if c.converged else c.error} ({c.attempts}x)" for c in result.commands
+        )
+        self.logger.info(f"Command {command} {payload}: {summary} ({result.elapsed * 1000:.0f}ms)")
+        if not self.mqtt_connected:
+            return
+        self._publish(
+            f"{self._command_prefix()}/result",
+            json.dumps({"command": command, "payload": payload, **result.as_dict()})
+        )
+
+        device_ids = {
+            b["ip"]: b.get("device_id", b["name"].lower().replace(" ", "_")) for b in batteries
         }
-        self.request_id += 1
+        with self._state_lock:
+            self._publish_switch_state(
+                mismatch=not result.ok,
+                confirmed={device_ids[c.ip]: c.confirmed_mode for c in result.commands},
+                time_to_effect_ms={
+                    device_ids[c.ip]: None if c.time_to_effect is None else round(c.time_to_effect * 1000)
+                    for c in result.commands
+                },
+                verification_method="read_after_write"
+            )
+
+        # The read-back is a fresh ES.GetMode: publish it instead of
+        # waiting for the next poll
+        by_ip = {b["ip"]: b for b in batteries}
+        for c in result.commands:
+            if c.status is not None:
+                self._publish_battery_state(by_ip[c.ip], c.status)
+
+    def _reconcile_slots(self):
+        """Check the cached slot model against the batteries after startup."""
+        schedule_config = self.config.get("schedule", {})
+        clients = [self._client(b["ip"]) for b in self._configured_batteries()]
+        status = self.schedule.reconcile(
+            clients,
+            pace_seconds=schedule_config.get("reconcile_pace_seconds", 2),
+            clear_unknown=schedule_config.get("reconcile_clear_unknown", False)
+        )
+        summary = ", ".join(
+            f"{ip} {state} ({SLOT_COUNT - len(self.schedule.unknown(ip))}/{SLOT_COUNT} slots known)"
+            for ip, state in status.items()
+        )
+        self.logger.info(f"Slot reconciliation: {summary}")
+
+    def _find_battery(self, batteries: list, name: str) -> dict | None:
+        """Look up a battery by rotation key (fase_a) or device_id."""
+        return next((b for b in batteries if name in (battery_key(b), b.get("device_id"))), None)
 
-        own_socket = sock is None
+    def _run_schedule(self, payload: str):
+        """Write manual schedule slots by diff against the slot model.
+
+        Payload: {"batteries": {"fase_a": [{"time_num": 0, ...}], ...},
+        "clear_unused": true}. Slots are given like the HA
+        set_manual_schedule service; with clear_unused every slot outside
+        the plan is disabled, which removes leftovers from the app.
+        """
         try:
-            # Create UDP socket if not provided
-            if own_socket:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                if hasattr(socket, 'SO_REUSEPORT'):
-                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-                sock.bind(("0.0.0.0", api_port))
-
-            sock.settimeout(timeout)
-
-            # Send request
-            data = json.dumps(request).encode("utf-8")
-            sock.sendto(data, (ip, api_port))
-
-            # Receive response
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                try:
-                    resp, addr = sock.recvfrom(65535)
-                    response = json.loads(resp.decode("utf-8"))
-
-                    # Skip echo
-                    if response == request:
-                        continue
-
-                    # Check for result
-                    if "result" in response:
-                        return response["result"]
-                    elif "error" in response:
-                        self.logger.warning(f"API error from {ip}: {response['error']}")
-                        return None
-
-                except socket.timeout:
-                    break
-                except json.JSONDecodeError:
+            request = json.loads(payload)
+            batteries = self._configured_batteries()
+            plans = {}
+            keys = {}  # ip -> battery config
+            for name, slots in request.get("batteries", {}).items():
+                battery = self._find_battery(batteries, name)
+                if battery is None:
+                    self.logger.warning(f"Schedule: unknown battery '{name}'")
                     continue
+                plans[self._client(battery["ip"])] = [slot_from_dict(slot) for slot in slots]
+                keys[battery["ip"]] = battery
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.logger.warning(f"Invalid schedule command: {e}")
+            return
+
+        results = self.schedule.apply_all(plans, request.get("clear_unused", False))
+        manual = {result.ip for result in results if result.written}
+        if str(request.get("mode", "")).lower() == "manual":
+            # Every slot write puts a battery in Manual; the ones with nothing
+            # to write still have to get there
+            idle = [client for client in plans if client.ip not in manual]
+            if idle:
+                self.executor.set_all(idle, MODE_MANUAL)
+                manual.update(client.ip for client in idle)
+
+        # A battery that went to Manual is no longer the expected active one
+        for ip in manual:
+            battery = keys[ip]
+            if battery.get("device_id", battery["name"].lower().replace(" ", "_")) == self.expected_active:
+                self.expected_active = None
+
+        ok = all(r.ok for r in results)
+        summary = ", ".join(
+            f"{r.ip} wrote {r.written or '-'} skipped {r.skipped}"
+            + (f" FAILED {r.failed}" if r.failed else "")
+            for r in results
+        )
+        self.logger.info(f"Command schedule: {summary}")
+        if self.mqtt_connected:
+            self._publish(
+                f"{self._command_prefix()}/result",
+                json.dumps({
+                    "command": "schedule",
+                    "ok": ok,
+                    "batteries": [{"battery": battery_key(keys[r.ip]), **r.as_dict()} for r in results]
+                })
+            )
 
-            return None
+    def _publish_switch_state(self, mismatch: bool, **attributes):
+        """Publish the mismatch sensor state (retained) when it changes.
+
+        Called with _state_lock held.
+        """
+        state = {"mismatch": mismatch, "active": self.expected_active, **attributes}
+        if state == self.switch_state:
+            return
+        self.switch_state = state
+        self._publish(f"{self._command_prefix()}/switch", json.dumps(state), retain=True)
+
+    def _check_active_mode(self, device_id: str, mode: str | None):
+        """Flag a mismatch when the expected active battery left Auto since its switch."""
+        if device_id != self.expected_active or not mode or self.switch_state is None:
+            return
+        if self.switch_state["mismatch"] == (mode != MODE_AUTO):
+            return
+        self._publish_switch_state(
+            mismatch=mode != MODE_AUTO,
+            confirmed={**self.switch_state.get("confirmed", {}), device_id: mode},
+            verification_method="poll"
+        )
 
-        except Exception as e:
-            self.logger.error(f"Error querying {ip}: {e}")
-            return None
-        finally:
-            if own_socket and sock:
-                sock.close()
+    def _client(self, ip: str) -> MarstekClient:
+        """Return the API client for a battery, creating it on first use."""
+        client = self.clients.get(ip)
+        if client is None:
+            polling_config = self.config.get("polling", {})
+            timeout = polling_config.get("timeout_seconds", 3)
+            client = MarstekClient(
+                ip,
+                port=self.endpoint.port,
+                endpoint=self.endpoint,
+                retry_policy=self.retry_policy,
+                rtt_estimator=RttEstimator(
+                    initial_timeout=timeout,
+                    min_timeout=polling_config.get("min_timeout_seconds", 0.3),
+                    max_timeout=timeout
+                )
+            )
+            self.clients[ip] = client
+        return client
 
-    def poll_all_batteries(self):
-        """Poll all batteries and publish results."""
-        state_prefix = self.config.get("mqtt", {}).get("state_topic_prefix", "marstek")
-        api_port = self.config.get("api", {}).get("port", 30000)
-        batteries = self.config.get("batteries", [])
+    def query_battery(self, ip: str) -> ModeStatus | None:
+        """Query a single battery using ES.GetMode."""
+        try:
+            return self._client(ip).get_mode()
+        except CircuitOpenError as e:
+            self.logger.debug(str(e))
+        except MarstekApiError as e:
+            self.logger.warning(f"API error from {ip}: {e}")
+        except OSError as e:
+            self.logger.error(f"Error querying {ip}: {e}")
+        return None
 
-        # Create one socket for all batteries
-        sock = None
+    async def _query_battery_async(self, ip: str) -> ModeStatus | None:
+        """Async variant of query_battery()."""
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            if hasattr(socket, 'SO_REUSEPORT'):
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-            sock.bind(("0.0.0.0", api_port))
-
-            for battery in batteries:
-                name = battery.get("name", "Unknown")
-                ip = battery.get("ip")
-                device_id = battery.get("device_id", name.lower().replace(" ", "_"))
-
-                if not ip:
-                    self.logger.warning(f"No IP configured for {name}")
-                    continue
+            return await self._client(ip).async_get_mode()
+        except CircuitOpenError as e:
+            self.logger.debug(str(e))
+        except MarstekApiError as e:
+            self.logger.warning(f"API error from {ip}: {e}")
+        return None
+
+    def _changed_fields(self, device_id: str, state: dict) -> list:
+        """Return the fields that moved beyond their deadband since the last publish.
+
+        All fields count as changed on the first publish and on heartbeats.
+        """
+        previous = self.last_published.get(device_id)
+        if previous is None:
+            return list(state)
+
+        publishing_config = self.config.get("publishing", {})
+        heartbeat = publishing_config.get("heartbeat_cycles", 10)
+        if heartbeat and self.cycles_since_publish.get(device_id, 0) >= heartbeat:
+            return list(state)
+
+        deadband = publishing_config.get("deadband", {})
+        changed = []
+        for field, value in state.items():
+            if field == "mode":
+                if value != previous[field]:
+                    changed.append(field)
+            elif abs(value - previous[field]) >= deadband.get(field, 0):
+                changed.append(field)
+        return changed
+
+    def _publish_availability(self, device_id: str, availability: str):
+        """Publish availability (retained) only when it changes."""
+        if self.last_availability.get(device_id) == availability:
+            return
+        state_prefix = self.config.get("mqtt", {}).get("state_topic_prefix", "marstek")
+        self._publish(f"{state_prefix}/{device_id}/availability", availability, retain=True)
+        self.last_availability[device_id] = availability
 
-                # Query battery using shared socket
-                result = self.query_battery(ip, sock)
+    def _publish_battery_state(self, battery: dict, result: ModeStatus | None):
+        """Publish state and availability for one battery.
 
-                availability_topic = f"{state_prefix}/{device_id}/availability"
-                state_topic = f"{state_prefix}/{device_id}/state"
+        State is only published when a field moves beyond its deadband, the
+        mode changes, or every heartbeat_cycles cycles. With state_format
+        "fields" only the changed fields are sent, each as a raw scalar on
+        its own topic; otherwise the full JSON state is sent.
+        """
+        state_prefix = self.config.get("mqtt", {}).get("state_topic_prefix", "marstek")
+        name = battery.get("name", "Unknown")
+        ip = battery.get("ip")
+        device_id = battery.get("device_id", name.lower().replace(" ", "_"))
 
-                if result:
-                    # Publish state
-                    state = {
-                        "soc": result.get("bat_soc", 0),
-                        "mode": result.get("mode", "Unknown"),
-                        "ongrid_power": result.get("ongrid_power", 0),
-                        "offgrid_power": result.get("offgrid_power", 0),
-                        "timestamp": datetime.now().isoformat()
-                    }
+        state_topic = f"{state_prefix}/{device_id}/state"
 
-                    self.mqtt_client.publish(state_topic, json.dumps(state))
-                    self.mqtt_client.publish(availability_topic, "online")
+        with self._state_lock:
+            if result:
+                state = {
+                    "soc": result.bat_soc or 0,
+                    "mode": result.mode or "Unknown",
+                    "ongrid_power": result.ongrid_power or 0,
+                    "offgrid_power": result.offgrid_power or 0
+                }
 
-                    self.logger.debug(f"{name}: SOC={state['soc']}%, Mode={state['mode']}")
+                now = time.time()
+                if self.telemetry:
+                    self.telemetry.append(device_id, now, state["soc"], state["ongrid_power"],
+                                          state["offgrid_power"], result.mode)
+                if self.ring and device_id in self.ring_index:
+                    self.ring.append(now, self.ring_index[device_id], state["soc"], state["ongrid_power"],
+                                     state["offgrid_power"], mode_code(result.mode))
+
+                changed = self._changed_fields(device_id, state)
+                if changed and self._per_field_topics():
+                    previous = self.last_published.setdefault(device_id, {})
+                    for field in changed:
+                        self._publish(f"{state_prefix}/{device_id}/{field}", str(state[field]))
+                        previous[field] = state[field]
+                    self.cycles_since_publish[device_id] = 0
+                elif changed:
+                    self._publish(
+                        state_topic,
+                        json.dumps({**state, "timestamp": datetime.now().isoformat()})
+                    )
+                    self.last_published[device_id] = state
+                    self.cycles_since_publish[device_id] = 0
                 else:
-                    # Mark as offline
-                    self.mqtt_client.publish(availability_topic, "offline")
-                    self.logger.warning(f"{name} ({ip}): No response")
+                    self.cycles_since_publish[device_id] = self.cycles_since_publish.get(device_id, 0) + 1
+
+                self._publish_availability(device_id, "online")
+                self._check_active_mode(device_id, result.mode)
+
+                self.logger.debug(f"{name}: SOC={state['soc']}%, Mode={state['mode']}")
+            else:
+                # Mark as offline
+                self._publish_availability(device_id, "offline")
+                self.logger.warning(f"{name} ({ip}): No response")
+
+    def _collect_metrics(self) -> list:
+        """Poller metric families: cycle and switch durations, queues, timeouts."""
+        switch = MetricFamily("marstek_switch_duration_seconds", "histogram",
+                              "Mode command from MQTT receipt to confirmed result")
+        for command, histogram in self.switch_duration.items():
+            switch.add(histogram, command=command)
+        info = MetricFamily("marstek_battery_info", "gauge", "Configured batteries by IP")
+        timeout = MetricFamily("marstek_request_timeout_seconds", "gauge", "Current adaptive timeout per battery")
+        for battery in self.config.get("batteries", []):
+            if not battery.get("ip"):
+                continue
+            info.add(1, ip=battery["ip"], battery=battery.get("device_id", battery["name"].lower().replace(" ", "_")))
+            client = self.clients.get(battery["ip"])
+            if client is not None:
+                timeout.add(client.rtt_estimator.timeout, ip=battery["ip"])
+        return [
+            MetricFamily("marstek_poll_cycle_duration_seconds", "histogram",
+                         "Time to poll all batteries once").add(self.poll_duration),
+            switch,
+            MetricFamily("marstek_mqtt_queue_depth", "gauge", "MQTT publishes not yet sent or acknowledged")
+            .add(self._mqtt_in_flight),
+            MetricFamily("marstek_command_queue_depth", "gauge", "Commands waiting for the command worker")
+            .add(self._commands.qsize()),
+            info,
+            timeout,
+        ]
+
+    def _configured_batteries(self) -> list:
+        """Return batteries that have an IP configured."""
+        batteries = []
+        for battery in self.config.get("batteries", []):
+            if not battery.get("ip"):
+                self.logger.warning(f"No IP configured for {battery.get('name', 'Unknown')}")
+                continue
+            batteries.append(battery)
+        return batteries
+
+    def poll_all_batteries(self):
+        """Poll all batteries and publish results."""
+        transport = self.config.get("polling", {}).get("transport", "asyncio")
+        if transport == "blocking":
+            self._poll_all_batteries_blocking()
+        else:
+            asyncio.run(self._poll_all_batteries_async())
+
+    def _poll_all_batteries_blocking(self):
+        """Poll batteries one after another."""
+        for battery in self._configured_batteries():
+            result = self.query_battery(battery["ip"])
+            self._publish_battery_state(battery, result)
+
+    async def _poll_all_batteries_async(self):
+        """Query all batteries concurrently over the shared endpoint."""
+        batteries = self._configured_batteries()
 
+        try:
+            results = await asyncio.gather(*(
+                self._query_battery_async(battery["ip"]) for battery in batteries
+            ))
         except OSError as e:
             self.logger.error(f"Socket error: {e}")
-        finally:
-            if sock:
-                sock.close()
+            return
+
+        for battery, result in zip(batteries, results):
+            self._publish_battery_state(battery, result)
 
     def run(self):
         """Main polling loop."""
@@ -380,10 +931,28 @@ class MarstekPoller:
 
         self.logger.info(f"Starting polling loop (interval: {interval}s)")
 
+        metrics_config = self.config.get("metrics", {})
+        if metrics_config.get("port"):
+            self.metrics_server = MetricsServer(self.metrics, metrics_config["port"],
+                                                metrics_config.get("host", "127.0.0.1"))
+            try:
+                self.metrics_server.start()
+            except OSError as e:
+                self.logger.warning(f"Metrics endpoint unavailable: {e}")
+                self.metrics_server = None
+
+        # Runs on the command worker, so it never overlaps a schedule write
+        self._commands.put(("reconcile", "", time.monotonic()))
+
         while self.running:
             try:
                 if self.mqtt_connected:
+                    start = time.monotonic()
                     self.poll_all_batteries()
+                    self.poll_duration.observe(time.monotonic() - start)
+                    # Disk I/O after the poll, outside _state_lock
+                    if self.telemetry:
+                        self.telemetry.maybe_flush()
                 else:
                     self.logger.warning("MQTT not connected, skipping poll")
 
@@ -406,11 +975,22 @@ class MarstekPoller:
             state_prefix = self.config.get("mqtt", {}).get("state_topic_prefix", "marstek")
             for battery in self.config.get("batteries", []):
                 device_id = battery.get("device_id", battery["name"].lower().replace(" ", "_"))
-                self.mqtt_client.publish(f"{state_prefix}/{device_id}/availability", "offline")
+                self._publish(f"{state_prefix}/{device_id}/availability", "offline", retain=True)
 
             self.mqtt_client.loop_stop()
             self.mqtt_client.disconnect()
 
+        if self.metrics_server:
+            self.metrics_server.close()
+        if self.telemetry:
+            self.telemetry.flush()
+        # Under the lock: a command worker may be appending a sample
+        with self._state_lock:
+            ring, self.ring = self.ring, None
+        if ring:
+            ring.close()
+        self.endpoint.close()
+
 
 def load_config(config_path: str | None) -> dict:
     """Load configuration from file or use defaults."""
@@ -473,14 +1053,14 @@ def main():
             print(f"Testing {name} ({ip})...")
             result = poller.query_battery(ip)
             if result:
-                print(f"  ✅ SOC: {result.get('bat_soc')}%, Mode: {result.get('mode')}")
+                print(f"  ✅ SOC: {result.bat_soc}%, Mode: {result.mode}")
             else:
                 print(f"  ❌ No response")
-            # Delay between tests to allow socket port to be fully released
-            time.sleep(1.0)
         print("\n=== TEST COMPLETE ===")
         return
 
+    poller.open_telemetry()
+
     # Setup MQTT
     if not poller.setup_mqtt():
         print("Failed to connect to MQTT broker")
@@ -0,0 +1,81 @@
+"""Battery rotation decisions for Marstek batteries."""
+
+from .calibration import CalibrationState, PVCalibration, RecorderHistory
+from .dsmr import DsmrParser, DsmrReader, Telegram, crc16
+from .engine import (
+    ACTION_CHARGE,
+    ACTION_DISCHARGE,
+    ACTION_IDLE,
+    DEFAULT_ROTATION_CONFIG,
+    Decision,
+    RotationEngine,
+)
+from .forecast import ForecastCache, ForecastSeries, PanelModel, PVForecast
+from .optimizer import (
+    DEFAULT_OPTIMIZER_CONFIG,
+    TariffOptimizer,
+    TariffPlan,
+    bucket_start,
+    price_grid,
+    pv_profile,
+)
+from .p1 import (
+    EVENT_GRID_CONSUMPTION,
+    EVENT_OVERFLOW_START,
+    EVENT_OVERFLOW_STOP,
+    EVENT_SOLAR_EXCESS,
+    HysteresisRule,
+    P1Event,
+    P1Stream,
+)
+from .planner import (
+    DEFAULT_PLANNER_CONFIG,
+    NUMPY_AVAILABLE,
+    BatteryCharge,
+    ChargePlan,
+    NightChargePlanner,
+    allocate,
+)
+from .registry import BatteryRegistry, BatteryState, battery_key
+
+__all__ = [
+    "ACTION_CHARGE",
+    "ACTION_DISCHARGE",
+    "ACTION_IDLE",
+    "DEFAULT_OPTIMIZER_CONFIG",
+    "DEFAULT_PLANNER_CONFIG",
+    "DEFAULT_ROTATION_CONFIG",
+    "EVENT_GRID_CONSUMPTION",
+    "EVENT_OVERFLOW_START",
+    "EVENT_OVERFLOW_STOP",
+    "EVENT_SOLAR_EXCESS",
+    "NUMPY_AVAILABLE",
+    "BatteryCharge",
+    "BatteryRegistry",
+    "BatteryState",
+    "CalibrationState",
+    "ChargePlan",
+    "Decision",
+    "DsmrParser",
+    "DsmrReader",
+    "ForecastCache",
+    "ForecastSeries",
+    "HysteresisRule",
+    "NightChargePlanner",
+    "P1Event",
+    "P1Stream",
+    "PVCalibration",
+    "PVForecast",
+    "PanelModel",
+    "RecorderHistory",
+    "RotationEngine",
+    "TariffOptimizer",
+    "TariffPlan",
+    "Telegram",
+    "allocate",
+    "battery_key",
+    "bucket_start",
+    "crc16",
+    "price_grid",
+    "pv_profile",
+]
@@ -0,0 +1,242 @@
+"""
+Zelf-kalibrerend PV model op basis van gemeten productie.
+
+De PV verwachting rekent instraling om met kwp x performance_ratio, twee
+getallen die je zelf moet schatten (net als vroeger de vaste 1.5 kWh per
+zonuur). Een te hoge schatting betekent 's nachts te weinig laden, een te
+lage betekent onnodig netstroom inkopen.
+
+PVCalibration vergelijkt per afgelopen uur de voorspelde instraling met de
+gemeten PV energie en past per maand een coëfficiënt aan:
+
+    PV (kWh) = coëfficiënt x instraling (kWh/m²)
+
+met incrementele kleinste kwadraten door de oorsprong: per maand alleen
+Σxy, Σx² en het aantal uren, met een vergeetfactor zodat oude jaren
+langzaam minder meetellen. Een maand met te weinig uren valt terug op het
+seizoen (3 maanden), dan op alle maanden, dan op kwp x performance_ratio.
+
+De gemeten energie komt uit de long-term statistics van de HA recorder
+(SQLite, alleen-lezen): de uurlijkse som van een of meer energy sensors,
+bijv. P1 teruglevering + batterij laden. Dat is de PV die niet direct in
+huis verbruikt werd, precies wat het nachtladen kan vervangen.
+"""
+
+import json
+import logging
+import sqlite3
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from .forecast import PVForecast, save_json
+
+logger = logging.getLogger(__name__)
+
+CALIBRATION_VERSION = 1
+
+# Hours with less forecast irradiance than this (kWh/m2) say nothing about
+# the panels and are skipped
+MIN_IRRADIANCE = 0.05
+
+# Months per season, for months without enough samples of their own
+SEASONS = ((12, 1, 2), (3, 4, 5), (6, 7, 8), (9, 10, 11))
+
+
+class RecorderHistory:
+    """Hourly energy from the HA recorder's long-term statistics."""
+
+    def __init__(self, db_path: str, statistic_ids: list):
+        self.db_path = db_path
+        self.statistic_ids = list(statistic_ids)
+
+    def hourly_kwh(self, since: datetime, until: datetime) -> dict:
+        """{hour start: kWh} summed over all statistics, for complete hours.
+
+        Only hours present for every statistic are returned. The energy of
+        an hour is the difference between its `sum` and the previous one.
+        """
+        if not self.statistic_ids:
+            return {}
+        first = (since - timedelta(hours=1)).timestamp()
+        last = until.timestamp()
+        totals = None
+        uri = f"file:{Path(self.db_path).as_posix()}?mode=ro"
+        with sqlite3.connect(uri, uri=True, timeout=5) as db:
+            for statistic_id in self.statistic_ids:
+                rows = db.execute(
+                    "SELECT s.start_ts, s.sum FROM statistics s "
+                    "JOIN statistics_meta m ON s.metadata_id = m.id "
+                    "WHERE m.statistic_id = ? AND s.start_ts >= ? AND s.start_ts < ? "
+                    "ORDER BY s.start_ts",
+                    (statistic_id, first, last)
+                ).fetchall()
+                energy = {}
+                for (prev_ts, prev_sum), (ts, total) in zip(rows, rows[1:]):
+                    if ts - prev_ts == 3600 and total is not None and prev_sum is not None:
+                        # Meter resets show up as negative steps
+                        energy[datetime.fromtimestamp(ts)] = max(total - prev_sum, 0.0)
+                if totals is None:
+                    totals = energy
+                else:
+                    totals = {hour: totals[hour] + kwh for hour, kwh in energy.items() if hour in totals}
+        return {hour: kwh for hour, kwh in (totals or {}).items() if hour >= since}
+
+
+@dataclass(frozen=True, slots=True)
+class CalibrationState:
+    """Per-month sums and the last processed hour.
+
+    update() builds a new state and swaps it in as one object, so a reader
+    in another thread sees either the old or the new fit.
+    """
+
+    # month -> (sum_xy, sum_xx, samples)
+    months: dict = field(default_factory=lambda: {month: (0.0, 0.0, 0.0) for month in range(1, 13)})
+    last_hour: datetime | None = None  # start of the last hour that was processed
+
+
+class PVCalibration:
+    """Per-month least-squares fit of PV energy against forecast irradiance."""
+
+    def __init__(self, default_coefficient: float, forgetting: float = 0.995,
+                 min_samples: int = 20, max_backfill_hours: int = 48,
+                 path: str | Path | None = None):
+        self.default = default_coefficient
+        self.forgetting = forgetting
+        self.min_samples = min_samples
+        self.max_backfill = timedelta(hours=max_backfill_hours)
+        self.path = Path(path) if path else None
+        self.state = CalibrationState()
+        self._load()
+
+    @property
+    def months(self) -> dict:
+        return self.state.months
+
+    @property
+    def last_hour(self) -> datetime | None:
+        return self.state.last_hour
+
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring PV calibration {self.path}: {e}")
+            return
+        if not isinstance(data, dict):
+            logger.warning(f"Ignoring PV calibration {self.path}: not a JSON object")
+            return
+        if data.get("version") != CALIBRATION_VERSION:
+            return
+        months = dict(self.state.months)
+        stored = data.get("months")
+        for month, sums in (stored.items() if isinstance(stored, dict) else ()):
+            try:
+                month, sums = int(month), tuple(float(value) for value in sums)
+            except (TypeError, ValueError):
+                month = None
+            if month not in months or len(sums) != 3:
+                logger.warning(f"Ignoring PV calibration month {month!r} in {self.path}")
+                continue
+            months[month] = sums
+        last_hour = None
+        try:
+            if data.get("last_hour"):
+                last_hour = datetime.fromisoformat(data["last_hour"])
+        except (TypeError, ValueError):
+            logger.warning(f"Ignoring PV calibration last_hour in {self.path}")
+        self.state = CalibrationState(months, last_hour)
+
+    def save(self):
+        if self.path is not None:
+            state = self.state
+            save_json(self.path, {
+                "version": CALIBRATION_VERSION,
+                "last_hour": state.last_hour.isoformat() if state.last_hour else None,
+                "months": state.months
+            })
+
+    def _added(self, sums: tuple, irradiance_kwh: float, pv_kwh: float) -> tuple:
+        sum_xy, sum_xx, samples = sums
+        return (sum_xy * self.forgetting + irradiance_kwh * pv_kwh,
+                sum_xx * self.forgetting + irradiance_kwh * irradiance_kwh,
+                samples * self.forgetting + 1)
+
+    def add(self, month: int, irradiance_kwh: float, pv_kwh: float):
+        """Add one hour: forecast irradiance (kWh/m2) and measured PV (kWh)."""
+        state = self.state
+        months = {**state.months, month: self._added(state.months[month], irradiance_kwh, pv_kwh)}
+        self.state = CalibrationState(months, state.last_hour)
+
+    def _fit(self, state: CalibrationState, months) -> float | None:
+        sum_xy = sum(state.months[m][0] for m in months)
+        sum_xx = sum(state.months[m][1] for m in months)
+        samples = sum(state.months[m][2] for m in months)
+        if samples < self.min_samples or sum_xx <= 0:
+            return None
+        return sum_xy / sum_xx
+
+    def _coefficient(self, state: CalibrationState, month: int) -> float:
+        season = next(s for s in SEASONS if month in s)
+        for months in ((month,), season, tuple(state.months)):
+            value = self._fit(state, months)
+            if value is not None:
+                return value
+        return self.default
+
+    def coefficient(self, month: int) -> float:
+        """Fitted coefficient (kWh per kWh/m2) for a month, with fallbacks."""
+        return self._coefficient(self.state, month)
+
+    def coefficients(self, state: CalibrationState | None = None) -> dict:
+        """Month -> coefficient, only for months that have a fit of their own or a season."""
+        state = state or self.state
+        result = {}
+        for month in state.months:
+            value = self._coefficient(state, month)
+            if value != self.default:
+                result[month] = value
+        return result
+
+    def update(self, history: RecorderHistory, forecast: PVForecast, now: datetime | None = None) -> int:
+        """Process the complete hours since the last run. Returns the number added."""
+        now = now or datetime.now()
+        until = now.replace(minute=0, second=0, microsecond=0)
+        since = until - self.max_backfill
+        state = self.state
+        if state.last_hour is not None:
+            since = max(since, state.last_hour + timedelta(hours=1))
+        if since >= until:
+            return 0
+
+        # Built aside and swapped in at the end
+        months, last_hour = dict(state.months), state.last_hour
+        added = 0
+        for hour, pv_kwh in sorted(history.hourly_kwh(since, until).items()):
+            irradiance = forecast.irradiance_at(hour + timedelta(hours=1))
+            if irradiance is None:
+                continue
+            last_hour = hour
+            if irradiance / 1000 < MIN_IRRADIANCE:
+                continue
+            months[hour.month] = self._added(months[hour.month], irradiance / 1000, pv_kwh)
+            added += 1
+        self.state = CalibrationState(months, last_hour)
+        self.save()
+        return added
+
+    def as_dict(self, month: int) -> dict:
+        state = self.state
+        return {
+            "month": month,
+            "default": round(self.default, 3),
+            "samples": round(state.months[month][2]),
+            "monthly": {m: round(value, 3) for m, value in self.coefficients(state).items()},
+            "last_hour": state.last_hour.isoformat(timespec="minutes") if state.last_hour else None
+        }
@@ -0,0 +1,254 @@
+"""
+DSMR P1 telegram reader.
+
+Leest de P1 poort direct (USB serial, of een ser2net TCP socket) of
+speelt een opgenomen bestand af, en geeft per telegram het netto vermogen
+door aan de rotation engine. Dat scheelt de omweg via de HA DSMR integratie,
+de state machine en de recorder: de engine reageert binnen één telegram
+interval (1s bij DSMR 5).
+
+De parser is incrementeel: bytes mogen in willekeurige stukken binnenkomen.
+Een telegram loopt van "/" tot "!" plus CRC16 (DSMR 4+); alleen telegrammen
+met een kloppende CRC worden doorgegeven. DSMR 2.2 telegrammen hebben geen
+CRC en worden zonder check geaccepteerd.
+"""
+
+import logging
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+
+try:
+    import serial
+    SERIAL_AVAILABLE = True
+except ImportError:
+    SERIAL_AVAILABLE = False
+
+logger = logging.getLogger("marstek_rotation.dsmr")
+
+# OBIS codes (kW) -> telegram attribute
+_POWER_CODES = {
+    b"1-0:1.7.0": ("delivered", None),
+    b"1-0:2.7.0": ("returned", None),
+    b"1-0:21.7.0": ("delivered", 0),
+    b"1-0:22.7.0": ("returned", 0),
+    b"1-0:41.7.0": ("delivered", 1),
+    b"1-0:42.7.0": ("returned", 1),
+    b"1-0:61.7.0": ("delivered", 2),
+    b"1-0:62.7.0": ("returned", 2),
+}
+
+# Upper bound for one telegram; anything longer is garbage
+MAX_TELEGRAM_BYTES = 8192
+
+
+def _crc16_table() -> list:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC_TABLE = _crc16_table()
+
+
+def crc16(data: bytes) -> int:
+    """CRC16/ARC as used by DSMR 4 and 5 (from "/" up to and including "!")."""
+    crc = 0
+    table = _CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+@dataclass(slots=True)
+class Telegram:
+    """Power values from one telegram, in kW as sent by the meter."""
+
+    delivered: float = 0.0
+    returned: float = 0.0
+    phase_delivered: list = field(default_factory=lambda: [0.0, 0.0, 0.0])
+    phase_returned: list = field(default_factory=lambda: [0.0, 0.0, 0.0])
+
+    @property
+    def power(self) -> float:
+        """Net power in W; positive = consumption, negative = export (like sensor.p1_meter_power)."""
+        return round((self.delivered - self.returned) * 1000, 1)
+
+    @property
+    def phase_power(self) -> list:
+        return [
+            round((d - r) * 1000, 1)
+            for d, r in zip(self.phase_delivered, self.phase_returned)
+        ]
+
+
+class DsmrParser:
+    """Incremental telegram parser with CRC check."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.telegrams = 0
+        self.crc_errors = 0
+
+    def feed(self, data: bytes) -> list:
+        """Add received bytes; returns the complete, valid telegrams."""
+        buffer = self._buffer
+        buffer += data
+        telegrams = []
+
+        while True:
+            start = buffer.find(b"/")
+            if start < 0:
+                buffer.clear()
+                break
+            if start:
+                del buffer[:start]
+
+            end = buffer.find(b"!")
+            if end < 0:
+                if len(buffer) > MAX_TELEGRAM_BYTES:
+                    del buffer[:1]
+                    continue
+                break
+
+            # "!" is followed by 4 hex CRC digits (DSMR 4+) or directly by CRLF
+            line_end = buffer.find(b"\n", end)
+            if line_end < 0:
+                break
+            crc_text = bytes(buffer[end + 1:line_end]).strip()
+            body = bytes(buffer[:end + 1])
+            del buffer[:line_end + 1]
+
+            if crc_text:
+                try:
+                    expected = int(crc_text, 16)
+                except ValueError:
+                    self.crc_errors += 1
+                    continue
+                if crc16(body) != expected:
+                    self.crc_errors += 1
+                    continue
+
+            telegrams.append(self._parse(body))
+            self.telegrams += 1
+
+        return telegrams
+
+    @staticmethod
+    def _parse(body: bytes) -> Telegram:
+        telegram = Telegram()
+        for line in body.split(b"\n"):
+            paren = line.find(b"(")
+            if paren < 0:
+                continue
+            target = _POWER_CODES.get(line[:paren].strip())
+            if target is None:
+                continue
+            close = line.find(b"*", paren)
+            if close < 0:
+                close = line.find(b")", paren)
+            try:
+                value = float(line[paren + 1:close])
+            except ValueError:
+                continue
+            name, phase = target
+            if phase is None:
+                setattr(telegram, name, value)
+            elif name == "delivered":
+                telegram.phase_delivered[phase] = value
+            else:
+                telegram.phase_returned[phase] = value
+        return telegram
+
+
+class DsmrReader:
+    """Reads telegrams from a serial port, a ser2net socket or a file.
+
+    callback(telegram) is called from the reader thread for every valid
+    telegram. Connection errors are logged and retried.
+    """
+
+    def __init__(self, callback, source: str = "serial", port: str = "/dev/ttyUSB0",
+                 baudrate: int = 115200, host: str = "localhost", tcp_port: int = 2001,
+                 file: str = "", replay_interval_seconds: float = 1.0,
+                 reconnect_seconds: float = 5.0):
+        if source not in ("serial", "tcp", "file"):
+            raise ValueError(f"Unknown DSMR source: {source}")
+        if source == "serial" and not SERIAL_AVAILABLE:
+            raise RuntimeError("pyserial not installed. Install with: pip install pyserial")
+
+        self.callback = callback
+        self.source = source
+        self.port = port
+        self.baudrate = baudrate
+        self.host = host
+        self.tcp_port = tcp_port
+        self.file = file
+        self.replay_interval = replay_interval_seconds
+        self.reconnect_seconds = reconnect_seconds
+
+        self.parser = DsmrParser()
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name="dsmr-reader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        while self.running:
+            try:
+                if self.source == "serial":
+                    self._read_serial()
+                elif self.source == "tcp":
+                    self._read_tcp()
+                else:
+                    self._replay_file()
+                    return
+            except OSError as e:  # includes serial.SerialException
+                logger.warning(f"DSMR {self.source} error: {e}")
+            if self.running:
+                time.sleep(self.reconnect_seconds)
+
+    def _dispatch(self, data: bytes):
+        for telegram in self.parser.feed(data):
+            self.callback(telegram)
+
+    def _read_serial(self):
+        with serial.Serial(self.port, self.baudrate, timeout=1) as port:
+            logger.info(f"Reading DSMR telegrams from {self.port}")
+            while self.running:
+                data = port.read(port.in_waiting or 1)
+                if data:
+                    self._dispatch(data)
+
+    def _read_tcp(self):
+        with socket.create_connection((self.host, self.tcp_port), timeout=10) as sock:
+            logger.info(f"Reading DSMR telegrams from {self.host}:{self.tcp_port}")
+            sock.settimeout(30)
+            while self.running:
+                data = sock.recv(4096)
+                if not data:
+                    raise ConnectionError("ser2net closed the connection")
+                self._dispatch(data)
+
+    def _replay_file(self):
+        """Feed a recorded P1 log, one telegram per replay interval (0 = no pause)."""
+        with open(self.file, "rb") as f:
+            data = f.read()
+        logger.info(f"Replaying DSMR telegrams from {self.file}")
+        for telegram in self.parser.feed(data):
+            if not self.running:
+                break
+            self.callback(telegram)
+            if self.replay_interval:
+                time.sleep(self.replay_interval)
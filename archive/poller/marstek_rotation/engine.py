@@ -0,0 +1,217 @@
+"""
+Rotation beslissingen zonder Jinja templates.
+
+De engine houdt de state van alle batterijen in één BatteryRegistry bij,
+voor elk aantal batterijen. De leegste/volste batterij volgt per SOC update
+uit de heaps van de registry, in plaats van bij elke P1 update drie SOC
+sensors opnieuw te lezen en te sorteren.
+
+De beslisregels volgen de automations in battery-rotation.yaml:
+- Zonoverschot (P1 < -drempel, hold tijd): switch naar de leegste batterij,
+  maar alleen als de actieve batterij bijna vol is
+- Netverbruik (P1 > drempel, hold tijd): switch naar de volste batterij
+  (beide via de hysteresis regels van P1Stream, zie p1.py)
+- Lage SOC van de actieve batterij: switch naar de volste batterij
+
+Een batterij komt alleen in aanmerking om te laden onder charge_max_soc en
+om te ontladen boven discharge_min_soc.
+"""
+
+import time
+from dataclasses import dataclass
+
+from .p1 import (
+    ABOVE,
+    BELOW,
+    EVENT_GRID_CONSUMPTION,
+    EVENT_OVERFLOW_START,
+    EVENT_OVERFLOW_STOP,
+    EVENT_SOLAR_EXCESS,
+    HysteresisRule,
+    P1Stream,
+)
+from .registry import BatteryRegistry, BatteryState
+
+# Decision actions
+ACTION_IDLE = "idle"
+ACTION_CHARGE = "charge"
+ACTION_DISCHARGE = "discharge"
+
+# Mode that marks the active battery
+ACTIVE_MODE = "Auto"
+
+DEFAULT_ROTATION_CONFIG = {
+    "solar_threshold_w": 200,
+    "grid_threshold_w": 200,
+    "hold_seconds": 120,
+    "switch_delay_seconds": 300,
+    "solar_switch_soc": 96,
+    "low_soc": 13,
+    "full_soc": 95,
+    "charge_max_soc": 100,
+    "discharge_min_soc": 15,
+    "overflow_start_threshold_w": 200,
+    "overflow_start_seconds": 60,
+    "overflow_stop_threshold_w": 100,
+    "overflow_stop_seconds": 60,
+    "p1_hysteresis_w": 0,
+}
+
+
+@dataclass(slots=True)
+class Decision:
+    """Outcome of one evaluation."""
+
+    action: str = ACTION_IDLE
+    target: str | None = None
+    reason: str = ""
+
+    def as_dict(self) -> dict:
+        return {"action": self.action, "target": self.target, "reason": self.reason}
+
+
+class RotationEngine:
+    """Rotation decisions on top of a BatteryRegistry."""
+
+    def __init__(self, batteries: list, **settings):
+        unknown = set(settings) - set(DEFAULT_ROTATION_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown rotation settings: {', '.join(sorted(unknown))}")
+        self.settings = {**DEFAULT_ROTATION_CONFIG, **settings}
+
+        self.registry = BatteryRegistry(batteries)
+        self.active = None
+        self.p1 = P1Stream(self._p1_rules())
+        self.last_switch = 0.0
+
+    def _p1_rules(self) -> list:
+        """Hysteresis rules for the automations that trigger on P1 power."""
+        s = self.settings
+        band = s["p1_hysteresis_w"]
+        return [
+            HysteresisRule(EVENT_SOLAR_EXCESS, BELOW, -s["solar_threshold_w"],
+                           s["hold_seconds"], release=-s["solar_threshold_w"] + band),
+            HysteresisRule(EVENT_GRID_CONSUMPTION, ABOVE, s["grid_threshold_w"],
+                           s["hold_seconds"], release=s["grid_threshold_w"] - band),
+            HysteresisRule(EVENT_OVERFLOW_START, BELOW, -s["overflow_start_threshold_w"],
+                           s["overflow_start_seconds"], release=-s["overflow_start_threshold_w"] + band),
+            HysteresisRule(EVENT_OVERFLOW_STOP, ABOVE, s["overflow_stop_threshold_w"],
+                           s["overflow_stop_seconds"], release=s["overflow_stop_threshold_w"] - band),
+        ]
+
+    # ------------------------------------------------------------------
+    # State updates
+    # ------------------------------------------------------------------
+
+    def update_soc(self, key: str, soc: float) -> bool:
+        """Record a SOC reading. Returns True if the extremes changed."""
+        before = (self.emptiest, self.fullest)
+        if not self.registry.update_soc(key, soc):
+            return False
+        return (self.emptiest, self.fullest) != before
+
+    def set_available(self, key: str, available: bool) -> bool:
+        """Record availability. Returns True if the extremes changed."""
+        before = (self.emptiest, self.fullest)
+        if not self.registry.set_available(key, available):
+            return False
+        return (self.emptiest, self.fullest) != before
+
+    def update_mode(self, key: str, mode: str, now: float | None = None):
+        """Record a mode; the battery in Auto mode is the active one."""
+        battery = self.registry[key]
+        battery.mode = mode
+        if mode == ACTIVE_MODE and self.active is not battery:
+            self.active = battery
+            self.last_switch = time.monotonic() if now is None else now
+        elif mode != ACTIVE_MODE and self.active is battery:
+            self.active = None
+
+    # ------------------------------------------------------------------
+    # Derived values
+    # ------------------------------------------------------------------
+
+    @property
+    def emptiest(self) -> BatteryState | None:
+        return self.registry.emptiest()
+
+    @property
+    def fullest(self) -> BatteryState | None:
+        return self.registry.fullest()
+
+    @property
+    def emptiest_inactive(self) -> BatteryState | None:
+        """Emptiest battery other than the active one (overflow charging)."""
+        return self.registry.emptiest(exclude=self.active.key if self.active else None)
+
+    @property
+    def lowest_soc(self) -> float | None:
+        emptiest = self.emptiest
+        return emptiest.soc if emptiest else None
+
+    @property
+    def highest_soc(self) -> float | None:
+        fullest = self.fullest
+        return fullest.soc if fullest else None
+
+    @property
+    def all_full(self) -> bool:
+        """All batteries online and at or above full_soc."""
+        emptiest = self.emptiest
+        return (
+            emptiest is not None
+            and self.registry.all_known
+            and emptiest.soc >= self.settings["full_soc"]
+        )
+
+    # ------------------------------------------------------------------
+    # Decisions
+    # ------------------------------------------------------------------
+
+    @property
+    def p1_power(self) -> float | None:
+        return self.p1.last
+
+    def update_p1(self, power: float, now: float | None = None) -> list:
+        """Record a P1 reading (negative = export). Returns fired P1Events."""
+        return self.p1.push(power, now)
+
+    def tick(self, now: float | None = None) -> list:
+        """Let hold times expire when no new P1 reading arrives."""
+        return self.p1.tick(now)
+
+    def evaluate(self, now: float | None = None) -> Decision:
+        """Decide which battery should be active right now."""
+        now = time.monotonic() if now is None else now
+        active = self.active
+        settings = self.settings
+
+        registry = self.registry
+        # Only batteries with room to charge / enough left to discharge
+        charge_target = registry.emptiest(below=settings["charge_max_soc"])
+        discharge_target = registry.fullest(above=settings["discharge_min_soc"])
+
+        solar = self.p1.held(EVENT_SOLAR_EXCESS)
+        grid = self.p1.held(EVENT_GRID_CONSUMPTION)
+        low_soc = active is not None and active.known and active.soc < settings["low_soc"]
+        if not (low_soc or solar or grid):
+            return Decision()
+        if now - self.last_switch < settings["switch_delay_seconds"]:
+            return Decision(reason="switch_delay")
+
+        if low_soc:
+            if discharge_target is None or discharge_target is active:
+                return Decision()
+            return Decision(ACTION_DISCHARGE, discharge_target.key, "low_soc")
+
+        if solar:
+            if charge_target is None or charge_target is active:
+                return Decision()
+            if active is not None and active.known and active.soc < settings["solar_switch_soc"]:
+                # Active battery still has room: overflow charging territory
+                return Decision(reason="active_not_full")
+            return Decision(ACTION_CHARGE, charge_target.key, "solar_excess")
+
+        if discharge_target is None or discharge_target is active:
+            return Decision()
+        return Decision(ACTION_DISCHARGE, discharge_target.key, "grid_consumption")
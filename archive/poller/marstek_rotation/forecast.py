@@ -0,0 +1,356 @@
+"""
+PV verwachting uit een uurlijkse weersvoorspelling, met cache.
+
+Vervangt de trigger sensor "Marstek Sunny Hours Tomorrow": die riep elk uur
+vanaf 17:00 weather.get_forecasts aan en hield er alleen een aantal zonuren
+van over, dat HA met pv_production_per_sunny_hour vermenigvuldigde.
+
+PVForecast haalt de uurlijkse instraling en bewolking op bij Open-Meteo
+(of leest hetzelfde formaat uit een lokaal bestand) en rekent die met een
+panel model om naar kWh per kwartier. De planners krijgen zo een array met
+echte tijdsresolutie in plaats van één getal.
+
+Ophalen is goedkoop:
+- zolang het antwoord niet verlopen is (Cache-Control max-age / Expires,
+  anders refresh_seconds) gebeurt er niets;
+- daarna een conditional request (If-None-Match / If-Modified-Since): bij
+  304 Not Modified wordt alleen de vervaltijd verlengd;
+- voor een bestand geldt mtime + grootte als ETag.
+
+Het laatste antwoord staat in een JSON cache (atomair vervangen, zoals de
+slot cache), zodat een herstart niet opnieuw hoeft op te halen.
+"""
+
+import bisect
+import email.utils
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from .optimizer import BUCKET_MINUTES
+
+logger = logging.getLogger(__name__)
+
+OPEN_METEO_URL = (
+    "https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}"
+    "&hourly=shortwave_radiation,cloud_cover&past_days=2&forecast_days=3&timezone=auto"
+)
+
+CACHE_VERSION = 1
+
+# Hours that counted for "sunny hours" in the old trigger sensor
+SUNNY_FIRST_HOUR = 7
+SUNNY_LAST_HOUR = 20
+SUNNY_MAX_CLOUD_COVER = 25
+
+
+@dataclass(slots=True)
+class PanelModel:
+    """Linear PV model: kW = coefficient x irradiance / 1000.
+
+    The coefficient is kwp x performance_ratio, unless a fitted value for
+    the month is known (see calibration.py).
+    """
+
+    kwp: float = 4.0
+    performance_ratio: float = 0.8
+    monthly: dict = field(default_factory=dict)  # month (1-12) -> coefficient
+
+    @property
+    def coefficient(self) -> float:
+        return self.kwp * self.performance_ratio
+
+    def power_kw(self, irradiance: float, month: int | None = None) -> float:
+        coefficient = self.monthly.get(month, self.coefficient)
+        return max(irradiance, 0.0) / 1000 * coefficient
+
+
+@dataclass(frozen=True, slots=True)
+class ForecastSeries:
+    """Hourly forecast, sorted by the end of each hour.
+
+    Each value is the mean of the hour before it, as Open-Meteo reports
+    radiation. A refresh builds a new series and swaps it in as one object, so a
+    reader in another thread never sees lists of different lengths.
+    """
+
+    times: tuple = ()
+    irradiance: tuple = ()
+    cloud_cover: tuple = ()
+    midpoints: tuple = ()
+
+
+def save_json(path: Path, data: dict):
+    """Atomically replace `path` with `data` (temp file, fsync, rename)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Could not write {path}: {e}")
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+def _clear_sky(moment: datetime) -> float:
+    """Rough clear-sky irradiance (W/m2) for when only cloud cover is known."""
+    hour = moment.hour + moment.minute / 60
+    if not 6 < hour < 21:
+        return 0.0
+    return 800 * math.sin(math.pi * (hour - 6) / 15)
+
+
+def _local(text: str) -> datetime:
+    moment = datetime.fromisoformat(text)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+class ForecastCache:
+    """JSON file with the last forecast response and its validators."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring forecast cache {self.path}: {e}")
+            return {}
+        if not isinstance(data, dict):
+            logger.warning(f"Ignoring forecast cache {self.path}: not a JSON object")
+            return {}
+        return data if data.get("version") == CACHE_VERSION else {}
+
+    def save(self, entry: dict):
+        save_json(self.path, {"version": CACHE_VERSION, **entry})
+
+
+class PVForecast:
+    """Hourly irradiance forecast as PV kWh per 15-minute bucket."""
+
+    def __init__(self, source: str = "open_meteo", latitude: float = 0.0, longitude: float = 0.0,
+                 url: str = "", file: str = "", kwp: float = 4.0, performance_ratio: float = 0.8,
+                 refresh_seconds: float = 3600, timeout_seconds: float = 10,
+                 cache: ForecastCache | None = None):
+        if source not in ("open_meteo", "file"):
+            raise ValueError(f"Unknown forecast source: {source}")
+        self.source = source
+        self.url = url or OPEN_METEO_URL.format(latitude=latitude, longitude=longitude)
+        self.file = file
+        self.model = PanelModel(kwp, performance_ratio)
+        self.refresh_seconds = refresh_seconds
+        self.timeout = timeout_seconds
+        self.cache = cache
+
+        self.etag = None
+        self.last_modified = None
+        self.expires = 0.0  # epoch seconds
+        self.fetched = None
+        self.series = ForecastSeries()
+
+        if cache is not None:
+            entry = cache.load()
+            if entry:
+                self.etag = entry.get("etag")
+                self.last_modified = entry.get("last_modified")
+                self.expires = entry.get("expires", 0.0)
+                self.fetched = entry.get("fetched")
+                self._parse(entry.get("body", {}))
+
+    @property
+    def available(self) -> bool:
+        return bool(self.series.times)
+
+    @property
+    def times(self) -> tuple:
+        return self.series.times
+
+    @property
+    def irradiance(self) -> tuple:
+        return self.series.irradiance
+
+    @property
+    def cloud_cover(self) -> tuple:
+        return self.series.cloud_cover
+
+    def refresh(self, now: float | None = None) -> bool:
+        """Fetch a new forecast if the current one expired. Returns True if it changed."""
+        now = time.time() if now is None else now
+        if now < self.expires:
+            return False
+        try:
+            if self.source == "file":
+                body, max_age = self._read_file()
+            else:
+                body, max_age = self._fetch()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Forecast refresh failed: {e}")
+            # Try again in a minute rather than on every call
+            self.expires = now + min(60, self.refresh_seconds)
+            return False
+
+        self.expires = now + (self.refresh_seconds if max_age is None else max_age)
+        if body is not None:
+            self._parse(body)
+            self.fetched = datetime.now().isoformat(timespec="seconds")
+        self._save(body)
+        return body is not None
+
+    def _read_file(self):
+        stat = os.stat(self.file)
+        etag = f"{stat.st_mtime_ns}-{stat.st_size}"
+        if etag == self.etag and self.available:
+            return None, None
+        with open(self.file, "r") as f:
+            body = json.load(f)
+        self.etag = etag
+        return body, None
+
+    def _fetch(self):
+        request = urllib.request.Request(self.url, headers={"Accept": "application/json"})
+        if self.etag and self.available:
+            request.add_header("If-None-Match", self.etag)
+        if self.last_modified and self.available:
+            request.add_header("If-Modified-Since", self.last_modified)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = json.load(response)
+                headers = response.headers
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+            return None, self._max_age(e.headers)
+        self.etag = headers.get("ETag")
+        self.last_modified = headers.get("Last-Modified")
+        return body, self._max_age(headers)
+
+    @staticmethod
+    def _max_age(headers) -> float | None:
+        for part in (headers.get("Cache-Control") or "").split(","):
+            name, _, value = part.strip().partition("=")
+            if name.lower() == "max-age" and value.isdigit():
+                # A very short max-age would mean a request every minute
+                return max(int(value), 300)
+        expires = headers.get("Expires")
+        if expires:
+            try:
+                return max(email.utils.parsedate_to_datetime(expires).timestamp() - time.time(), 300)
+            except (TypeError, ValueError):
+                pass
+        return None
+
+    def _parse(self, body: dict):
+        """Read the Open-Meteo "hourly" block (time, shortwave_radiation, cloud_cover)."""
+        hourly = body.get("hourly") if isinstance(body, dict) else None
+        if not isinstance(hourly, dict):
+            return
+        times = [_local(t) for t in hourly.get("time", [])]
+        if not times:
+            return
+        clouds = hourly.get("cloud_cover") or [None] * len(times)
+        radiation = hourly.get("shortwave_radiation")
+        if radiation is None:
+            # Cloud cover only: scale a clear-sky curve (Kasten-Czeplak)
+            radiation = [
+                _clear_sky(t - timedelta(minutes=30)) * (1 - 0.75 * ((c or 0) / 100) ** 3.4)
+                for t, c in zip(times, clouds)
+            ]
+        rows = sorted(zip(times, radiation, clouds))
+        times = tuple(row[0] for row in rows)
+        self.series = ForecastSeries(
+            times,
+            tuple(float(row[1] or 0.0) for row in rows),
+            tuple(row[2] for row in rows),
+            tuple(t - timedelta(minutes=30) for t in times)
+        )
+
+    def _save(self, body):
+        if self.cache is None:
+            return
+        entry = self.cache.load() if body is None else {"body": body}
+        entry.update({
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "expires": self.expires,
+            "fetched": self.fetched
+        })
+        self.cache.save(entry)
+
+    def _power_at(self, series: ForecastSeries, moment: datetime) -> float:
+        """PV kW at `moment`, linear between the hour midpoints."""
+        midpoints, irradiance = series.midpoints, series.irradiance
+        if not midpoints or moment < midpoints[0] - timedelta(minutes=30) \
+                or moment > midpoints[-1] + timedelta(minutes=30):
+            return 0.0
+        index = bisect.bisect_right(midpoints, moment)
+        if index == 0:
+            return self.model.power_kw(irradiance[0], moment.month)
+        if index == len(midpoints):
+            return self.model.power_kw(irradiance[-1], moment.month)
+        before, after = midpoints[index - 1], midpoints[index]
+        share = (moment - before) / (after - before)
+        value = irradiance[index - 1] + share * (irradiance[index] - irradiance[index - 1])
+        return self.model.power_kw(value, moment.month)
+
+    def irradiance_at(self, hour_end: datetime) -> float | None:
+        """Mean irradiance (W/m2) of the hour ending at `hour_end`, if forecast."""
+        series = self.series
+        index = bisect.bisect_left(series.times, hour_end)
+        if index < len(series.times) and series.times[index] == hour_end:
+            return series.irradiance[index]
+        return None
+
+    def pv_kwh(self, start: datetime, buckets: int) -> list:
+        """Expected PV kWh per 15-minute bucket from `start` (0 outside the forecast)."""
+        series = self.series
+        half = timedelta(minutes=BUCKET_MINUTES / 2)
+        return [
+            self._power_at(series, start + timedelta(minutes=n * BUCKET_MINUTES) + half) * BUCKET_MINUTES / 60
+            for n in range(buckets)
+        ]
+
+    def daily_kwh(self, day: date) -> float:
+        """Expected PV kWh for one calendar day."""
+        start = datetime.combine(day, datetime.min.time())
+        return sum(self.pv_kwh(start, int(24 * 60 / BUCKET_MINUTES)))
+
+    def hourly_kwh(self, day: date) -> list:
+        """Expected PV kWh per hour of one calendar day (24 values)."""
+        start = datetime.combine(day, datetime.min.time())
+        quarters = self.pv_kwh(start, int(24 * 60 / BUCKET_MINUTES))
+        per_hour = 60 // BUCKET_MINUTES
+        return [sum(quarters[h * per_hour:(h + 1) * per_hour]) for h in range(24)]
+
+    def sunny_hours(self, day: date) -> int:
+        """Hours from 07:00 to 20:00 with little cloud, like the old trigger sensor."""
+        count = 0
+        series = self.series
+        for moment, irradiance, cloud in zip(series.times, series.irradiance, series.cloud_cover):
+            hour = moment - timedelta(hours=1)
+            if hour.date() != day or not SUNNY_FIRST_HOUR <= hour.hour <= SUNNY_LAST_HOUR:
+                continue
+            if cloud is not None:
+                count += cloud <= SUNNY_MAX_CLOUD_COVER
+            else:
+                count += irradiance >= 300
+        return count
@@ -0,0 +1,379 @@
+"""
+Tariefbewust laden en ontladen over een tijdgrid van 15 minuten.
+
+ROADMAP FASE 2 (Engie tarievenplan: piek/dal/superdal). Het nachtladen
+laadt met een vast vermogen in een vast venster; de optimizer kijkt in
+plaats daarvan 24-48 uur vooruit, per kwartier:
+
+    prijs (tarief periode), verwachte PV, verwacht verbruik
+
+en zoekt met dynamic programming over de opgeslagen energie van alle
+batterijen samen het goedkoopste pad:
+
+    kosten(t) = netafname x inkoopprijs - teruglevering x terugleverprijs
+    netto(t)  = verbruik - PV + laden / rendement - ontladen x rendement
+
+De energie is gediscretiseerd in stappen van energy_step_kwh, de acties
+per kwartier in dezelfde stappen tot het max vermogen. Per kwartier wordt
+de hele (toestand x actie) matrix in één keer doorgerekend, met NumPy
+gevectoriseerd (zonder NumPy dezelfde lussen in Python, trager).
+
+Het pad van het totaal wordt per kwartier over de batterijen verdeeld met
+allocate() uit de planner, en de eerste 24 uur per batterij samengevoegd
+tot manual_cfg slots (zelfde vermogen achter elkaar = één slot).
+"""
+
+import math
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from .planner import NUMPY_AVAILABLE, STRATEGY_BALANCED, allocate
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
+BUCKET_MINUTES = 15
+BUCKET_HOURS = BUCKET_MINUTES / 60
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+DEFAULT_OPTIMIZER_CONFIG = {
+    "horizon_hours": 24,
+    "capacity_kwh": 5.0,
+    "max_charge_w": 2500,
+    "max_discharge_w": 2500,
+    "min_soc": 15,
+    "charge_efficiency": 0.92,
+    "discharge_efficiency": 0.92,
+    "energy_step_kwh": 0.05,
+    "power_step_w": 50,
+    "base_load_w": 300,
+    "peak_price": 0.35,
+    "export_price": 0.05,
+    # Value of energy left in the batteries at the end of the horizon
+    # (None: cheapest import price x discharge efficiency)
+    "terminal_value": None,
+    "tariffs": (),
+    "slots": (0, 1, 2, 3, 4, 5, 6, 7, 8),
+    "split": STRATEGY_BALANCED,
+}
+
+
+def _minutes(text: str) -> int:
+    hours, minutes = (int(part) for part in str(text).split(":")[:2])
+    return hours * 60 + minutes
+
+
+def _clock(minutes: int) -> str:
+    minutes %= 1440
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def bucket_start(now: datetime) -> datetime:
+    """Start of the 15-minute bucket containing `now`."""
+    return now.replace(minute=now.minute - now.minute % BUCKET_MINUTES, second=0, microsecond=0)
+
+
+def price_grid(start: datetime, buckets: int, tariffs, peak_price: float) -> list:
+    """Import price per bucket.
+
+    `tariffs` is a list of {"name", "start", "end", "price", "days"}
+    periods (times may cross midnight, days optional). Periods are checked
+    in order and the last match wins, so superdal goes after dal; outside
+    every period the peak price applies.
+    """
+    periods = [
+        (_minutes(t["start"]), _minutes(t["end"]), float(t["price"]),
+         {str(d).lower()[:3] for d in t.get("days") or WEEKDAYS})
+        for t in tariffs
+    ]
+    prices = []
+    for n in range(buckets):
+        moment = start + timedelta(minutes=n * BUCKET_MINUTES)
+        minute = moment.hour * 60 + moment.minute
+        day = WEEKDAYS[moment.weekday()]
+        price = peak_price
+        for begin, end, value, days in periods:
+            if begin <= end:
+                inside = begin <= minute < end
+            else:
+                inside = minute >= begin or minute < end
+            # A period crossing midnight belongs to the day it started on
+            weekday = day if not (begin > end and minute < end) else WEEKDAYS[moment.weekday() - 1]
+            if inside and weekday in days:
+                price = value
+        prices.append(price)
+    return prices
+
+
+def pv_profile(total_kwh: float, start: datetime, buckets: int,
+               sunrise: str = "07:00", sunset: str = "21:00") -> list:
+    """Spread a daily PV total over the day as a sine between sunrise and sunset."""
+    rise, set_ = _minutes(sunrise), _minutes(sunset)
+    weights = []
+    for n in range(buckets):
+        moment = start + timedelta(minutes=n * BUCKET_MINUTES + BUCKET_MINUTES / 2)
+        minute = moment.hour * 60 + moment.minute
+        inside = rise < minute < set_
+        weights.append(math.sin(math.pi * (minute - rise) / (set_ - rise)) if inside else 0.0)
+    per_day = sum(weights[:int(24 * 60 / BUCKET_MINUTES)]) or 1.0
+    return [total_kwh * w / per_day for w in weights]
+
+
+def _round_power(watts, caps, step: int) -> list:
+    """Round watts to multiples of `step` with the largest-remainder method.
+
+    The total stays the rounded sum of `watts`, so the batteries together
+    follow the optimised path; no battery goes over its cap (in watts).
+    """
+    target = round(sum(watts) / step)
+    limits = [math.floor(cap / step + 1e-9) for cap in caps]
+    units = [min(math.floor(w / step + 1e-9), limit) for w, limit in zip(watts, limits)]
+    missing = target - sum(units)
+    for i in sorted(range(len(watts)), key=lambda i: watts[i] / step - units[i], reverse=True):
+        if missing <= 0:
+            break
+        if units[i] < limits[i]:
+            units[i] += 1
+            missing -= 1
+    return [unit * step for unit in units]
+
+
+def _policy_numpy(load, pv, prices, export_price, lo, hi, actions, step, eta_c, eta_d, terminal):
+    states = np.arange(hi + 1)
+    k = np.asarray(actions)
+    stored = k * step
+    battery = np.where(k > 0, stored / eta_c, stored * eta_d)
+    net = (np.asarray(load) - np.asarray(pv))[:, None] + battery[None, :]
+    prices = np.asarray(prices)[:, None]
+    cost = np.where(net > 0, net * prices, net * export_price)  # (T, A)
+
+    target = states[:, None] + k[None, :]
+    valid = (target <= hi) & ((target >= lo) | (k[None, :] >= 0)) & (target >= 0)
+    target = np.clip(target, 0, hi)
+
+    value = -states * step * terminal
+    policy = np.empty((len(prices), hi + 1), dtype=np.int16)
+    for t in range(len(prices) - 1, -1, -1):
+        q = np.where(valid, cost[t][None, :] + value[target], np.inf)
+        best = np.argmin(q, axis=1)
+        policy[t] = best
+        value = q[states, best]
+    return policy
+
+
+def _policy_python(load, pv, prices, export_price, lo, hi, actions, step, eta_c, eta_d, terminal):
+    value = [-s * step * terminal for s in range(hi + 1)]
+    policy = [None] * len(prices)
+    for t in range(len(prices) - 1, -1, -1):
+        costs = []
+        for k in actions:
+            net = load[t] - pv[t] + (k * step / eta_c if k > 0 else k * step * eta_d)
+            costs.append(net * prices[t] if net > 0 else net * export_price)
+        best_actions, best_values = [], []
+        for s in range(hi + 1):
+            best, best_value = 0, math.inf
+            for a, k in enumerate(actions):
+                target = s + k
+                if target > hi or target < 0 or (target < lo and k < 0):
+                    continue
+                q = costs[a] + value[target]
+                if q < best_value:
+                    best, best_value = a, q
+            best_actions.append(best)
+            best_values.append(best_value)
+        policy[t] = best_actions
+        value = best_values
+    return policy
+
+
+@dataclass(slots=True)
+class TariffPlan:
+    """Optimised charge (-) / discharge (+) power per battery per bucket."""
+
+    start: datetime
+    prices: list
+    pv_kwh: list
+    load_kwh: list
+    power: dict = field(default_factory=dict)  # battery key -> [W per bucket]
+    stored_kwh: list = field(default_factory=list)  # total, per bucket boundary
+    cost: float = 0.0
+    baseline_cost: float = 0.0
+    slots: tuple = ()
+    dropped: int = 0  # segments that did not fit in the slots
+
+    @property
+    def charged_kwh(self) -> float:
+        return sum(-w for powers in self.power.values() for w in powers if w < 0) * BUCKET_HOURS / 1000
+
+    @property
+    def discharged_kwh(self) -> float:
+        return sum(w for powers in self.power.values() for w in powers if w > 0) * BUCKET_HOURS / 1000
+
+    @property
+    def savings(self) -> float:
+        return self.baseline_cost - self.cost
+
+    @property
+    def summary(self) -> str:
+        if not self.charged_kwh and not self.discharged_kwh:
+            return "Geen acties"
+        return (f"Laden {self.charged_kwh:.1f}kWh, ontladen {self.discharged_kwh:.1f}kWh, "
+                f"besparing €{self.savings:.2f}")
+
+    def segments(self, key: str) -> list:
+        """(start bucket, buckets, power) runs of equal non-zero power, first 24h."""
+        powers = self.power[key][:int(24 * 60 / BUCKET_MINUTES)]
+        runs = []
+        n = 0
+        while n < len(powers):
+            end = n
+            while end < len(powers) and powers[end] == powers[n]:
+                end += 1
+            if powers[n]:
+                runs.append((n, end - n, powers[n]))
+            n = end
+        return runs
+
+    def schedule(self) -> dict:
+        """Payload for marstek/command/schedule with the first 24h as daily slots.
+
+        Marstek slot power: negative = charge, positive = discharge. With
+        more runs than slots the runs with the least energy are left out.
+        """
+        offset = self.start.hour * 60 + self.start.minute
+        batteries = {}
+        self.dropped = 0
+        for key in self.power:
+            runs = self.segments(key)
+            keep = sorted(runs, key=lambda run: run[1] * abs(run[2]), reverse=True)[:len(self.slots)]
+            self.dropped += len(runs) - len(keep)
+            batteries[key] = [
+                {
+                    "time_num": slot,
+                    "start_time": _clock(offset + first * BUCKET_MINUTES),
+                    "end_time": _clock(offset + (first + length) * BUCKET_MINUTES),
+                    "power": power,
+                    "enabled": True
+                }
+                for slot, (first, length, power) in zip(self.slots, sorted(keep))
+            ]
+        return {"batteries": batteries, "clear_unused": True, "mode": "manual"}
+
+    def as_dict(self) -> dict:
+        schedule = self.schedule()
+        return {
+            "start": self.start.isoformat(timespec="minutes"),
+            "bucket_minutes": BUCKET_MINUTES,
+            "cost": round(self.cost, 2),
+            "baseline_cost": round(self.baseline_cost, 2),
+            "savings": round(self.savings, 2),
+            "charged": round(self.charged_kwh, 2),
+            "discharged": round(self.discharged_kwh, 2),
+            "dropped_segments": self.dropped,
+            "prices": self.prices,
+            "power": self.power,
+            "schedule": schedule
+        }
+
+
+class TariffOptimizer:
+    """Cheapest charge/discharge path for the batteries over a price grid."""
+
+    def __init__(self, capacities: dict | None = None, **settings):
+        unknown = set(settings) - set(DEFAULT_OPTIMIZER_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown optimizer settings: {', '.join(sorted(unknown))}")
+        self.settings = {**DEFAULT_OPTIMIZER_CONFIG, **settings}
+        if not 1 <= self.settings["horizon_hours"] <= 48:
+            raise ValueError("horizon_hours must be between 1 and 48")
+        # Battery key -> usable capacity in kWh (default: capacity_kwh)
+        self.capacities = capacities or {}
+
+    @property
+    def buckets(self) -> int:
+        """Number of buckets in the horizon."""
+        return int(self.settings["horizon_hours"] * 60 / BUCKET_MINUTES)
+
+    def optimise(self, batteries, now: datetime | None = None, pv_kwh=None, load_kwh=None,
+                 prices=None) -> TariffPlan:
+        """Plan from the current SOCs.
+
+        pv_kwh, load_kwh and prices are per-bucket sequences from now on
+        (shorter ones are padded with zero PV, base_load_w and the tariff
+        prices). Batteries without a known SOC are left out.
+        """
+        s = self.settings
+        start = bucket_start(now or datetime.now())
+        buckets = self.buckets
+
+        grid = price_grid(start, buckets, s["tariffs"], s["peak_price"])
+        prices = list(prices or [])[:buckets] + grid[len(prices or []):]
+        pv = list(pv_kwh or [])[:buckets]
+        pv += [0.0] * (buckets - len(pv))
+        base = s["base_load_w"] / 1000 * BUCKET_HOURS
+        load = list(load_kwh or [])[:buckets]
+        load += [base] * (buckets - len(load))
+
+        batteries = [b for b in batteries if b.known]
+        capacity = [self.capacities.get(b.key, s["capacity_kwh"]) for b in batteries]
+        stored = [cap * b.soc / 100 for b, cap in zip(batteries, capacity)]
+        floor = [cap * s["min_soc"] / 100 for cap in capacity]
+
+        step = s["energy_step_kwh"]
+        hi = int(sum(capacity) / step)
+        lo = min(math.ceil(sum(floor) / step), hi)
+        start_state = min(round(sum(stored) / step), hi)
+        charge_steps = int(len(batteries) * s["max_charge_w"] / 1000 * BUCKET_HOURS / step)
+        discharge_steps = int(len(batteries) * s["max_discharge_w"] / 1000 * BUCKET_HOURS / step)
+        # Idle first, then growing steps: ties resolve to the smallest action
+        actions = [0]
+        for k in range(1, max(charge_steps, discharge_steps) + 1):
+            actions += ([k] if k <= charge_steps else []) + ([-k] if k <= discharge_steps else [])
+
+        eta_c, eta_d = s["charge_efficiency"], s["discharge_efficiency"]
+        terminal = s["terminal_value"]
+        if terminal is None:
+            terminal = min(prices) * eta_d
+        export = s["export_price"]
+
+        plan = TariffPlan(start, prices, pv, load, slots=tuple(s["slots"]))
+        plan.power = {b.key: [0] * buckets for b in batteries}
+        baseline = [ld - p for ld, p in zip(load, pv)]
+        plan.baseline_cost = sum(n * p if n > 0 else n * export for n, p in zip(baseline, prices))
+        if not batteries:
+            plan.cost = plan.baseline_cost
+            return plan
+
+        solve = _policy_numpy if NUMPY_AVAILABLE else _policy_python
+        policy = solve(load, pv, prices, export, lo, hi, actions, step, eta_c, eta_d, terminal)
+
+        state = start_state
+        plan.stored_kwh.append(state * step)
+        room_limit = [s["max_charge_w"] / 1000 * BUCKET_HOURS] * len(batteries)
+        drain_limit = [s["max_discharge_w"] / 1000 * BUCKET_HOURS] * len(batteries)
+        for t in range(buckets):
+            k = actions[int(policy[t][state])]
+            state += k
+            plan.stored_kwh.append(state * step)
+            amount = abs(k) * step
+            net = load[t] - pv[t] + (amount / eta_c if k > 0 else -amount * eta_d)
+            plan.cost += net * prices[t] if net > 0 else net * export
+            if not k:
+                continue
+
+            # Split the total over the batteries and track each one
+            if k > 0:
+                room = [cap - e for cap, e in zip(capacity, stored)]
+                limit = [min(r, m) for r, m in zip(room, room_limit)]
+            else:
+                room = [e - f for e, f in zip(stored, floor)]
+                limit = [max(min(r, m), 0.0) for r, m in zip(room, drain_limit)]
+            shares = allocate(room, limit, amount, s["split"])
+            watts = _round_power([share / BUCKET_HOURS * 1000 for share in shares],
+                                 [m / BUCKET_HOURS * 1000 for m in limit], s["power_step_w"])
+            sign = 1 if k > 0 else -1
+            for i, (battery, w) in enumerate(zip(batteries, watts)):
+                stored[i] += sign * w / 1000 * BUCKET_HOURS
+                plan.power[battery.key][t] = -sign * int(w)
+        return plan
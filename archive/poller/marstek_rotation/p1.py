@@ -0,0 +1,158 @@
+"""
+P1 meter stream met hysteresis regels.
+
+In HA evalueert elke automation met een `numeric_state` trigger en `for:`
+op sensor.p1_meter_power elke state change apart. Hier komt elke P1 meting
+één keer binnen. De meting gaat in een ring buffer en alle regels (zon,
+net, overflow start/stop) worden in één pass bijgewerkt.
+
+Een regel vuurt één event zodra zijn conditie `hold_seconds` aanhoudt
+(zoals `for:` in HA). Hij vuurt pas opnieuw als de conditie eerst is
+losgelaten. Met een aparte `release` drempel is dat echte hysteresis: de
+conditie blijft actief tot de release drempel gepasseerd is.
+"""
+
+import time
+from array import array
+from dataclasses import dataclass
+
+# Rule directions
+BELOW = "below"
+ABOVE = "above"
+
+# Event names used by the rotation engine and the HA automations
+EVENT_SOLAR_EXCESS = "solar_excess"
+EVENT_GRID_CONSUMPTION = "grid_consumption"
+EVENT_OVERFLOW_START = "overflow_start"
+EVENT_OVERFLOW_STOP = "overflow_stop"
+
+
+@dataclass(slots=True)
+class HysteresisRule:
+    """Condition on P1 power that must hold for hold_seconds."""
+
+    name: str
+    direction: str
+    threshold: float
+    hold_seconds: float = 0.0
+    release: float | None = None
+    # Runtime state
+    active_since: float | None = None
+    fired: bool = False
+
+    def update(self, power: float, now: float) -> bool:
+        """Apply one sample. Returns True when the rule fires."""
+        if self.direction == BELOW:
+            entering = power < self.threshold
+            leaving = power >= (self.threshold if self.release is None else self.release)
+        else:
+            entering = power > self.threshold
+            leaving = power <= (self.threshold if self.release is None else self.release)
+
+        if self.active_since is None:
+            if not entering:
+                return False
+            self.active_since = now
+        elif leaving:
+            self.active_since = None
+            self.fired = False
+            return False
+
+        if not self.fired and now - self.active_since >= self.hold_seconds:
+            self.fired = True
+            return True
+        return False
+
+    @property
+    def held(self) -> bool:
+        """Condition has held long enough (and is still holding)."""
+        return self.fired
+
+
+@dataclass(slots=True)
+class P1Event:
+    """A rule that fired."""
+
+    name: str
+    power: float
+    mean_power: float
+    timestamp: float
+
+    def as_dict(self) -> dict:
+        return {
+            "event": self.name,
+            "power": self.power,
+            "mean_power": round(self.mean_power, 1),
+            "timestamp": self.timestamp
+        }
+
+
+class P1Stream:
+    """Ring buffer of P1 samples with one-pass rule evaluation."""
+
+    def __init__(self, rules: list, capacity: int = 600):
+        self.rules = {rule.name: rule for rule in rules}
+        self.capacity = capacity
+        self._times = array("d", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+        self._next = 0
+        self._count = 0
+        self._listeners = []
+
+    def subscribe(self, callback):
+        """Call callback(event) for every fired rule."""
+        self._listeners.append(callback)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def last(self) -> float | None:
+        if not self._count:
+            return None
+        return self._values[(self._next - 1) % self.capacity]
+
+    def push(self, power: float, now: float | None = None) -> list:
+        """Add a sample and evaluate all rules. Returns fired events."""
+        now = time.monotonic() if now is None else now
+        self._times[self._next] = now
+        self._values[self._next] = power
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        return self._evaluate(power, now)
+
+    def tick(self, now: float | None = None) -> list:
+        """Re-evaluate with the last sample, so hold times expire without new data."""
+        if not self._count:
+            return []
+        return self._evaluate(self.last, time.monotonic() if now is None else now)
+
+    def _evaluate(self, power: float, now: float) -> list:
+        events = []
+        for rule in self.rules.values():
+            if rule.update(power, now):
+                window = rule.hold_seconds or 1.0
+                events.append(P1Event(rule.name, power, self.mean(window, now), now))
+        for event in events:
+            for callback in self._listeners:
+                callback(event)
+        return events
+
+    def held(self, name: str) -> bool:
+        return self.rules[name].held
+
+    def mean(self, seconds: float, now: float | None = None) -> float:
+        """Mean power over the last `seconds` (newest sample if none fall in)."""
+        if not self._count:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        total = 0.0
+        n = 0
+        index = self._next
+        for _ in range(self._count):
+            index = (index - 1) % self.capacity
+            if now - self._times[index] > seconds:
+                break
+            total += self._values[index]
+            n += 1
+        return total / n if n else self.last
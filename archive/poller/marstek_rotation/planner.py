@@ -0,0 +1,234 @@
+"""
+Nachtladen planner: verdeelt het laadtekort over de batterijen.
+
+Vervangt de `charging_plan` Jinja loop uit "Marstek: Night Charging" en de
+fase_*_charge attributen van "Marstek Charging Plan", die per batterij
+opnieuw de rangorde bepaalden en alleen voor precies drie batterijen
+werkten. Hier gaat de verdeling in één keer over arrays, voor elk aantal
+batterijen:
+
+    tekort = gewenste capaciteit - huidige capaciteit - verwachte PV
+    ruimte = capaciteit - huidige capaciteit          (per batterij)
+    limiet = min(ruimte, max vermogen x nachturen)    (per batterij)
+
+Strategieën:
+- greedy: de batterij met de meeste ruimte eerst vol, dan de volgende
+  (zoals de oude template). Weinig batterijen laden, op hoger vermogen.
+- balanced: elke batterij krijgt evenveel (water-filling), begrensd door
+  zijn limiet. Zo laag mogelijk vermogen per batterij.
+
+Beide zijn een gesloten vorm (sorteren + cumulatieve som). Met NumPy draait
+dat gevectoriseerd; zonder NumPy met dezelfde stappen in pure Python.
+
+Anders dan de template houdt de limiet rekening met het max vermogen:
+wat niet binnen de nacht past wordt als `unmet_kwh` gemeld in plaats van
+stil afgekapt op 2500W.
+"""
+
+from dataclasses import dataclass, field
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+STRATEGY_GREEDY = "greedy"
+STRATEGY_BALANCED = "balanced"
+
+DEFAULT_PLANNER_CONFIG = {
+    "capacity_kwh": 5.0,
+    "max_power_w": 2500,
+    "min_charge_kwh": 0.1,
+    "strategy": STRATEGY_GREEDY,
+    "desired_total_kwh": 10.0,
+    "expected_pv_kwh": 0.0,
+    "night_start": "23:00",
+    "night_end": "07:00",
+    "slot": 0,
+}
+
+
+def night_hours(start: str, end: str) -> float:
+    """Length of the night window in hours ("23:00" - "07:00" = 8.0)."""
+    start_h, start_m = (int(part) for part in start.split(":")[:2])
+    end_h, end_m = (int(part) for part in end.split(":")[:2])
+    minutes = (end_h * 60 + end_m) - (start_h * 60 + start_m)
+    return (minutes % 1440 or 1440) / 60
+
+
+def _allocate_numpy(room, limit, deficit: float, strategy: str):
+    room = np.asarray(room, dtype=float)
+    limit = np.asarray(limit, dtype=float)
+    charge = np.zeros_like(limit)
+    if deficit <= 0 or not len(limit):
+        return charge
+
+    if strategy == STRATEGY_BALANCED:
+        # Water level L with sum(min(limit, L)) == deficit
+        order = np.argsort(limit, kind="stable")
+        ordered = limit[order]
+        before = np.concatenate(([0.0], np.cumsum(ordered)[:-1]))
+        levels = (deficit - before) / (len(ordered) - np.arange(len(ordered)))
+        fits = np.nonzero(levels <= ordered)[0]
+        level = levels[fits[0]] if len(fits) else ordered[-1]
+        return np.minimum(limit, level)
+
+    # Greedy: most room first; stable sort keeps config order on ties
+    order = np.argsort(-room, kind="stable")
+    ordered = limit[order]
+    before = np.cumsum(ordered) - ordered
+    charge[order] = np.clip(deficit - before, 0.0, ordered)
+    return charge
+
+
+def _allocate_python(room, limit, deficit: float, strategy: str) -> list:
+    charge = [0.0] * len(limit)
+    if deficit <= 0 or not limit:
+        return charge
+
+    if strategy == STRATEGY_BALANCED:
+        order = sorted(range(len(limit)), key=lambda i: limit[i])
+        remaining = deficit
+        level = limit[order[-1]]
+        for n, i in enumerate(order):
+            share = remaining / (len(order) - n)
+            if share <= limit[i]:
+                level = share
+                break
+            remaining -= limit[i]
+        return [min(value, level) for value in limit]
+
+    remaining = deficit
+    for i in sorted(range(len(room)), key=lambda i: -room[i]):
+        charge[i] = min(remaining, limit[i])
+        remaining -= charge[i]
+    return charge
+
+
+def allocate(room, limit, deficit: float, strategy: str = STRATEGY_GREEDY) -> list:
+    """Split `deficit` kWh over batteries with `room` kWh and `limit` kWh each."""
+    if strategy not in (STRATEGY_GREEDY, STRATEGY_BALANCED):
+        raise ValueError(f"Unknown planner strategy: {strategy}")
+    if NUMPY_AVAILABLE:
+        return _allocate_numpy(room, limit, deficit, strategy).tolist()
+    return _allocate_python(list(room), list(limit), deficit, strategy)
+
+
+@dataclass(slots=True)
+class BatteryCharge:
+    """Planned night charge for one battery."""
+
+    key: str
+    label: str
+    room_kwh: float
+    charge_kwh: float
+    power_w: int
+
+    def as_dict(self) -> dict:
+        return {
+            "key": self.key,
+            "name": self.label,
+            "room": round(self.room_kwh, 2),
+            "charge": round(self.charge_kwh, 2),
+            "power": self.power_w
+        }
+
+
+@dataclass(slots=True)
+class ChargePlan:
+    """Outcome of one planning run."""
+
+    charges: list = field(default_factory=list)
+    deficit_kwh: float = 0.0
+    hours: float = 0.0
+    start: str = "23:00"
+    end: str = "07:00"
+    slot: int = 0
+
+    @property
+    def planned_kwh(self) -> float:
+        return sum(c.charge_kwh for c in self.charges)
+
+    @property
+    def unmet_kwh(self) -> float:
+        return max(self.deficit_kwh - self.planned_kwh, 0.0)
+
+    @property
+    def summary(self) -> str:
+        """Short text like the old template state ("Fase A:1.2kWh@300W | ...")."""
+        parts = [
+            f"{c.label}:{c.charge_kwh:.1f}kWh@{c.power_w}W"
+            for c in self.charges if c.power_w
+        ]
+        return " | ".join(parts) if parts else "Geen laden nodig"
+
+    def schedule(self) -> dict:
+        """Payload for marstek/command/schedule: the plan slot per battery."""
+        return {
+            "batteries": {
+                c.key: [{
+                    "time_num": self.slot,
+                    "start_time": self.start,
+                    "end_time": self.end,
+                    "power": -c.power_w,
+                    "enabled": c.power_w > 0
+                }]
+                for c in self.charges
+            },
+            "clear_unused": True,
+            "mode": "manual"
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            "deficit": round(self.deficit_kwh, 2),
+            "planned": round(self.planned_kwh, 2),
+            "unmet": round(self.unmet_kwh, 2),
+            "hours": round(self.hours, 2),
+            "start": self.start,
+            "end": self.end,
+            "batteries": [c.as_dict() for c in self.charges],
+            "schedule": self.schedule()
+        }
+
+
+class NightChargePlanner:
+    """Plans the night charge for a list of BatteryState objects."""
+
+    def __init__(self, capacities: dict | None = None, **settings):
+        unknown = set(settings) - set(DEFAULT_PLANNER_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown planner settings: {', '.join(sorted(unknown))}")
+        self.settings = {**DEFAULT_PLANNER_CONFIG, **settings}
+        # Battery key -> usable capacity in kWh (default: capacity_kwh)
+        self.capacities = capacities or {}
+
+    def plan(self, batteries, **inputs) -> ChargePlan:
+        """Plan with the current SOCs; `inputs` override settings for this run.
+
+        A battery without a known SOC counts as full, like the template's
+        float(5) fallback.
+        """
+        s = {**self.settings, **inputs}
+        hours = night_hours(s["night_start"], s["night_end"])
+        batteries = list(batteries)
+
+        capacity = [self.capacities.get(b.key, s["capacity_kwh"]) for b in batteries]
+        remaining = [
+            cap * b.soc / 100 if b.known else cap
+            for b, cap in zip(batteries, capacity)
+        ]
+        room = [max(cap - rem, 0.0) for cap, rem in zip(capacity, remaining)]
+        limit = [min(r, s["max_power_w"] / 1000 * hours) for r in room]
+        deficit = max(s["desired_total_kwh"] - sum(remaining) - s["expected_pv_kwh"], 0.0)
+
+        charge = allocate(room, limit, deficit, s["strategy"])
+        plan = ChargePlan(deficit_kwh=deficit, hours=hours, start=s["night_start"][:5],
+                          end=s["night_end"][:5], slot=s["slot"])
+        for battery, r, c in zip(batteries, room, charge):
+            if c <= s["min_charge_kwh"]:
+                c = 0.0
+            power = min(int(c / hours * 1000), s["max_power_w"]) if c else 0
+            plan.charges.append(BatteryCharge(battery.key, battery.label, r, c, power))
+        return plan
@@ -0,0 +1,152 @@
+"""
+Registry van alle batterijen uit de `batteries:` config, met heaps voor de
+leegste en volste batterij.
+
+Elke SOC of availability update zet een nieuwe entry op beide heaps en
+maakt de vorige ongeldig (lazy deletion via een versienummer). Opvragen
+gooit verouderde entries van de top, dus beide kosten O(log N), ook met
+6 of 12 batterijen.
+"""
+
+import heapq
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class BatteryState:
+    """Last known state of one battery."""
+
+    key: str
+    label: str
+    device_id: str
+    soc: float | None = None
+    mode: str | None = None
+    available: bool = True
+
+    @property
+    def known(self) -> bool:
+        """Battery has a SOC and is online."""
+        return self.available and self.soc is not None
+
+
+def battery_key(battery: dict) -> str:
+    """Rotation key for a configured battery ("Fase A" -> "fase_a")."""
+    return battery.get("rotation_id", battery["name"].lower().replace(" ", "_"))
+
+
+class BatteryRegistry:
+    """Any number of batteries, with O(log N) emptiest/fullest lookups."""
+
+    def __init__(self, batteries: list):
+        self._batteries = {}
+        self._order = {}
+        self._versions = {}
+        self._min_heap = []
+        self._max_heap = []
+
+        for battery in batteries:
+            key = battery_key(battery)
+            if key in self._batteries:
+                raise ValueError(f"Duplicate battery key: {key}")
+            self._batteries[key] = BatteryState(
+                key=key,
+                label=battery.get("label", battery["name"]),
+                device_id=battery.get("device_id", key)
+            )
+            self._order[key] = len(self._order)
+            self._versions[key] = 0
+
+    def __len__(self) -> int:
+        return len(self._batteries)
+
+    def __iter__(self):
+        return iter(self._batteries.values())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._batteries
+
+    def __getitem__(self, key: str) -> BatteryState:
+        return self._batteries[key]
+
+    @property
+    def all_known(self) -> bool:
+        return all(battery.known for battery in self._batteries.values())
+
+    def update_soc(self, key: str, soc: float) -> bool:
+        """Record a SOC reading. Returns False if nothing changed."""
+        battery = self._batteries[key]
+        if battery.soc == soc:
+            return False
+        battery.soc = soc
+        self._reindex(battery)
+        return True
+
+    def set_available(self, key: str, available: bool) -> bool:
+        """Record availability. Returns False if nothing changed."""
+        battery = self._batteries[key]
+        if battery.available == available:
+            return False
+        battery.available = available
+        self._reindex(battery)
+        return True
+
+    def _reindex(self, battery: BatteryState):
+        """Invalidate the battery's heap entries and push fresh ones."""
+        key = battery.key
+        version = self._versions[key] + 1
+        self._versions[key] = version
+        if battery.known:
+            order = self._order[key]
+            heapq.heappush(self._min_heap, (battery.soc, order, key, version))
+            heapq.heappush(self._max_heap, (-battery.soc, order, key, version))
+
+        # Stale entries are normally dropped on lookup; rebuild if a battery
+        # that is never at the top keeps piling them up
+        if len(self._min_heap) > 4 * len(self._batteries) + 16:
+            self._min_heap = self._compact(self._min_heap)
+            self._max_heap = self._compact(self._max_heap)
+
+    def _compact(self, heap: list) -> list:
+        valid = [entry for entry in heap if self._versions[entry[2]] == entry[3]]
+        heapq.heapify(valid)
+        return valid
+
+    def _peek(self, heap: list, exclude: str | None) -> BatteryState | None:
+        """Top of a heap, skipping stale entries and the excluded key."""
+        versions = self._versions
+        while heap and versions[heap[0][2]] != heap[0][3]:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        if heap[0][2] != exclude:
+            return self._batteries[heap[0][2]]
+
+        # Excluded battery is on top: look one below it and put it back
+        held = heapq.heappop(heap)
+        while heap and versions[heap[0][2]] != heap[0][3]:
+            heapq.heappop(heap)
+        result = self._batteries[heap[0][2]] if heap else None
+        heapq.heappush(heap, held)
+        return result
+
+    def emptiest(self, exclude: str | None = None, below: float | None = None) -> BatteryState | None:
+        """Online battery with the lowest SOC.
+
+        exclude skips one battery (e.g. the active one); with below, the
+        result must have a SOC under that limit (room to charge).
+        """
+        battery = self._peek(self._min_heap, exclude)
+        if battery is None or (below is not None and battery.soc >= below):
+            return None
+        return battery
+
+    def fullest(self, exclude: str | None = None, above: float | None = None) -> BatteryState | None:
+        """Online battery with the highest SOC.
+
+        exclude skips one battery; with above, the result must have a SOC
+        over that limit (enough left to discharge).
+        """
+        battery = self._peek(self._max_heap, exclude)
+        if battery is None or (above is not None and battery.soc <= above):
+            return None
+        return battery
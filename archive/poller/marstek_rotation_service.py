@@ -0,0 +1,613 @@
+#!/usr/bin/env python3
+"""
+Marstek Rotation Service
+
+Leest de battery state van de MQTT poller en de P1 meter via MQTT, houdt
+alles in één RotationEngine bij en publiceert de leegste/volste batterij en
+de rotatie beslissing als Home Assistant entities (MQTT discovery).
+
+Vervangt de Jinja templates "Battery Emptiest", "Battery Fullest" en
+"Marstek All Batteries Full" uit battery-rotation.yaml; de entity IDs
+blijven gelijk zodat bestaande automations blijven werken. De P1 triggers
+(zonoverschot, netverbruik, overflow start/stop) komen als events op
+<topic_prefix>/event.
+
+Daarnaast rekent de NightChargePlanner het nachtlaadplan door en publiceert
+het als sensor.marstek_charging_plan, met het marstek/command/schedule
+payload als attribuut (vervangt de charging_plan templates). Met
+optimizer.enabled rekent de TariffOptimizer elk kwartier een laad/ontlaad
+plan over de tariefperiodes door (sensor.marstek_tariff_plan). Met
+forecast.source haalt de service zelf de PV verwachting op (per kwartier)
+en publiceert sensor.marstek_expected_pv_tomorrow. Met calibration.source
+wordt het panel model elk uur bijgesteld met de gemeten productie uit de HA
+recorder (sensor.marstek_pv_calibration).
+
+Gebruik:
+    python marstek_rotation_service.py [--config config.yaml]
+
+Author: Marstek Battery Rotation Project
+License: MIT
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import signal
+import sys
+import logging
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from marstek_poller import MQTT_AVAILABLE, load_config
+from marstek_rotation import (
+    DsmrReader,
+    ForecastCache,
+    NightChargePlanner,
+    PVCalibration,
+    PVForecast,
+    RecorderHistory,
+    RotationEngine,
+    TariffOptimizer,
+    battery_key,
+    bucket_start,
+    pv_profile,
+)
+
+if MQTT_AVAILABLE:
+    import paho.mqtt.client as mqtt
+
+
+# P1 power topic, e.g. from HA mqtt_statestream (base_topic: homeassistant_states)
+DEFAULT_P1_TOPIC = "homeassistant_states/sensor/p1_meter_power/state"
+
+# Planner inputs from HA (mqtt_statestream): topic -> planner setting
+DEFAULT_PLANNER_TOPICS = {
+    "desired_total_kwh": "homeassistant_states/input_number/desired_total_capacity/state",
+    "expected_pv_kwh": "homeassistant_states/sensor/marstek_expected_pv_tomorrow/state",
+    "night_start": "homeassistant_states/input_datetime/night_mode_start_time/state",
+    "night_end": "homeassistant_states/input_datetime/day_mode_start_time/state",
+}
+
+
+class RotationService:
+    """Feeds MQTT state into a RotationEngine and publishes its decisions."""
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.running = False
+        self.mqtt_client = None
+        self.mqtt_connected = False
+
+        mqtt_config = config.get("mqtt", {})
+        self.state_prefix = mqtt_config.get("state_topic_prefix", "marstek")
+        self.discovery_prefix = mqtt_config.get("discovery_prefix", "homeassistant")
+
+        rotation_config = dict(config.get("rotation", {}))
+        self.p1_topic = rotation_config.pop("p1_topic", DEFAULT_P1_TOPIC)
+        self.topic_prefix = rotation_config.pop("topic_prefix", f"{self.state_prefix}/rotation")
+
+        batteries = config.get("batteries", [])
+        self.engine = RotationEngine(batteries, **rotation_config)
+
+        # Optional direct P1 reader; without a source P1 comes in via MQTT
+        dsmr_config = dict(config.get("dsmr", {}))
+        source = dsmr_config.pop("source", "")
+        self.dsmr = DsmrReader(self._on_telegram, source=source, **dsmr_config) if source else None
+
+        # Night charge planner; HA values arrive as planner inputs
+        planner_config = dict(config.get("planner", {}))
+        planner_topics = {**DEFAULT_PLANNER_TOPICS, **planner_config.pop("topics", {})}
+        self.planner_topics = {topic: setting for setting, topic in planner_topics.items() if topic}
+        self.planner_inputs = {}
+        capacities = {
+            battery_key(battery): float(battery["capacity_kwh"])
+            for battery in batteries if "capacity_kwh" in battery
+        }
+        self.planner = NightChargePlanner(capacities, **planner_config)
+
+        # Optional tariff optimiser, re-run every bucket or on new inputs
+        optimizer_config = dict(config.get("optimizer", {}))
+        self.pv_window = (optimizer_config.pop("pv_sunrise", "07:00"), optimizer_config.pop("pv_sunset", "21:00"))
+        enabled = optimizer_config.pop("enabled", False)
+        self.optimizer = TariffOptimizer(capacities, **optimizer_config) if enabled else None
+        self.tariff_plan = None
+        self._optimised_at = None
+
+        # Optional PV forecast; replaces the expected PV value from HA
+        forecast_config = dict(config.get("forecast", {}))
+        source = forecast_config.pop("source", "")
+        cache_file = forecast_config.pop("cache_file", "forecast_cache.json")
+        cache_file = self._local_path(cache_file)
+        self.forecast = None
+        self.forecast_state = {}
+        if source:
+            cache = ForecastCache(cache_file) if cache_file else None
+            self.forecast = PVForecast(source, cache=cache, **forecast_config)
+            self.planner_topics = {
+                topic: setting for topic, setting in self.planner_topics.items()
+                if setting != "expected_pv_kwh"
+            }
+
+        # Optional PV calibration from measured production (needs the forecast)
+        calibration_config = dict(config.get("calibration", {}))
+        self.calibration = None
+        self.history = None
+        self._calibrated_at = None
+        if self.forecast and calibration_config.get("source") == "recorder":
+            self.history = RecorderHistory(
+                calibration_config.get("recorder_db", "/config/home-assistant_v2.db"),
+                calibration_config.get("statistics", [])
+            )
+            self.calibration = PVCalibration(
+                self.forecast.model.coefficient,
+                forgetting=calibration_config.get("forgetting", 0.995),
+                min_samples=calibration_config.get("min_samples", 20),
+                path=self._local_path(calibration_config.get("file", "pv_calibration.json"))
+            )
+            self.forecast.model.monthly = self.calibration.coefficients()
+
+        # Subscribed topic -> (battery key, field)
+        self.topics = {}
+        per_field = config.get("publishing", {}).get("state_format", "json") == "fields"
+        for battery in batteries:
+            key = battery_key(battery)
+            device_id = battery.get("device_id", key)
+            base = f"{self.state_prefix}/{device_id}"
+            if per_field:
+                self.topics[f"{base}/soc"] = (key, "soc")
+                self.topics[f"{base}/mode"] = (key, "mode")
+            else:
+                self.topics[f"{base}/state"] = (key, "state")
+            self.topics[f"{base}/availability"] = (key, "availability")
+
+        # Last payload per output topic, for change-only publishing. The lock
+        # serialises the MQTT network thread and the re-evaluation loop.
+        self.published = {}
+        # Payloads that only change with a battery, planner or forecast
+        # update; rebuilt when dirty instead of on every P1 reading
+        self._state_payloads = {}
+        self._state_dirty = True
+        self._lock = threading.Lock()
+
+        log_level = config.get("logging", {}).get("level", "INFO")
+        logging.basicConfig(
+            level=getattr(logging, log_level),
+            format='%(asctime)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+        self.logger = logging.getLogger("marstek_rotation")
+
+    def setup_mqtt(self) -> bool:
+        """Initialize MQTT connection."""
+        if not MQTT_AVAILABLE:
+            self.logger.error("MQTT not available. Install paho-mqtt.")
+            return False
+
+        mqtt_config = self.config.get("mqtt", {})
+
+        try:
+            self.mqtt_client = mqtt.Client(
+                client_id="marstek_rotation",
+                callback_api_version=mqtt.CallbackAPIVersion.VERSION2
+            )
+        except (AttributeError, TypeError):
+            self.mqtt_client = mqtt.Client(client_id="marstek_rotation")
+
+        self.mqtt_client.on_connect = self._on_mqtt_connect
+        self.mqtt_client.on_disconnect = self._on_mqtt_disconnect
+        self.mqtt_client.on_message = self._on_mqtt_message
+        self.mqtt_client.will_set(f"{self.topic_prefix}/availability", "offline", retain=True)
+
+        username = mqtt_config.get("username", "")
+        password = mqtt_config.get("password", "")
+        if username:
+            self.mqtt_client.username_pw_set(username, password)
+
+        host = mqtt_config.get("host", "localhost")
+        port = mqtt_config.get("port", 1883)
+
+        try:
+            self.logger.info(f"Connecting to MQTT broker at {host}:{port}")
+            self.mqtt_client.connect(host, port, 60)
+            self.mqtt_client.loop_start()
+
+            for _ in range(10):
+                if self.mqtt_connected:
+                    return True
+                time.sleep(0.5)
+
+            self.logger.error("MQTT connection timeout")
+            return False
+
+        except Exception as e:
+            self.logger.error(f"MQTT connection failed: {e}")
+            return False
+
+    def _on_mqtt_connect(self, client, userdata, flags, reason_code, properties=None):
+        """MQTT connect callback (VERSION2 compatible)."""
+        rc_value = int(reason_code) if hasattr(reason_code, '__int__') else reason_code
+        if rc_value != 0:
+            self.logger.error(f"MQTT connection failed with code {rc_value}")
+            return
+
+        self.mqtt_connected = True
+        self.logger.info("Connected to MQTT broker")
+        self.published.clear()
+        self._publish_discovery()
+        client.publish(f"{self.topic_prefix}/availability", "online", retain=True)
+        topics = [*self.topics, *self.planner_topics]
+        if not self.dsmr:
+            topics.append(self.p1_topic)
+        client.subscribe([(topic, 0) for topic in topics])
+        self._publish_entities()
+
+    def _on_mqtt_disconnect(self, client, userdata, flags_or_rc, reason_code=None, properties=None):
+        """MQTT disconnect callback (VERSION2 compatible)."""
+        self.mqtt_connected = False
+        rc = reason_code if reason_code is not None else flags_or_rc
+        self.logger.warning(f"Disconnected from MQTT broker (rc={rc})")
+
+    def _on_mqtt_message(self, client, userdata, message):
+        """Update the engine from a battery or P1 message."""
+        try:
+            payload = message.payload.decode("utf-8")
+            with self._lock:
+                if message.topic == self.p1_topic:
+                    self._publish_events(self.engine.update_p1(float(payload)))
+                elif message.topic in self.planner_topics:
+                    self._apply_planner_message(self.planner_topics[message.topic], payload)
+                else:
+                    key, field = self.topics[message.topic]
+                    self._apply_battery_message(key, field, payload)
+        except (KeyError, ValueError, UnicodeDecodeError) as e:
+            self.logger.debug(f"Ignoring message on {message.topic}: {e}")
+            return
+
+        self._publish_entities()
+
+    def _on_telegram(self, telegram):
+        """Feed a DSMR telegram straight into the engine (reader thread)."""
+        with self._lock:
+            self._publish_events(self.engine.update_p1(telegram.power))
+        self._publish_entities()
+
+    def _publish_events(self, events: list):
+        """Publish fired P1 rules as (non-retained) events."""
+        for event in events:
+            self.logger.info(f"P1 event: {event.name} ({event.power:.0f}W)")
+            if self.mqtt_connected:
+                self.mqtt_client.publish(
+                    f"{self.topic_prefix}/event",
+                    json.dumps({**event.as_dict(), "timestamp": datetime.now().isoformat()})
+                )
+
+    def _apply_battery_message(self, key: str, field: str, payload: str):
+        battery = self.engine.registry[key]
+        before = (battery.soc, battery.available, battery.mode)
+        self._update_battery(key, field, payload)
+        if (battery.soc, battery.available, battery.mode) != before:
+            self._state_dirty = True
+
+    def _update_battery(self, key: str, field: str, payload: str):
+        if field == "availability":
+            self.engine.set_available(key, payload == "online")
+        elif field == "soc":
+            self.engine.update_soc(key, float(payload))
+        elif field == "mode":
+            self.engine.update_mode(key, payload)
+        else:
+            state = json.loads(payload)
+            self.engine.update_soc(key, float(state["soc"]))
+            self.engine.update_mode(key, state["mode"])
+
+    def _apply_planner_message(self, setting: str, payload: str):
+        if payload in ("unknown", "unavailable", ""):
+            self.planner_inputs.pop(setting, None)
+        elif setting in ("night_start", "night_end"):
+            self.planner_inputs[setting] = payload[:5]
+        else:
+            self.planner_inputs[setting] = float(payload)
+        self._optimised_at = None
+        self._state_dirty = True
+
+    def _optimise(self):
+        """Re-run the tariff optimiser once per bucket (or after new inputs)."""
+        now = datetime.now()
+        if self._optimised_at == bucket_start(now) or not self.engine.registry.all_known:
+            return
+        expected_pv = self.planner_inputs.get("expected_pv_kwh", self.planner.settings["expected_pv_kwh"])
+        if self.forecast and self.forecast.available:
+            pv = self.forecast.pv_kwh(bucket_start(now), self.optimizer.buckets)
+        else:
+            pv = pv_profile(expected_pv, bucket_start(now), self.optimizer.buckets, *self.pv_window)
+        start = time.monotonic()
+        self.tariff_plan = self.optimizer.optimise(self.engine.registry, now=now, pv_kwh=pv)
+        self._optimised_at = bucket_start(now)
+        self._state_dirty = True
+        self.logger.info(
+            f"Tariff plan: {self.tariff_plan.summary} ({(time.monotonic() - start) * 1000:.0f}ms)"
+        )
+
+    @staticmethod
+    def _local_path(path: str):
+        """Relative paths are next to this script; empty stays empty."""
+        if path and not Path(path).is_absolute():
+            return Path(__file__).resolve().parent / path
+        return path
+
+    def _calibrate(self):
+        """Fit the panel model to the hours measured since the last run."""
+        hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+        if self._calibrated_at == hour or not self.forecast.available:
+            return
+        self._calibrated_at = hour
+        try:
+            added = self.calibration.update(self.history, self.forecast)
+        except (sqlite3.Error, OSError) as e:
+            self.logger.warning(f"PV calibration failed: {e}")
+            return
+        self.forecast.model.monthly = self.calibration.coefficients()
+        self._state_dirty = True
+        if added:
+            coefficient = self.calibration.coefficient(hour.month)
+            self.logger.info(f"PV calibration: {added} hours added, {coefficient:.2f} kWp this month")
+
+    def _pv_day(self, now: datetime):
+        """The day after the coming night: the date of the next night_end."""
+        night_end = self.planner_inputs.get("night_end", self.planner.settings["night_end"])
+        hours, minutes = (int(part) for part in night_end.split(":")[:2])
+        end = now.replace(hour=hours, minute=minutes, second=0, microsecond=0)
+        if end <= now:
+            end += timedelta(days=1)
+        return end.date()
+
+    def _apply_forecast(self):
+        """Feed the forecast for the coming day into the planner and entities."""
+        forecast = self.forecast
+        if not forecast.available:
+            return
+        day = self._pv_day(datetime.now())
+        expected = forecast.daily_kwh(day)
+        if self.planner_inputs.get("expected_pv_kwh") != expected:
+            self.planner_inputs["expected_pv_kwh"] = expected
+            self._optimised_at = None
+        state = {
+            "expected_pv": round(expected, 1),
+            "sunny_hours": forecast.sunny_hours(day),
+            "date": day.isoformat(),
+            "hourly_kwh": [round(kwh, 2) for kwh in forecast.hourly_kwh(day)],
+            "fetched": forecast.fetched,
+            "source": forecast.source
+        }
+        if state != self.forecast_state:
+            self.forecast_state = state
+            self._state_dirty = True
+
+    def _forecast_loop(self):
+        """Refresh the forecast (a no-op until it expires) and re-apply it.
+
+        The refresh fetches outside the lock; PVForecast swaps in the new
+        series as one object, so readers under the lock see either the old
+        or the new forecast.
+        """
+        while self.running:
+            try:
+                self.forecast.refresh()
+                if self.calibration:
+                    self._calibrate()
+                with self._lock:
+                    self._apply_forecast()
+                self._publish_entities()
+            except Exception as e:
+                self.logger.error(f"Forecast update failed: {e}")
+            time.sleep(60)
+
+    def _discovery_device(self) -> dict:
+        return {
+            "identifiers": ["marstek_rotation"],
+            "name": "Marstek Rotation",
+            "manufacturer": "Marstek",
+            "model": "Rotation Engine"
+        }
+
+    def _publish_discovery(self):
+        """Publish HA discovery configs; object IDs match the old templates."""
+        availability = {
+            "topic": f"{self.topic_prefix}/availability",
+            "payload_available": "online",
+            "payload_not_available": "offline"
+        }
+        entities = (
+            ("sensor", "battery_emptiest", "Battery Emptiest", "emptiest", {"icon": "mdi:battery-outline"}),
+            ("sensor", "battery_fullest", "Battery Fullest", "fullest", {"icon": "mdi:battery"}),
+            ("sensor", "battery_emptiest_inactive", "Battery Emptiest Inactive", "emptiest_inactive",
+             {"icon": "mdi:battery-plus-variant"}),
+            ("binary_sensor", "marstek_all_batteries_full", "Marstek All Batteries Full", "all_full",
+             {"icon": "mdi:battery-check"}),
+            ("sensor", "marstek_rotation_decision", "Marstek Rotation Decision", "decision",
+             {"icon": "mdi:swap-horizontal"}),
+            ("sensor", "marstek_charging_plan", "Marstek Charging Plan", "charging_plan",
+             {"icon": "mdi:battery-charging-wireless"}),
+        )
+        if self.optimizer:
+            entities += (
+                ("sensor", "marstek_tariff_plan", "Marstek Tariff Plan", "tariff_plan",
+                 {"icon": "mdi:cash-clock"}),
+            )
+        if self.forecast:
+            entities += (
+                ("sensor", "marstek_expected_pv_tomorrow", "Marstek Expected PV Tomorrow", "expected_pv",
+                 {"icon": "mdi:solar-power-variant", "unit_of_measurement": "kWh"}),
+                ("sensor", "marstek_sunny_hours_tomorrow", "Marstek Sunny Hours Tomorrow", "sunny_hours",
+                 {"icon": "mdi:weather-sunny", "unit_of_measurement": "h"}),
+            )
+        if self.calibration:
+            entities += (
+                ("sensor", "marstek_pv_calibration", "Marstek PV Calibration", "pv_calibration",
+                 {"icon": "mdi:solar-panel", "unit_of_measurement": "kWp"}),
+            )
+        for component, object_id, name, suffix, extra in entities:
+            payload = {
+                "name": name,
+                "state_topic": f"{self.topic_prefix}/{suffix}",
+                "json_attributes_topic": f"{self.topic_prefix}/{suffix}/attributes",
+                "unique_id": f"marstek_rotation_{suffix}",
+                "object_id": object_id,
+                "availability": availability,
+                "device": self._discovery_device(),
+                **extra
+            }
+            self.mqtt_client.publish(
+                f"{self.discovery_prefix}/{component}/marstek_rotation_{suffix}/config",
+                json.dumps(payload),
+                retain=True
+            )
+
+    def _entity_payloads(self) -> dict:
+        """Current state and attribute payloads per output topic.
+
+        Only the rotation decision is evaluated per call; the battery,
+        plan and forecast payloads come from a cache that is rebuilt when
+        one of their inputs changed.
+        """
+        engine = self.engine
+        if self._state_dirty:
+            self._state_payloads = self._build_state_payloads()
+            self._state_dirty = False
+        decision = engine.evaluate()
+        payloads = dict(self._state_payloads)
+        payloads[f"{self.topic_prefix}/decision"] = decision.action
+        payloads[f"{self.topic_prefix}/decision/attributes"] = json.dumps({
+            "target": decision.target,
+            "reason": decision.reason,
+            "active": engine.active.key if engine.active else None
+        })
+        return payloads
+
+    def _build_state_payloads(self) -> dict:
+        """Battery, plan, forecast and calibration payloads per output topic."""
+        engine = self.engine
+        payloads = {}
+
+        for suffix, battery in (
+            ("emptiest", engine.emptiest),
+            ("fullest", engine.fullest),
+            ("emptiest_inactive", engine.emptiest_inactive)
+        ):
+            payloads[f"{self.topic_prefix}/{suffix}"] = battery.key if battery else "unknown"
+            payloads[f"{self.topic_prefix}/{suffix}/attributes"] = json.dumps({
+                "label": battery.label if battery else None,
+                "soc": battery.soc if battery else None
+            })
+
+        payloads[f"{self.topic_prefix}/all_full"] = "ON" if engine.all_full else "OFF"
+        payloads[f"{self.topic_prefix}/all_full/attributes"] = json.dumps({
+            "lowest_soc": engine.lowest_soc,
+            "highest_soc": engine.highest_soc,
+            # Every battery's SOC by rotation key, for HA conditions on N batteries
+            "socs": {battery.key: battery.soc for battery in engine.registry if battery.known}
+        })
+
+        plan = self.planner.plan(engine.registry, **self.planner_inputs)
+        payloads[f"{self.topic_prefix}/charging_plan"] = plan.summary
+        payloads[f"{self.topic_prefix}/charging_plan/attributes"] = json.dumps(plan.as_dict())
+
+        if self.tariff_plan is not None:
+            payloads[f"{self.topic_prefix}/tariff_plan"] = self.tariff_plan.summary
+            payloads[f"{self.topic_prefix}/tariff_plan/attributes"] = json.dumps(self.tariff_plan.as_dict())
+
+        if self.forecast_state:
+            state = self.forecast_state
+            payloads[f"{self.topic_prefix}/expected_pv"] = str(state["expected_pv"])
+            payloads[f"{self.topic_prefix}/expected_pv/attributes"] = json.dumps({
+                key: state[key] for key in ("date", "hourly_kwh", "fetched", "source")
+            })
+            payloads[f"{self.topic_prefix}/sunny_hours"] = str(state["sunny_hours"])
+            payloads[f"{self.topic_prefix}/sunny_hours/attributes"] = json.dumps({
+                "forecast_date": state["date"]
+            })
+
+        if self.calibration:
+            month = datetime.now().month
+            payloads[f"{self.topic_prefix}/pv_calibration"] = f"{self.calibration.coefficient(month):.2f}"
+            payloads[f"{self.topic_prefix}/pv_calibration/attributes"] = json.dumps(
+                self.calibration.as_dict(month)
+            )
+        return payloads
+
+    def _publish_entities(self):
+        """Publish (retained) only the entity payloads that changed."""
+        if not self.mqtt_connected:
+            return
+        with self._lock:
+            for topic, payload in self._entity_payloads().items():
+                if self.published.get(topic) != payload:
+                    self.mqtt_client.publish(topic, payload, retain=True)
+                    self.published[topic] = payload
+
+    def run(self):
+        """Re-evaluate periodically so hold times expire without new P1 data."""
+        self.running = True
+        if self.dsmr:
+            self.dsmr.start()
+            self.logger.info(f"Rotation engine running (P1 via DSMR {self.dsmr.source})")
+        else:
+            self.logger.info(f"Rotation engine running (P1 topic: {self.p1_topic})")
+        if self.forecast:
+            threading.Thread(target=self._forecast_loop, name="pv-forecast", daemon=True).start()
+        while self.running:
+            try:
+                with self._lock:
+                    self._publish_events(self.engine.tick())
+                    if self.optimizer:
+                        self._optimise()
+                self._publish_entities()
+            except Exception as e:
+                self.logger.error(f"Rotation update failed: {e}")
+            time.sleep(1)
+
+    def stop(self):
+        """Stop the service."""
+        self.logger.info("Stopping rotation service...")
+        self.running = False
+        if self.dsmr:
+            self.dsmr.stop()
+        if self.mqtt_client and self.mqtt_connected:
+            self.mqtt_client.publish(f"{self.topic_prefix}/availability", "offline", retain=True)
+            self.mqtt_client.loop_stop()
+            self.mqtt_client.disconnect()
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Marstek Rotation Service")
+    parser.add_argument(
+        "--config", "-c",
+        default="config.yaml",
+        help="Path to configuration file (default: config.yaml)"
+    )
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    service = RotationService(config)
+
+    def signal_handler(signum, frame):
+        service.stop()
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    if not service.setup_mqtt():
+        print("Failed to connect to MQTT broker")
+        sys.exit(1)
+
+    try:
+        service.run()
+    finally:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Marstek Venus E UDP Simulator
+
+Simuleert één of meer Marstek batterijen die dezelfde JSON-RPC over UDP
+spreken als de echte hardware. Bedoeld voor offline tests en benchmarks van
+de poller en marstek_api, zonder batterijen op 192.168.6.x.
+
+Elke virtuele batterij krijgt een eigen loopback adres (127.0.1.1, 127.0.1.2,
+...) op dezelfde port, zodat clients precies zoals in productie op
+(ip, 30000) kunnen adresseren. Linux routeert heel 127.0.0.0/8 naar loopback.
+
+Gebruik:
+    python marstek_simulator.py --count 3
+    python marstek_simulator.py --count 200 --latency-ms 40 --loss 0.02
+    python marstek_simulator.py --count 3 --print-config > sim-batteries.yaml
+
+Author: Marstek Battery Rotation Project
+License: MIT
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import json
+import logging
+import random
+import socket
+import time
+
+_LOGGER = logging.getLogger("marstek_simulator")
+
+SLOT_COUNT = 10
+
+ERROR_METHOD_NOT_FOUND = {"code": -32601, "message": "Method not found"}
+ERROR_INVALID_PARAMS = {"code": -32602, "message": "Invalid params"}
+
+METHODS = ("Marstek.GetDevice", "ES.GetMode", "ES.GetStatus", "ES.SetMode", "Bat.GetStatus")
+
+
+def slot_covers(slot: dict, minute: int, weekday: int) -> bool:
+    """True if a slot is active at `minute` past midnight on `weekday` (0 = Monday).
+
+    A slot whose end is not after its start runs past midnight (23:00-07:00);
+    the part after midnight belongs to the day it started. Equal start and
+    end (00:00-00:00) means the whole day.
+    """
+    start_h, start_m = map(int, slot["start_time"].split(":")[:2])
+    end_h, end_m = map(int, slot["end_time"].split(":")[:2])
+    start, end = start_h * 60 + start_m, end_h * 60 + end_m
+    today = slot["week_set"] & (1 << weekday)
+    if start < end:
+        return bool(today) and start <= minute < end
+    if start == end:
+        return bool(today)
+    yesterday = slot["week_set"] & (1 << ((weekday - 1) % 7))
+    return bool(today and minute >= start) or bool(yesterday and minute < end)
+
+
+class VirtualBattery:
+    """State and JSON-RPC handlers for one simulated battery."""
+
+    def __init__(self, index: int, ip: str, v3: bool = False, capacity_wh: int = 5120):
+        self.index = index
+        self.ip = ip
+        self.v3 = v3
+        self.capacity_wh = capacity_wh
+        self.soc = random.uniform(15, 95)
+        self.mode = "Auto"
+        self.ongrid_power = 0
+        self.offgrid_power = 0
+        self.slots = [
+            {"time_num": n, "start_time": "00:00", "end_time": "00:00",
+             "week_set": 0, "power": 0, "enable": 0}
+            for n in range(SLOT_COUNT)
+        ]
+        self.mac = f"aabbcc{index:06x}"
+        self._updated = time.monotonic()
+
+    def _active_slot_power(self) -> int:
+        """Power of the manual slot covering the current local time (0 if none)."""
+        now = time.localtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        for slot in self.slots:
+            if slot["enable"] and slot_covers(slot, minute, now.tm_wday):
+                return slot["power"]
+        return 0
+
+    def step(self):
+        """Advance SOC/power since the last request."""
+        now = time.monotonic()
+        dt_hours = (now - self._updated) / 3600
+        self._updated = now
+
+        if self.mode == "Manual":
+            self.ongrid_power = self._active_slot_power()
+        elif self.mode in ("Auto", "AI"):
+            # Positive = discharging to grid, negative = charging
+            self.ongrid_power = int(max(-2500, min(2500, self.ongrid_power + random.gauss(0, 150))))
+
+        if (self.ongrid_power > 0 and self.soc <= 11) or (self.ongrid_power < 0 and self.soc >= 100):
+            self.ongrid_power = 0
+
+        self.soc -= self.ongrid_power * dt_hours / self.capacity_wh * 100
+        self.soc = max(0.0, min(100.0, self.soc))
+
+    def handle(self, method: str, params) -> tuple[dict | None, dict | None]:
+        """Return (result, error) for a request."""
+        if method not in METHODS:
+            return None, ERROR_METHOD_NOT_FOUND
+        if not isinstance(params, dict):
+            return None, ERROR_INVALID_PARAMS
+
+        self.step()
+
+        if method == "Marstek.GetDevice":
+            if "ble_mac" not in params:
+                return None, ERROR_INVALID_PARAMS
+            return {
+                "device": "VenusE 3.0" if self.v3 else "VenusE",
+                "ver": 139 if self.v3 else 155,
+                "ble_mac": self.mac,
+                "wifi_mac": self.mac,
+                "wifi_name": "simulator",
+                "ip": self.ip
+            }, None
+
+        if params.get("id") != 0:
+            return None, ERROR_INVALID_PARAMS
+
+        if method == "ES.GetMode":
+            return {
+                "id": 0,
+                "mode": self.mode,
+                "bat_soc": round(self.soc),
+                "ongrid_power": self.ongrid_power,
+                "offgrid_power": self.offgrid_power
+            }, None
+
+        if method == "ES.GetStatus":
+            return {
+                "id": 0,
+                "bat_soc": round(self.soc),
+                "bat_cap": self.capacity_wh,
+                "pv_power": 0,
+                "ongrid_power": self.ongrid_power,
+                "offgrid_power": self.offgrid_power,
+                "total_grid_output_energy": 0,
+                "total_grid_input_energy": 0
+            }, None
+
+        if method == "Bat.GetStatus":
+            return {
+                "id": 0,
+                "soc": round(self.soc),
+                "bat_temp": 22.0,
+                "bat_capacity": round(self.capacity_wh * self.soc / 100),
+                "rated_capacity": self.capacity_wh,
+                "charg_flag": self.soc < 100,
+                "dischrg_flag": self.soc > 11
+            }, None
+
+        return self._set_mode(params.get("config"))
+
+    def _set_mode(self, config) -> tuple[dict | None, dict | None]:
+        if not isinstance(config, dict) or config.get("mode") not in ("Auto", "AI", "Manual", "Passive"):
+            return None, ERROR_INVALID_PARAMS
+
+        manual_cfg = config.get("manual_cfg")
+        if manual_cfg is not None:
+            slot = manual_cfg.get("time_num")
+            if not isinstance(slot, int) or not 0 <= slot < SLOT_COUNT:
+                return None, ERROR_INVALID_PARAMS
+            self.slots[slot] = {
+                "time_num": slot,
+                "start_time": manual_cfg.get("start_time", "00:00"),
+                "end_time": manual_cfg.get("end_time", "00:00"),
+                "week_set": manual_cfg.get("week_set", 0),
+                "power": manual_cfg.get("power", 0),
+                "enable": manual_cfg.get("enable", 0)
+            }
+
+        self.mode = config["mode"]
+        return {"id": 0, "set_result": True}, None
+
+
+class BatteryProtocol(asyncio.DatagramProtocol):
+    """UDP protocol for one virtual battery, with fault injection."""
+
+    def __init__(self, battery: VirtualBattery, args: argparse.Namespace, stats: dict):
+        self.battery = battery
+        self.args = args
+        self.stats = stats
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        self.stats["requests"] += 1
+        args = self.args
+
+        if random.random() < args.loss:
+            self.stats["dropped"] += 1
+            return
+
+        try:
+            request = json.loads(data.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return
+        if not isinstance(request, dict):
+            return
+
+        if random.random() < args.echo:
+            self.stats["echoes"] += 1
+            self.transport.sendto(data, addr)
+
+        method = request.get("method")
+        if self.battery.v3 and method == "ES.GetStatus":
+            # V3 firmware never answers ES.GetStatus
+            self.stats["dropped"] += 1
+            return
+
+        result, error = self.battery.handle(method, request.get("params"))
+        response = {"id": request.get("id"), "src": f"VenusE-{self.battery.mac}"}
+        if error is not None:
+            response["error"] = error
+        else:
+            response["result"] = result
+        payload = json.dumps(response).encode("utf-8")
+
+        latency = args.latency_ms * (args.v3_latency_factor if self.battery.v3 else 1)
+        delay = max(0.0, random.gauss(latency, args.jitter_ms)) / 1000
+        loop = asyncio.get_running_loop()
+        loop.call_later(delay, self._reply, payload, addr)
+
+        if random.random() < args.stale:
+            # Late duplicate of the same reply (arrives after most client timeouts)
+            self.stats["stale"] += 1
+            loop.call_later(delay + args.stale_delay_ms / 1000, self._reply, payload, addr)
+
+    def _reply(self, payload: bytes, addr):
+        if self.transport and not self.transport.is_closing():
+            self.transport.sendto(payload, addr)
+            self.stats["replies"] += 1
+
+
+def battery_ips(base_ip: str, count: int) -> list[str]:
+    base = ipaddress.IPv4Address(base_ip)
+    return [str(base + n) for n in range(count)]
+
+
+async def run_simulator(args: argparse.Namespace):
+    """Start all virtual batteries and serve until cancelled."""
+    loop = asyncio.get_running_loop()
+    stats = {"requests": 0, "replies": 0, "dropped": 0, "echoes": 0, "stale": 0}
+    transports = []
+
+    for index, ip in enumerate(battery_ips(args.base_ip, args.count)):
+        battery = VirtualBattery(index, ip, v3=random.random() < args.v3_ratio)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # SO_REUSEADDR lets the client bind 0.0.0.0:<port> on the same host
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((ip, args.port))
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda b=battery: BatteryProtocol(b, args, stats), sock=sock
+        )
+        transports.append(transport)
+
+    _LOGGER.info(f"Simulating {args.count} batteries on {args.base_ip}+ port {args.port}")
+    try:
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            _LOGGER.info(f"Stats: {stats}")
+    finally:
+        for transport in transports:
+            transport.close()
+
+
+def print_config(args: argparse.Namespace):
+    """Print a poller `batteries:` section for the simulated batteries."""
+    print("batteries:")
+    for index, ip in enumerate(battery_ips(args.base_ip, args.count)):
+        print(f'  - name: "Sim {index + 1}"')
+        print(f'    ip: "{ip}"')
+        print(f'    entity_id: "marstek_sim_{index + 1}_state_of_charge"')
+        print(f'    device_id: "marstek_sim_{index + 1}"')
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Marstek Venus E UDP simulator")
+    parser.add_argument("--count", "-n", type=int, default=3, help="Number of virtual batteries")
+    parser.add_argument("--base-ip", default="127.0.1.1", help="First battery IP (default: 127.0.1.1)")
+    parser.add_argument("--port", type=int, default=30000, help="UDP port (default: 30000)")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Mean reply latency")
+    parser.add_argument("--jitter-ms", type=float, default=5, help="Latency standard deviation")
+    parser.add_argument("--loss", type=float, default=0.0, help="Probability a request is dropped")
+    parser.add_argument("--echo", type=float, default=0.0, help="Probability the request is echoed back")
+    parser.add_argument("--stale", type=float, default=0.0, help="Probability of a late duplicate reply")
+    parser.add_argument("--stale-delay-ms", type=float, default=5000, help="Delay of duplicate replies")
+    parser.add_argument("--v3-ratio", type=float, default=0.0,
+                        help="Fraction of V3 batteries (slower, no ES.GetStatus reply)")
+    parser.add_argument("--v3-latency-factor", type=float, default=4.0, help="Latency multiplier for V3")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible runs")
+    parser.add_argument("--stats-interval", type=float, default=30, help="Seconds between stats logs")
+    parser.add_argument("--print-config", action="store_true", help="Print poller batteries: config and exit")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+
+    if args.print_config:
+        print_config(args)
+        return
+
+    logging.basicConfig(
+        level=getattr(logging, args.log_level),
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    try:
+        asyncio.run(run_simulator(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""On-disk telemetry for Marstek batteries."""
+
+from .ring import (
+    DEFAULT_RING_CAPACITY,
+    RECORD_FIELDS,
+    TelemetryRing,
+)
+from .store import (
+    DEFAULT_RETENTION_DAYS,
+    MODE_CODES,
+    MODE_NAMES,
+    RAW,
+    ROLLUPS,
+    TIERS,
+    TelemetryStore,
+    mode_code,
+)
+
+__all__ = [
+    "DEFAULT_RETENTION_DAYS",
+    "DEFAULT_RING_CAPACITY",
+    "MODE_CODES",
+    "MODE_NAMES",
+    "RAW",
+    "RECORD_FIELDS",
+    "ROLLUPS",
+    "TIERS",
+    "TelemetryRing",
+    "TelemetryStore",
+    "mode_code",
+]
@@ -0,0 +1,213 @@
+"""
+Ring buffer van battery samples in een memory-mapped bestand.
+
+TelemetryStore buffert metingen en schrijft per flush; voor sampling onder
+de seconde (en om na een crash de laatste minuten te kunnen zien) is er
+daarnaast TelemetryRing: een bestand met vaste grootte dat de poller via
+mmap beschrijft.
+
+    header (4096 bytes): magic, versie, record grootte, capaciteit,
+                         aantal geschreven records, batterij namen
+    records:             capaciteit x 24 bytes, het oudste wordt overschreven
+
+Een record is een packed struct (timestamp, batterij index, mode code, SOC,
+ongrid en offgrid vermogen). Schrijven is struct.pack_into direct in de
+mapping: geen allocaties per sample, constant geheugen. Het aantal
+geschreven records wordt pas na het record bijgewerkt, zodat een reader
+nooit een half record als nieuw ziet.
+
+Readers openen hetzelfde bestand alleen-lezen (bijv. marstek_bench.py
+--ring) en lezen zonder kopie: read() via struct.iter_unpack op een
+memoryview, view() als NumPy structured array op de mapping.
+
+De data staat in de page cache van een gedeeld bestand en overleeft dus een
+crash van de poller (niet een stroomstoring van de host).
+
+Er is maar één writer: die houdt een exclusieve lock op het bestand. Een
+bestaand bestand met een andere layout (bijv. een andere capaciteit) wordt
+nooit ingekort of vergroot, want een ander proces kan het nog gemapt
+hebben; de writer weigert dan te openen.
+"""
+
+import mmap
+import os
+import struct
+from pathlib import Path
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+RING_MAGIC = b"MKRING\x00\x00"
+RING_VERSION = 1
+
+HEADER_SIZE = 4096
+HEADER = struct.Struct("<8sIIQQ")  # magic, version, record size, capacity, written
+WRITTEN = struct.Struct("<Q")
+WRITTEN_OFFSET = 24
+
+# Battery names: index in the poller config -> device_id
+NAMES_OFFSET = 64
+NAME_SIZE = 32
+MAX_BATTERIES = (HEADER_SIZE - NAMES_OFFSET) // NAME_SIZE
+
+# ts, battery index, mode code, (pad), soc, ongrid_power, offgrid_power
+RECORD = struct.Struct("<dHBxfii")
+RECORD_FIELDS = ("ts", "battery", "mode", "soc", "ongrid_power", "offgrid_power")
+
+DEFAULT_RING_CAPACITY = 65536  # 1.5 MB
+
+if NUMPY_AVAILABLE:
+    RECORD_DTYPE = np.dtype({
+        "names": list(RECORD_FIELDS),
+        "formats": ["<f8", "<u2", "u1", "<f4", "<i4", "<i4"],
+        "offsets": [0, 8, 10, 12, 16, 20],
+        "itemsize": RECORD.size
+    })
+
+
+class TelemetryRing:
+    """Fixed-size ring of packed samples in a shared memory-mapped file.
+
+    The poller opens it with `writable=True` (creating the file if it does
+    not exist yet); readers attach read-only and take the capacity and
+    battery names from the header.
+    """
+
+    def __init__(self, path: str | Path, capacity: int = DEFAULT_RING_CAPACITY,
+                 names: list | tuple = (), writable: bool = False):
+        self.path = Path(path)
+        self.writable = writable
+        if writable:
+            self._file, self.capacity = self._open_writer(capacity)
+            self._mmap = mmap.mmap(self._file.fileno(), HEADER_SIZE + self.capacity * RECORD.size)
+            self._write_names(names)
+        else:
+            self._file = open(self.path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, record_size, self.capacity, _ = HEADER.unpack_from(self._mmap)
+            if magic != RING_MAGIC or version != RING_VERSION or record_size != RECORD.size:
+                self.close()
+                raise ValueError(f"Not a telemetry ring: {self.path}")
+        self._records = memoryview(self._mmap)[HEADER_SIZE:HEADER_SIZE + self.capacity * RECORD.size]
+
+    def _open_writer(self, capacity: int):
+        """Open the file for writing and keep its records.
+
+        Only a new (or empty) file is initialised; a file with another
+        layout raises ValueError, and so does one locked by another writer.
+        """
+        if not 0 < capacity:
+            raise ValueError("Ring capacity must be positive")
+        size = HEADER_SIZE + capacity * RECORD.size
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, "r+b" if self.path.exists() else "w+b")
+        try:
+            if FCNTL_AVAILABLE:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise ValueError(f"Telemetry ring already has a writer: {self.path}") from None
+            length = os.fstat(f.fileno()).st_size
+            if length == 0:
+                f.truncate(size)
+                f.write(HEADER.pack(RING_MAGIC, RING_VERSION, RECORD.size, capacity, 0))
+                f.flush()
+                return f, capacity
+            header = f.read(HEADER.size)
+            if len(header) != HEADER.size or length != size \
+                    or HEADER.unpack(header)[:4] != (RING_MAGIC, RING_VERSION, RECORD.size, capacity):
+                raise ValueError(f"Telemetry ring {self.path} has another layout; remove it or "
+                                 "restore the previous ring_capacity")
+        except BaseException:
+            f.close()
+            raise
+        return f, capacity
+
+    def _write_names(self, names):
+        if len(names) > MAX_BATTERIES:
+            raise ValueError(f"A telemetry ring holds at most {MAX_BATTERIES} batteries")
+        for index in range(MAX_BATTERIES):
+            name = names[index].encode()[:NAME_SIZE] if index < len(names) else b""
+            offset = NAMES_OFFSET + index * NAME_SIZE
+            self._mmap[offset:offset + NAME_SIZE] = name.ljust(NAME_SIZE, b"\x00")
+
+    @property
+    def names(self) -> list:
+        """Battery device_ids, by battery index."""
+        names = []
+        for index in range(MAX_BATTERIES):
+            offset = NAMES_OFFSET + index * NAME_SIZE
+            name = bytes(self._mmap[offset:offset + NAME_SIZE]).rstrip(b"\x00")
+            if not name:
+                break
+            names.append(name.decode(errors="replace"))
+        return names
+
+    @property
+    def written(self) -> int:
+        """Total number of records ever appended (the next record's position)."""
+        return WRITTEN.unpack_from(self._mmap, WRITTEN_OFFSET)[0]
+
+    def append(self, ts: float, battery: int, soc: float, ongrid_power: int,
+               offgrid_power: int, mode: int):
+        """Write one sample over the oldest one. Single writer only."""
+        written = self.written
+        RECORD.pack_into(self._records, (written % self.capacity) * RECORD.size,
+                         ts, battery, mode, soc, ongrid_power, offgrid_power)
+        WRITTEN.pack_into(self._mmap, WRITTEN_OFFSET, written + 1)
+
+    def read(self, since: int = 0) -> tuple:
+        """Records appended at or after position `since`, oldest first.
+
+        Returns (records, position): tuples in RECORD_FIELDS order and the
+        position to pass as `since` next time. Records the writer overwrote
+        while they were being read are dropped.
+        """
+        written = self.written
+        first = max(since, written - self.capacity)
+        if first >= written:
+            return [], written
+        start, end = first % self.capacity, written % self.capacity or self.capacity
+        if start < end:
+            chunks = (self._records[start * RECORD.size:end * RECORD.size],)
+        else:
+            chunks = (self._records[start * RECORD.size:], self._records[:end * RECORD.size])
+        records = [record for chunk in chunks for record in RECORD.iter_unpack(chunk)]
+        # The writer may have lapped the oldest records during the unpack
+        overwritten = self.written - self.capacity - first
+        if overwritten > 0:
+            records = records[overwritten:]
+        return records, written
+
+    def view(self):
+        """All slots as a NumPy structured array on the mapping (no copy).
+
+        Slot `position % capacity` holds the record at `position`; only
+        positions from `written - capacity` to `written` are valid.
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("TelemetryRing.view() requires NumPy")
+        return np.frombuffer(self._records, dtype=RECORD_DTYPE, count=self.capacity)
+
+    def flush(self):
+        """Ask the OS to write the mapping to disk (also done on close)."""
+        if self.writable:
+            self._mmap.flush()
+
+    def close(self):
+        if getattr(self, "_records", None) is not None:
+            self._records.release()
+            self._records = None
+        if not self._mmap.closed:
+            self.flush()
+            self._mmap.close()
+        self._file.close()
@@ -0,0 +1,289 @@
+"""
+Kolom-opslag van battery telemetry, met automatische rollups.
+
+De poller gooide elke meting weg na het publiceren, en de HA recorder
+bewaart states op volle resolutie (of purget ze). TelemetryStore bewaart
+elke meting (SOC, vermogen, mode) per batterij in kleine binaire bestanden:
+één bestand per kolom, vaste breedte (array module), per dag een segment:
+
+    <path>/raw/2025-06-01/marstek_fasea_d828.soc
+    <path>/15m/2025-06-01/marstek_fasea_d828.ongrid_power
+    <path>/1h/2025-06/marstek_fasea_d828.ts
+
+Naast de ruwe metingen worden ze meteen samengevat in tiers van 1 minuut,
+15 minuten en 1 uur (gemiddelde, min/max SOC, laatste mode). Elke tier
+heeft zijn eigen bewaartermijn; oude segmenten worden als geheel gewist.
+
+Een query leest alleen de segmenten in het gevraagde bereik, met
+array.fromfile (geen parsing), dus een maand uurwaarden of een dag aan
+minuten kost enkele milliseconden. Na een crash (of een mislukte write)
+kunnen de kolommen van een segment ongelijk lang zijn: de half geschreven
+rij staat dan maar in een deel van de kolommen. Voordat de store voor het
+eerst weer aan een segment toevoegt, kapt hij alle kolommen af op de
+kortste, zodat nieuwe rijen in elke kolom op dezelfde positie staan.
+Readers kappen ook af op de kortste.
+"""
+
+import bisect
+import logging
+import os
+import shutil
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Mode names <-> compact codes (0 = unknown)
+MODE_CODES = {"Auto": 1, "Manual": 2, "AI": 3, "Passive": 4}
+MODE_NAMES = {code: name for name, code in MODE_CODES.items()}
+
+RAW = "raw"
+# Tier name -> bucket width in seconds
+ROLLUPS = {"1m": 60, "15m": 900, "1h": 3600}
+TIERS = (RAW, *ROLLUPS)
+
+RAW_COLUMNS = (
+    ("ts", "d"),
+    ("soc", "f"),
+    ("ongrid_power", "i"),
+    ("offgrid_power", "i"),
+    ("mode", "B"),
+)
+ROLLUP_COLUMNS = (
+    ("ts", "d"),  # bucket start
+    ("count", "I"),
+    ("soc", "f"),
+    ("soc_min", "f"),
+    ("soc_max", "f"),
+    ("ongrid_power", "f"),
+    ("offgrid_power", "f"),
+    ("mode", "B"),  # last mode in the bucket
+)
+
+DEFAULT_RETENTION_DAYS = {RAW: 7, "1m": 31, "15m": 400, "1h": 0}  # 0 = forever
+
+
+def mode_code(mode: str | None) -> int:
+    return MODE_CODES.get(mode, 0)
+
+
+def _columns(tier: str) -> tuple:
+    return RAW_COLUMNS if tier == RAW else ROLLUP_COLUMNS
+
+
+def _segment(tier: str, ts: float) -> str:
+    """Segment name: one per day, one per month for the hourly tier."""
+    moment = datetime.fromtimestamp(ts)
+    return moment.strftime("%Y-%m" if tier == "1h" else "%Y-%m-%d")
+
+
+def _align(directory: Path, device: str, tier: str):
+    """Truncate a segment's columns to the rows that every column has."""
+    columns = _columns(tier)
+    sizes = {}
+    for column, typecode in columns:
+        try:
+            sizes[column] = os.path.getsize(directory / f"{device}.{column}")
+        except FileNotFoundError:
+            sizes[column] = 0
+    rows = min(sizes[column] // array(typecode).itemsize for column, typecode in columns)
+    for column, typecode in columns:
+        size = rows * array(typecode).itemsize
+        if sizes[column] != size:
+            logger.warning(f"Truncating torn telemetry column {directory / device}.{column}")
+            os.truncate(directory / f"{device}.{column}", size)
+
+
+@dataclass(slots=True)
+class _Bucket:
+    """A rollup bucket that is still collecting samples."""
+
+    start: float
+    count: int = 0
+    soc_sum: float = 0.0
+    soc_min: float = 0.0
+    soc_max: float = 0.0
+    ongrid_sum: float = 0.0
+    offgrid_sum: float = 0.0
+    mode: int = 0
+
+    def add(self, soc: float, ongrid: float, offgrid: float, mode: int):
+        if self.count:
+            self.soc_min = min(self.soc_min, soc)
+            self.soc_max = max(self.soc_max, soc)
+        else:
+            self.soc_min = self.soc_max = soc
+        self.count += 1
+        self.soc_sum += soc
+        self.ongrid_sum += ongrid
+        self.offgrid_sum += offgrid
+        self.mode = mode
+
+    def row(self) -> tuple:
+        return (self.start, self.count, self.soc_sum / self.count, self.soc_min, self.soc_max,
+                self.ongrid_sum / self.count, self.offgrid_sum / self.count, self.mode)
+
+
+class TelemetryStore:
+    """Append-only columnar store with 1m/15m/1h rollup tiers."""
+
+    def __init__(self, path: str | Path, flush_seconds: float = 60,
+                 retention_days: dict | None = None):
+        self.path = Path(path)
+        self.flush_seconds = flush_seconds
+        self.retention = {**DEFAULT_RETENTION_DAYS, **(retention_days or {})}
+        # _lock guards the buffers, _write_lock the files: append never
+        # waits for disk I/O
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # (tier, device, segment) -> list of rows waiting for the next flush
+        self._pending = {}
+        # (tier, device) -> _Bucket being filled
+        self._buckets = {}
+        self._last_flush = time.monotonic()
+        self._pruned_day = None
+        # (tier, device, segment) whose columns are known to be aligned
+        self._aligned = set()
+
+    def append(self, device: str, ts: float, soc: float, ongrid_power: int,
+               offgrid_power: int, mode: str | None):
+        """Buffer one sample and roll it into every tier (no disk I/O)."""
+        code = mode_code(mode)
+        with self._lock:
+            self._queue(RAW, device, (ts, soc, ongrid_power, offgrid_power, code))
+            for tier, width in ROLLUPS.items():
+                start = ts - ts % width
+                bucket = self._buckets.get((tier, device))
+                if bucket is not None and bucket.start != start:
+                    self._queue(tier, device, bucket.row())
+                    bucket = None
+                if bucket is None:
+                    bucket = self._buckets[(tier, device)] = _Bucket(start)
+                bucket.add(soc, ongrid_power, offgrid_power, code)
+
+    def _queue(self, tier: str, device: str, row: tuple):
+        self._pending.setdefault((tier, device, _segment(tier, row[0])), []).append(row)
+
+    @property
+    def flush_due(self) -> bool:
+        return time.monotonic() - self._last_flush >= self.flush_seconds
+
+    def maybe_flush(self, now: float | None = None):
+        """Flush if flush_seconds passed since the last one.
+
+        Call it after releasing any lock held around append(), so other
+        threads never wait for the disk.
+        """
+        if self.flush_due:
+            self.flush(now)
+
+    def flush(self, now: float | None = None):
+        """Write pending rows, close finished buckets and prune old segments."""
+        now = time.time() if now is None else now
+        with self._write_lock:
+            with self._lock:
+                pending = self._take(now)
+            self._write(pending, now)
+
+    def _take(self, now: float) -> dict:
+        """Swap out the rows to write; called with _lock held."""
+        # A bucket whose period is over is complete, even without a newer sample
+        for (tier, device), bucket in list(self._buckets.items()):
+            if now >= bucket.start + ROLLUPS[tier]:
+                self._queue(tier, device, bucket.row())
+                del self._buckets[(tier, device)]
+        pending, self._pending = self._pending, {}
+        self._last_flush = time.monotonic()
+        return pending
+
+    def _write(self, pending: dict, now: float):
+        for key, rows in pending.items():
+            tier, device, segment = key
+            directory = self.path / tier / segment
+            try:
+                directory.mkdir(parents=True, exist_ok=True)
+                if key not in self._aligned:
+                    _align(directory, device, tier)
+                    self._aligned.add(key)
+                for index, (column, typecode) in enumerate(_columns(tier)):
+                    with open(directory / f"{device}.{column}", "ab") as f:
+                        array(typecode, (row[index] for row in rows)).tofile(f)
+            except OSError as e:
+                # Some columns may have the rows: align again before the next write
+                self._aligned.discard(key)
+                logger.warning(f"Could not write telemetry {directory}: {e}")
+
+        today = datetime.fromtimestamp(now).date()
+        if self._pruned_day != today:
+            self._pruned_day = today
+            self._prune(today)
+
+    def _prune(self, today):
+        for tier, days in self.retention.items():
+            if not days:
+                continue
+            oldest = _segment(tier, datetime.combine(today - timedelta(days=days), datetime.min.time()).timestamp())
+            directory = self.path / tier
+            if not directory.is_dir():
+                continue
+            for segment in sorted(os.listdir(directory)):
+                if segment >= oldest:
+                    break
+                shutil.rmtree(directory / segment, ignore_errors=True)
+
+    def _segments(self, tier: str, start: float, end: float) -> list:
+        directory = self.path / tier
+        if not directory.is_dir():
+            return []
+        first, last = _segment(tier, start), _segment(tier, end)
+        return [directory / s for s in sorted(os.listdir(directory)) if first <= s <= last]
+
+    def query(self, device: str, tier: str, start: float, end: float) -> dict:
+        """Columns (arrays) of one battery and tier with start <= ts < end."""
+        if tier not in TIERS:
+            raise ValueError(f"Unknown telemetry tier: {tier}")
+        self.flush()
+        columns = _columns(tier)
+        result = {column: array(typecode) for column, typecode in columns}
+        for directory in self._segments(tier, start, end):
+            parts = {}
+            for column, typecode in columns:
+                values = array(typecode)
+                file = directory / f"{device}.{column}"
+                try:
+                    with open(file, "rb") as f:
+                        values.fromfile(f, os.path.getsize(file) // values.itemsize)
+                except FileNotFoundError:
+                    values = array(typecode)
+                parts[column] = values
+            # Columns of an interrupted write can differ in length
+            length = min(len(values) for values in parts.values())
+            ts = parts["ts"]
+            first = bisect.bisect_left(ts, start, 0, length)
+            last = bisect.bisect_left(ts, end, first, length)
+            for column in result:
+                result[column].extend(parts[column][first:last])
+        return result
+
+    @staticmethod
+    def best_tier(resolution_seconds: float) -> str:
+        """Coarsest tier that is still at least as fine as the resolution asked for."""
+        best = RAW
+        for tier, width in ROLLUPS.items():
+            if width <= resolution_seconds:
+                best = tier
+        return best
+
+    def devices(self, tier: str = "1h") -> list:
+        """Batteries that have data in a tier."""
+        directory = self.path / tier
+        if not directory.is_dir():
+            return []
+        return sorted({
+            name.split(".")[0] for segment in os.listdir(directory)
+            for name in os.listdir(directory / segment)
+        })
@@ -0,0 +1,6 @@
+"""Unit tests for the poller packages; run with `python -m pytest tests` from archive/poller."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from marstek_rotation import PVCalibration
+
+
+@pytest.mark.parametrize("content", ["[1, 2]", "null", '{"version": 1, "months": [1]}'])
+def test_malformed_file_is_ignored(tmp_path, content):
+    path = tmp_path / "pv_calibration.json"
+    path.write_text(content)
+    calibration = PVCalibration(3.2, path=path)
+    assert calibration.coefficients() == {}
+    assert calibration.last_hour is None
+
+
+def test_invalid_months_are_skipped(tmp_path):
+    path = tmp_path / "pv_calibration.json"
+    path.write_text(json.dumps({"version": 1, "last_hour": "gisteren", "months": {
+        "6": [300.0, 100.0, 40.0], "13": [1, 1, 1], "0": [1, 1, 1], "x": [1, 1, 1],
+        "7": ["a", 1, 1], "8": [1, 2], "9": None
+    }}))
+    calibration = PVCalibration(3.2, path=path)
+    assert calibration.coefficient(6) == 3.0
+    assert calibration.last_hour is None
+    # Every month still has a fit or a fallback
+    assert set(calibration.coefficients()) == set(range(1, 13))
+
+
+def test_save_and_load(tmp_path):
+    path = tmp_path / "pv_calibration.json"
+    calibration = PVCalibration(3.2, min_samples=1, path=path)
+    calibration.add(5, 0.5, 1.5)
+    calibration.save()
+    assert PVCalibration(3.2, min_samples=1, path=path).coefficient(5) == pytest.approx(3.0)
+
+
+def test_add_swaps_the_state():
+    calibration = PVCalibration(3.2, min_samples=1)
+    before = calibration.state
+    calibration.add(5, 0.5, 1.5)
+    assert before.months[5] == (0.0, 0.0, 0.0)
+    assert calibration.state is not before
@@ -0,0 +1,56 @@
+from marstek_rotation.dsmr import DsmrParser, crc16
+
+BODY = (
+    b"/ISk5\\2MT382-1000\r\n"
+    b"\r\n"
+    b"1-3:0.2.8(50)\r\n"
+    b"1-0:1.7.0(00.424*kW)\r\n"
+    b"1-0:2.7.0(01.250*kW)\r\n"
+    b"1-0:21.7.0(00.100*kW)\r\n"
+    b"1-0:22.7.0(01.000*kW)\r\n"
+    b"!"
+)
+
+
+def telegram(body: bytes = BODY, crc: int | None = None) -> bytes:
+    return body + b"%04X\r\n" % (crc16(body) if crc is None else crc)
+
+
+def test_crc16_known_value():
+    # CRC-16/ARC check value
+    assert crc16(b"123456789") == 0xBB3D
+
+
+def test_valid_telegram_is_accepted():
+    parser = DsmrParser()
+    [result] = parser.feed(telegram())
+    assert result.power == -826.0
+    assert result.phase_power[0] == -900.0
+    assert parser.crc_errors == 0
+
+
+def test_bad_crc_is_rejected():
+    parser = DsmrParser()
+    assert parser.feed(telegram(crc=crc16(BODY) ^ 1)) == []
+    assert parser.crc_errors == 1
+
+
+def test_corrupted_body_is_rejected():
+    data = telegram().replace(b"00.424", b"00.425")
+    parser = DsmrParser()
+    assert parser.feed(data) == []
+    assert parser.crc_errors == 1
+
+
+def test_telegram_split_over_reads():
+    data = b"garbage" + telegram() + telegram()
+    parser = DsmrParser()
+    results = []
+    for i in range(0, len(data), 7):
+        results.extend(parser.feed(data[i:i + 7]))
+    assert len(results) == 2
+
+
+def test_telegram_without_crc_is_accepted():
+    parser = DsmrParser()
+    assert len(parser.feed(BODY + b"\r\n")) == 1
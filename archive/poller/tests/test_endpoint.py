@@ -0,0 +1,78 @@
+import json
+import socket
+import threading
+import time
+
+from marstek_api import MarstekEndpoint
+
+
+def fake_battery(sock: socket.socket, replies):
+    """Answer one request with the datagrams built by `replies(request)`."""
+    data, addr = sock.recvfrom(65535)
+    for reply in replies(json.loads(data)):
+        sock.sendto(reply, addr)
+
+
+def request_with(replies):
+    battery = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    battery.bind(("127.0.0.1", 0))
+    battery.settimeout(5)
+    thread = threading.Thread(target=fake_battery, args=(battery, replies), daemon=True)
+    thread.start()
+
+    endpoint = MarstekEndpoint(port=0, bind_host="127.0.0.1")
+    try:
+        response = endpoint.request_sync("127.0.0.1", "ES.GetMode", {"id": 0}, timeout=2,
+                                         port=battery.getsockname()[1])
+        return response, endpoint.protocol.echoes_dropped
+    finally:
+        thread.join(timeout=5)
+        endpoint.close()
+        battery.close()
+
+
+def test_reserialised_echo_is_not_a_reply():
+    def replies(request):
+        # Firmware echo: same object, other key order and whitespace
+        echo = json.dumps({key: request[key] for key in reversed(list(request))}, indent=1)
+        reply = json.dumps({"id": request["id"], "src": "VenusE", "result": {"id": 0, "mode": "Auto"}})
+        return [echo.encode(), reply.encode()]
+
+    response, echoes = request_with(replies)
+    assert response["result"]["mode"] == "Auto"
+    assert echoes == 1
+
+
+def test_error_reply_resolves_the_request():
+    def replies(request):
+        return [json.dumps({"id": request["id"], "error": {"code": -32601}}).encode()]
+
+    response, echoes = request_with(replies)
+    assert response["error"]["code"] == -32601
+    assert echoes == 0
+
+
+def test_cancelled_request_is_not_a_failure():
+    battery = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    battery.bind(("127.0.0.1", 0))  # never answers
+    endpoint = MarstekEndpoint(port=0, bind_host="127.0.0.1")
+    try:
+        breaker = endpoint.breaker("127.0.0.1")
+        # Half-open: the next request is the single probe
+        breaker.state, breaker.opened_at = breaker.OPEN, 0.0
+        future = endpoint._submit("127.0.0.1", "ES.GetMode", {"id": 0}, 5,
+                                  battery.getsockname()[1], None)
+        time.sleep(0.2)
+        future.cancel()
+        time.sleep(0.2)
+        assert breaker.failures == 0
+        assert breaker.state == breaker.HALF_OPEN
+        # The probe slot was released, so a new probe may go out
+        assert endpoint.run_sync(_allow(breaker))
+    finally:
+        endpoint.close()
+        battery.close()
+
+
+async def _allow(breaker):
+    return breaker.allow()
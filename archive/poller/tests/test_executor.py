@@ -0,0 +1,108 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+
+from marstek_api import MarstekClient, MarstekEndpoint, SwitchExecutor
+from marstek_api.client import MODE_AUTO, MODE_MANUAL
+from marstek_api.models import ModeStatus
+
+
+class FakeClient:
+    """Answers SetMode at once and reports the mode it was set to."""
+
+    def __init__(self, ip: str, mode: str = MODE_AUTO, delay: float = 0.0):
+        self.ip = ip
+        self.mode = mode
+        self.delay = delay
+        self.configs = []
+        self.reads = 0
+
+    async def async_set_mode(self, mode: str, config: dict | None = None, lane: str | None = None) -> bool:
+        self.configs.append(config)
+        self.mode = mode
+        return True
+
+    async def async_get_mode(self, lane: str | None = None) -> ModeStatus:
+        self.reads += 1
+        await asyncio.sleep(self.delay)
+        return ModeStatus(mode=self.mode)
+
+
+def test_manual_writes_no_schedule_slot():
+    active, other = FakeClient("10.0.0.1", MODE_MANUAL), FakeClient("10.0.0.2")
+    switch = asyncio.run(SwitchExecutor().async_activate(active, [other]))
+    assert switch.ok
+    assert other.mode == MODE_MANUAL
+    # Plain SetMode: no manual_cfg that would overwrite an (overflow) slot
+    assert other.configs == [None]
+
+
+def test_fan_out_verifies_concurrently():
+    clients = [FakeClient(f"10.0.0.{n}", delay=0.2) for n in range(1, 6)]
+    executor = SwitchExecutor()
+    loop = asyncio.new_event_loop()
+    try:
+        start = loop.time()
+        results = loop.run_until_complete(executor.async_fan_out(clients, MODE_MANUAL))
+        elapsed = loop.time() - start
+    finally:
+        loop.close()
+    assert all(result.converged for result in results)
+    # Five read-backs of 0.2 s each overlap instead of adding up
+    assert elapsed < 0.5
+
+
+def test_only_unconverged_batteries_are_retried():
+    class Stuck(FakeClient):
+        async def async_set_mode(self, mode, config=None, lane=None):
+            self.configs.append(config)
+            return len(self.configs) > 1  # first SetMode is not acknowledged
+
+    good, stuck = FakeClient("10.0.0.1"), Stuck("10.0.0.2")
+    results = asyncio.run(SwitchExecutor(verify_interval=0.01).async_fan_out([good, stuck], MODE_AUTO))
+    assert [result.attempts for result in results] == [1, 2]
+    assert len(good.configs) == 1
+    assert all(result.converged for result in results)
+
+
+def battery_simulator(sock: socket.socket):
+    """Answer SetMode/GetMode at once until the socket is closed."""
+    mode = MODE_AUTO
+    while True:
+        try:
+            data, addr = sock.recvfrom(65535)
+        except OSError:
+            return
+        request = json.loads(data)
+        if request["method"] == "ES.SetMode":
+            mode = request["params"]["config"]["mode"]
+            result = {"id": 0, "set_result": True}
+        else:
+            result = {"id": 0, "mode": mode}
+        sock.sendto(json.dumps({"id": request["id"], "result": result}).encode(), addr)
+
+
+def test_switch_does_not_wait_for_the_poll_bucket():
+    battery = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    battery.bind(("127.0.0.1", 0))
+    threading.Thread(target=battery_simulator, args=(battery,), daemon=True).start()
+
+    endpoint = MarstekEndpoint(port=0, bind_host="127.0.0.1")
+    try:
+        client = MarstekClient("127.0.0.1", port=battery.getsockname()[1], endpoint=endpoint,
+                               timeout=2)
+        # A poll cycle that used up the burst of the regular bucket
+        for _ in range(3):
+            endpoint.run_sync(client.async_get_mode())
+
+        start = time.monotonic()
+        result = endpoint.run_sync(SwitchExecutor().async_set_mode(client, MODE_MANUAL))
+        elapsed = time.monotonic() - start
+    finally:
+        endpoint.close()
+        battery.close()
+    assert result.converged
+    # SetMode plus read-back, without the ~1 s wait for a poll token
+    assert elapsed < 0.5
@@ -0,0 +1,25 @@
+from marstek_rotation import ForecastCache, PVForecast
+
+
+def test_forecast_refresh_swaps_the_series_at_once(tmp_path):
+    path = tmp_path / "forecast.json"
+    path.write_text('{"hourly": {"time": ["2026-06-01T12:00", "2026-06-01T13:00"],'
+                    ' "shortwave_radiation": [500, 600], "cloud_cover": [10, 20]}}')
+    forecast = PVForecast("file", file=str(path))
+    assert forecast.refresh(now=0)
+    series = forecast.series
+    assert len(series.times) == len(series.irradiance) == len(series.cloud_cover) == 2
+
+    path.write_text('{"hourly": {"time": ["2026-06-01T12:00"], "shortwave_radiation": [400]}}')
+    assert forecast.refresh(now=1e10)
+    # The old series is untouched; the new one replaced it as a whole
+    assert series.irradiance == (500.0, 600.0)
+    assert forecast.irradiance == (400.0,)
+
+
+def test_cache_that_is_not_an_object_is_ignored(tmp_path):
+    for content in ("[1, 2]", "null", '{"version": 1, "body": [1]}', '{"version": 1, "body": {"hourly": 3}}'):
+        path = tmp_path / "forecast_cache.json"
+        path.write_text(content)
+        forecast = PVForecast("file", file=str(tmp_path / "missing.json"), cache=ForecastCache(path))
+        assert not forecast.available
@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import pytest
+
+from marstek_rotation import BatteryRegistry, TariffOptimizer
+from marstek_rotation.optimizer import BUCKET_HOURS, _round_power
+
+
+def registry(count: int, socs) -> BatteryRegistry:
+    batteries = BatteryRegistry([{"name": f"Battery {n}"} for n in range(count)])
+    for n, soc in zip(range(count), socs):
+        batteries.update_soc(f"battery_{n}", soc)
+    return batteries
+
+
+@pytest.mark.parametrize("count", [1, 3, 12])
+def test_bucket_totals_follow_the_dp_path(count):
+    optimizer = TariffOptimizer({}, horizon_hours=12)
+    # Cheap, expensive, cheap, expensive: charge and discharge both happen
+    prices = ([0.10] * 12 + [0.40] * 12) * 2
+    plan = optimizer.optimise(registry(count, [20 + 5 * n for n in range(count)]),
+                              now=datetime(2026, 1, 1), prices=prices)
+    totals = [sum(powers[t] for powers in plan.power.values()) for t in range(optimizer.buckets)]
+    decisions = [round((before - after) / BUCKET_HOURS * 1000)
+                 for before, after in zip(plan.stored_kwh, plan.stored_kwh[1:])]
+    assert any(decisions)
+    assert totals == decisions
+    assert plan.charged_kwh - plan.discharged_kwh == pytest.approx(plan.stored_kwh[-1] - plan.stored_kwh[0])
+
+
+def test_round_power_keeps_the_total():
+    watts = _round_power([400 / 12] * 12, [2500] * 12, 50)
+    assert sum(watts) == 400
+    assert all(w % 50 == 0 for w in watts)
+
+
+def test_round_power_respects_caps():
+    assert _round_power([40.0, 40.0, 20.0], [0.0, 2500, 2500], 50) == [0, 50, 50]
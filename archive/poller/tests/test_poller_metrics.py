@@ -0,0 +1,39 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from marstek_poller import MarstekPoller
+
+mqtt = pytest.importorskip("paho.mqtt.client")
+
+
+class FakeMqtt:
+    def __init__(self, rc=mqtt.MQTT_ERR_SUCCESS):
+        self.rc = rc
+
+    def publish(self, topic, payload, retain=False):
+        return SimpleNamespace(rc=self.rc)
+
+
+@pytest.fixture
+def poller():
+    poller = MarstekPoller.__new__(MarstekPoller)
+    poller._mqtt_in_flight = 0
+    poller._mqtt_lock = threading.Lock()
+    return poller
+
+
+def test_in_flight_publishes_are_counted(poller):
+    poller.mqtt_client = FakeMqtt()
+    poller._publish("a", "1")
+    poller._publish("b", "2", retain=True)
+    assert poller._mqtt_in_flight == 2
+    poller._on_mqtt_publish(poller.mqtt_client, None, 1, None, None)
+    assert poller._mqtt_in_flight == 1
+
+
+def test_refused_publish_is_not_counted(poller):
+    poller.mqtt_client = FakeMqtt(rc=mqtt.MQTT_ERR_NO_CONN)
+    poller._publish("a", "1")
+    assert poller._mqtt_in_flight == 0
@@ -0,0 +1,61 @@
+from marstek_rotation import BatteryRegistry
+
+BATTERIES = [{"name": "Fase A"}, {"name": "Fase B"}, {"name": "Fase C"}]
+
+
+def registry(**socs) -> BatteryRegistry:
+    result = BatteryRegistry(BATTERIES)
+    for key, soc in socs.items():
+        result.update_soc(key, soc)
+    return result
+
+
+def test_emptiest_and_fullest():
+    batteries = registry(fase_a=40, fase_b=20, fase_c=80)
+    assert batteries.emptiest().key == "fase_b"
+    assert batteries.fullest().key == "fase_c"
+
+
+def test_exclude_skips_the_top_battery():
+    batteries = registry(fase_a=40, fase_b=20, fase_c=80)
+    assert batteries.emptiest(exclude="fase_b").key == "fase_a"
+    assert batteries.fullest(exclude="fase_c").key == "fase_a"
+    # The excluded battery is still there for the next lookup
+    assert batteries.emptiest().key == "fase_b"
+
+
+def test_updates_invalidate_old_entries():
+    batteries = registry(fase_a=40, fase_b=20, fase_c=80)
+    batteries.update_soc("fase_b", 90)
+    assert batteries.emptiest().key == "fase_a"
+    assert batteries.fullest().key == "fase_b"
+
+
+def test_offline_batteries_are_skipped():
+    batteries = registry(fase_a=40, fase_b=20, fase_c=80)
+    batteries.set_available("fase_b", False)
+    assert batteries.emptiest().key == "fase_a"
+    batteries.set_available("fase_b", True)
+    assert batteries.emptiest().key == "fase_b"
+
+
+def test_limits():
+    batteries = registry(fase_a=96, fase_b=98, fase_c=99)
+    assert batteries.emptiest(below=95) is None
+    assert batteries.fullest(exclude="fase_c", above=98) is None
+    assert batteries.fullest(exclude="fase_c", above=97).key == "fase_b"
+
+
+def test_exclude_with_single_battery():
+    batteries = BatteryRegistry([{"name": "Fase A"}])
+    batteries.update_soc("fase_a", 50)
+    assert batteries.emptiest(exclude="fase_a") is None
+
+
+def test_many_updates_stay_consistent():
+    batteries = BatteryRegistry([{"name": f"Battery {n}"} for n in range(12)])
+    for step in range(500):
+        batteries.update_soc(f"battery_{step % 12}", (step * 37) % 100)
+    socs = {battery.key: battery.soc for battery in batteries}
+    assert batteries.emptiest().soc == min(socs.values())
+    assert batteries.fullest().soc == max(socs.values())
@@ -0,0 +1,68 @@
+import pytest
+
+from marstek_telemetry import TelemetryRing
+from marstek_telemetry.ring import HEADER_SIZE, RECORD
+
+
+def test_read_after_wrap(tmp_path):
+    path = tmp_path / "telemetry.ring"
+    writer = TelemetryRing(path, capacity=8, names=["fase_a", "fase_b"], writable=True)
+    reader = TelemetryRing(path)
+    try:
+        for n in range(20):
+            writer.append(float(n), n % 2, 50.0, n, 0, 1)
+
+        records, position = reader.read()
+        assert position == 20
+        assert [record[0] for record in records] == [float(n) for n in range(12, 20)]
+
+        # Only what is still in the ring since an old position
+        records, _ = reader.read(10)
+        assert [record[0] for record in records] == [float(n) for n in range(12, 20)]
+        records, _ = reader.read(18)
+        assert [record[3:5] for record in records] == [(50.0, 18), (50.0, 19)]
+        assert reader.read(20) == ([], 20)
+        assert reader.names == ["fase_a", "fase_b"]
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_reopen_keeps_records(tmp_path):
+    path = tmp_path / "telemetry.ring"
+    writer = TelemetryRing(path, capacity=4, writable=True)
+    for n in range(6):
+        writer.append(float(n), 0, 1.0, 0, 0, 0)
+    writer.close()
+
+    writer = TelemetryRing(path, capacity=4, writable=True)
+    assert writer.written == 6
+    assert [record[0] for record in writer.read()[0]] == [2.0, 3.0, 4.0, 5.0]
+    writer.close()
+
+    # Another capacity is refused; the file is left as it was
+    with pytest.raises(ValueError):
+        TelemetryRing(path, capacity=5, writable=True)
+    assert path.stat().st_size == HEADER_SIZE + 4 * RECORD.size
+    reader = TelemetryRing(path)
+    assert reader.written == 6
+    reader.close()
+
+
+def test_second_writer_is_refused(tmp_path):
+    path = tmp_path / "telemetry.ring"
+    writer = TelemetryRing(path, capacity=4, writable=True)
+    try:
+        with pytest.raises(ValueError):
+            TelemetryRing(path, capacity=4, writable=True)
+    finally:
+        writer.close()
+    TelemetryRing(path, capacity=4, writable=True).close()
+
+
+def test_foreign_file_is_not_overwritten(tmp_path):
+    path = tmp_path / "telemetry.ring"
+    path.write_bytes(b"not a ring")
+    with pytest.raises(ValueError):
+        TelemetryRing(path, capacity=4, writable=True)
+    assert path.read_bytes() == b"not a ring"
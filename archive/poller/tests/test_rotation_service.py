@@ -0,0 +1,41 @@
+from marstek_rotation_service import RotationService
+
+BATTERIES = [{"name": "Fase A", "capacity_kwh": 5.12}, {"name": "Fase B", "capacity_kwh": 5.12}]
+
+
+def service_counting_plans():
+    service = RotationService({"batteries": BATTERIES})
+    plans = []
+    plan = service.planner.plan
+    service.planner.plan = lambda *args, **kwargs: plans.append(1) or plan(*args, **kwargs)
+    for key in ("fase_a", "fase_b"):
+        service._apply_battery_message(key, "availability", "online")
+        service._apply_battery_message(key, "state", '{"soc": 50, "mode": "Manual"}')
+    return service, plans
+
+
+def test_p1_readings_reuse_the_plan():
+    service, plans = service_counting_plans()
+    first = service._entity_payloads()
+    for power in (-500.0, -800.0, 300.0):
+        service.engine.update_p1(power)
+        assert service._entity_payloads().keys() == first.keys()
+    assert len(plans) == 1
+
+
+def test_battery_and_planner_changes_rebuild_the_plan():
+    service, plans = service_counting_plans()
+    service._entity_payloads()
+    # Same SOC again: nothing to recompute
+    service._apply_battery_message("fase_a", "state", '{"soc": 50, "mode": "Manual"}')
+    service._entity_payloads()
+    assert len(plans) == 1
+
+    service._apply_battery_message("fase_a", "state", '{"soc": 51, "mode": "Manual"}')
+    payloads = service._entity_payloads()
+    assert len(plans) == 2
+    assert '"fase_a": 51' in payloads[f"{service.topic_prefix}/all_full/attributes"]
+
+    service._apply_planner_message("desired_total_kwh", "8")
+    service._entity_payloads()
+    assert len(plans) == 3
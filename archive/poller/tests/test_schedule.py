@@ -0,0 +1,45 @@
+from marstek_api import ManualSlot, ScheduleManager
+
+NIGHT = ManualSlot(0, "23:00", "07:00", 127, -800, 1)
+
+
+def manager_with(*slots) -> ScheduleManager:
+    manager = ScheduleManager()
+    model = manager.model("10.0.0.1")
+    for n in range(len(model)):
+        model[n] = ManualSlot.disabled(n)
+    for slot in slots:
+        model[slot.time_num] = slot
+    return manager
+
+
+def test_unchanged_plan_needs_no_writes():
+    manager = manager_with(NIGHT)
+    assert manager.diff("10.0.0.1", [NIGHT], clear_unused=True) == []
+
+
+def test_cleanup_comes_before_the_plan():
+    stale = ManualSlot(3, "12:00", "14:00", 127, 500, 1)
+    manager = manager_with(stale)
+    writes = manager.diff("10.0.0.1", [NIGHT], clear_unused=True)
+    assert [slot.time_num for slot in writes] == [3, 0]
+    assert writes[0] == ManualSlot.disabled(3)
+    assert writes[1] == NIGHT
+
+
+def test_without_clear_unused_other_slots_stay():
+    stale = ManualSlot(3, "12:00", "14:00", 127, 500, 1)
+    manager = manager_with(stale)
+    assert manager.diff("10.0.0.1", [NIGHT]) == [NIGHT]
+
+
+def test_disabled_slots_match_whatever_their_times():
+    manager = manager_with(ManualSlot(2, "10:00", "11:00", 0, 0, 0))
+    assert manager.diff("10.0.0.1", [ManualSlot.disabled(2)]) == []
+
+
+def test_unknown_slots_are_written():
+    manager = ScheduleManager()
+    writes = manager.diff("10.0.0.1", [NIGHT], clear_unused=True)
+    assert len(writes) == 10
+    assert writes[-1] == NIGHT
@@ -0,0 +1,31 @@
+from marstek_simulator import slot_covers
+
+ALL_DAYS = 127
+
+
+def slot(start: str, end: str, week_set: int = ALL_DAYS) -> dict:
+    return {"start_time": start, "end_time": end, "week_set": week_set}
+
+
+def test_daytime_slot():
+    assert slot_covers(slot("10:00", "12:00"), 10 * 60, 0)
+    assert not slot_covers(slot("10:00", "12:00"), 12 * 60, 0)
+
+
+def test_slot_across_midnight():
+    night = slot("23:00", "07:00")
+    assert slot_covers(night, 23 * 60 + 30, 2)
+    assert slot_covers(night, 3 * 60, 2)
+    assert not slot_covers(night, 12 * 60, 2)
+
+
+def test_part_after_midnight_belongs_to_start_day():
+    monday_night = slot("22:00", "07:00", week_set=1)
+    assert slot_covers(monday_night, 22 * 60, 0)
+    assert slot_covers(monday_night, 6 * 60, 1)
+    assert not slot_covers(monday_night, 6 * 60, 0)
+
+
+def test_equal_start_and_end_is_all_day():
+    assert slot_covers(slot("00:00", "00:00"), 15 * 60, 4)
+    assert not slot_covers(slot("00:00", "00:00", week_set=1), 15 * 60, 4)
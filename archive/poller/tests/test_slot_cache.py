@@ -0,0 +1,18 @@
+import pytest
+
+from marstek_api import ManualSlot, SlotCache
+
+
+@pytest.mark.parametrize("content", ["[]", "null", "3", '"x"', '{"version": 1, "batteries": []}',
+                                     '{"version": 1, "batteries": {"10.0.0.1": [1]}}', "{"])
+def test_malformed_cache_is_empty(tmp_path, content):
+    path = tmp_path / "slot_cache.json"
+    path.write_text(content)
+    assert SlotCache(path).load() == {}
+
+
+def test_round_trip(tmp_path):
+    cache = SlotCache(tmp_path / "slot_cache.json")
+    slot = ManualSlot(0, "23:00", "07:00", 127, -800, 1)
+    cache.save({"10.0.0.1": [slot, None]}, {"10.0.0.1": "aa:bb"})
+    assert cache.load() == {"10.0.0.1": {"mac": "aa:bb", "slots": [slot, None]}}
@@ -0,0 +1,46 @@
+import time
+from array import array
+
+from marstek_telemetry import TelemetryStore
+
+# Recent, so the retention pruning on flush keeps it
+TS = float(int(time.time()))
+
+
+def test_append_only_buffers(tmp_path):
+    store = TelemetryStore(tmp_path, flush_seconds=0)
+    store.append("fase_a", TS, 50.0, 100, 0, "Auto")
+    assert not any(tmp_path.iterdir())
+    store.maybe_flush(TS)
+    assert store.query("fase_a", "raw", TS, TS + 1)["soc"].tolist() == [50.0]
+
+
+def test_maybe_flush_waits_for_flush_seconds(tmp_path):
+    store = TelemetryStore(tmp_path, flush_seconds=3600)
+    store.append("fase_a", TS, 50.0, 100, 0, "Auto")
+    store.maybe_flush(TS)
+    assert not any(tmp_path.iterdir())
+    store.flush(TS)
+    assert store.devices("raw") == ["fase_a"]
+
+
+def test_torn_append_is_repaired(tmp_path):
+    store = TelemetryStore(tmp_path)
+    for n in range(3):
+        store.append("fase_a", TS + n, 50.0 + n, 100 + n, 0, "Auto")
+    store.flush(TS + 3)
+
+    # A crash halfway through the next write: ts and half of soc are on disk
+    segment = next((tmp_path / "raw").iterdir())
+    with open(segment / "fase_a.ts", "ab") as f:
+        f.write(array("d", [TS + 3]).tobytes())
+    with open(segment / "fase_a.soc", "ab") as f:
+        f.write(array("f", [53.0]).tobytes()[:2])
+
+    store = TelemetryStore(tmp_path)
+    store.append("fase_a", TS + 4, 54.0, 104, 0, "Manual")
+    store.flush(TS + 5)
+    data = store.query("fase_a", "raw", TS, TS + 10)
+    assert data["ts"].tolist() == [TS, TS + 1, TS + 2, TS + 4]
+    assert data["soc"].tolist() == [50.0, 51.0, 52.0, 54.0]
+    assert data["ongrid_power"].tolist() == [100, 101, 102, 104]
@@ -2,12 +2,12 @@
 # -*- coding: utf-8 -*-
 """Script om slot 0 te clearen voor alle drie de Marstek batterijen."""
 
-import asyncio
-import json
 import logging
-import socket
 import sys
-import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "archive" / "poller"))
+from marstek_api import ManualSlot, MarstekClient, RetryPolicy, ScheduleManager  # noqa: E402
 
 # Logging configuratie
 logging.basicConfig(
@@ -26,158 +26,38 @@ BATTERIES = [
 # API constanten
 PORT = 30000
 TIMEOUT = 2.0
-MODE_MANUAL = "Manual"
-
-
-class SimpleMarstekClient:
-    """Eenvoudige UDP client voor Marstek batterijen."""
-
-    def __init__(self, host: str, port: int = PORT):
-        """Initialiseer de client."""
-        self.host = host
-        self.port = port
-        self.sock = None
-        self._msg_id = 0
-
-    def __enter__(self):
-        """Context manager entry."""
-        self.connect()
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        """Context manager exit."""
-        self.disconnect()
-
-    def connect(self):
-        """Maak verbinding."""
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind(("0.0.0.0", PORT))
-        self.sock.settimeout(TIMEOUT)
-        _LOGGER.debug(f"Socket gebonden op 0.0.0.0:{PORT}")
-
-    def disconnect(self):
-        """Verbreek verbinding."""
-        if self.sock:
-            self.sock.close()
-            self.sock = None
-
-    def send_command(self, method: str, params: dict, max_retries: int = 3) -> dict | None:
-        """Verstuur een command en wacht op response."""
-        if not self.sock:
-            raise RuntimeError("Niet verbonden")
-
-        self._msg_id += 1
-        payload = {
-            "id": self._msg_id,
-            "method": method,
-            "params": params,
-        }
-
-        payload_str = json.dumps(payload)
-
-        for attempt in range(max_retries):
-            _LOGGER.debug(f"Verzenden naar {self.host}:{self.port} (poging {attempt+1}/{max_retries}): {payload_str}")
-
-            # Verstuur command
-            self.sock.sendto(payload_str.encode(), (self.host, self.port))
-
-            # Wacht op response(s) - batterij kan meerdere packets sturen
-            try:
-                # Verzamel alle responses binnen timeout periode
-                start_time = time.time()
-                responses = []
-
-                while time.time() - start_time < TIMEOUT:
-                    try:
-                        self.sock.settimeout(0.5)
-                        resp_data, addr = self.sock.recvfrom(65535)
-
-                        # Skip echo's (batterij stuurt soms request terug)
-                        if resp_data.decode() == payload_str:
-                            _LOGGER.debug("Echo ontvangen, negeren")
-                            continue
-
-                        response = json.loads(resp_data.decode())
-                        responses.append(response)
-
-                        # Check of dit de juiste response is
-                        if response.get("id") == self._msg_id:
-                            if "error" in response:
-                                error = response["error"]
-                                _LOGGER.error(f"API fout: {error}")
-                                return None
-                            if "result" in response:
-                                _LOGGER.debug(f"Geldig antwoord ontvangen: {response}")
-                                return response.get("result")
-
-                    except socket.timeout:
-                        continue
-                    except json.JSONDecodeError as e:
-                        _LOGGER.warning(f"JSON decode fout: {e}")
-                        continue
-
-                # Geen geldige response gevonden
-                if responses:
-                    _LOGGER.warning(f"Responses ontvangen maar geen match: {responses}")
-
-                if attempt < max_retries - 1:
-                    _LOGGER.info(f"Opnieuw proberen over 0.5s...")
-                    time.sleep(0.5)
-
-            except Exception as e:
-                _LOGGER.error(f"Onverwachte fout: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(0.5)
-
-        _LOGGER.error(f"Geen geldige response na {max_retries} pogingen van {self.host}")
-        return None
-
-    def set_es_mode(self, config: dict) -> bool:
-        """Stel energy system mode in."""
-        result = self.send_command(
-            "ES.SetMode",
-            {"id": 0, "config": config}
-        )
-
-        if result and result.get("set_result"):
-            return True
-        return False
-
-
-def clear_slot_0(battery: dict) -> bool:
-    """Clear slot 0 voor een batterij."""
-    print(f"\n{'='*80}")
-    print(f"Clearing slot 0 voor: {battery['name']}")
-    print(f"IP adres: {battery['ip']}")
-    print(f"{'='*80}")
 
-    config = {
-        "mode": MODE_MANUAL,
-        "manual_cfg": {
-            "time_num": 0,
-            "start_time": "00:00",
-            "end_time": "00:00",
-            "week_set": 0,  # Geen dagen
-            "power": 0,
-            "enable": 0,  # Uitgeschakeld
-        },
-    }
+# Exponentiële backoff met jitter tussen pogingen (i.p.v. vaste 0.5s)
+RETRY_POLICY = RetryPolicy(retries=2, base_delay=0.25, max_delay=2.0)
 
-    try:
-        with SimpleMarstekClient(battery['ip']) as client:
-            success = client.set_es_mode(config)
+# Alle batterijen tegelijk, met een pauze tussen writes per batterij
+SCHEDULE = ScheduleManager(pace_seconds=0.5, attempts=2)
 
-            if success:
-                print(f"[OK] Slot 0 succesvol gecleared voor {battery['name']}")
-                return True
-            else:
-                print(f"[FOUT] Batterij weigerde slot 0 te clearen voor {battery['name']}")
-                return False
 
+def clear_slot_0(batteries: list) -> dict:
+    """Clear slot 0 voor alle batterijen tegelijk."""
+    clients = {
+        MarstekClient(battery['ip'], PORT, timeout=TIMEOUT, retry_policy=RETRY_POLICY): battery
+        for battery in batteries
+    }
+    try:
+        results = SCHEDULE.apply_all({client: [ManualSlot.disabled(0)] for client in clients})
     except Exception as e:
-        print(f"[FOUT] Fout bij clearen van slot 0 voor {battery['name']}: {e}")
+        print(f"[FOUT] Fout bij clearen van slot 0: {e}")
         _LOGGER.exception("Uitgebreide fout informatie:")
-        return False
+        return {battery['name']: False for battery in batteries}
+
+    outcome = {}
+    for client, result in zip(clients, results):
+        battery = clients[client]
+        print(f"\n{'='*80}")
+        print(f"Slot 0 voor: {battery['name']} ({battery['ip']})")
+        if result.ok:
+            print(f"[OK] Slot 0 succesvol gecleared ({result.elapsed * 1000:.0f}ms)")
+        else:
+            print(f"[FOUT] Batterij weigerde slot 0 te clearen: {result.error or 'geen bevestiging'}")
+        outcome[battery['name']] = result.ok
+    return outcome
 
 
 def main():
@@ -187,10 +67,7 @@ def main():
     print("Dit script cleared slot 0 voor alle drie de batterijen")
     print()
 
-    results = {}
-    for battery in BATTERIES:
-        result = clear_slot_0(battery)
-        results[battery['name']] = result
+    results = clear_slot_0(BATTERIES)
 
     # Samenvatting
     print(f"\n{'='*80}")
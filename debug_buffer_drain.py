@@ -1,92 +0,0 @@
-#!/usr/bin/env python3
-"""
-Test: Drain de socket buffer voor elke request.
-"""
-
-import socket
-import json
-import time
-import select
-
-BATTERIES = [
-    {"name": "Fase A", "ip": "192.168.6.80"},
-    {"name": "Fase B", "ip": "192.168.6.213"},
-    {"name": "Fase C", "ip": "192.168.6.144"},
-]
-PORT = 30000
-
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-sock.bind(("0.0.0.0", PORT))
-sock.setblocking(False)
-
-def drain_buffer():
-    """Leeg alle pending data uit de socket buffer."""
-    drained = 0
-    while True:
-        ready, _, _ = select.select([sock], [], [], 0.01)
-        if not ready:
-            break
-        try:
-            data, addr = sock.recvfrom(65535)
-            drained += 1
-            print(f"      [DRAIN] Discarded old response from {addr[0]}")
-        except:
-            break
-    return drained
-
-def send_and_receive(ip, request_id, timeout=3.0):
-    """Stuur request en wacht op antwoord."""
-    # DRAIN buffer eerst!
-    drain_buffer()
-
-    request = {"id": request_id, "method": "Marstek.GetDevice", "params": {"ble_mac": "0"}}
-    sock.sendto(json.dumps(request).encode(), (ip, PORT))
-
-    start = time.time()
-    while time.time() - start < timeout:
-        ready, _, _ = select.select([sock], [], [], 0.1)
-        if ready:
-            try:
-                data, addr = sock.recvfrom(65535)
-                response = json.loads(data.decode())
-
-                if response.get("id") == request_id and addr[0] == ip:
-                    elapsed = (time.time() - start) * 1000
-                    return elapsed, response
-                else:
-                    print(f"      [SKIP] Response id={response.get('id')} from {addr[0]}")
-            except Exception as e:
-                print(f"      [ERROR] {e}")
-
-    return None, "TIMEOUT"
-
-print("=" * 60)
-print("BUFFER DRAIN TEST")
-print("(Leegt buffer voor elke request)")
-print("=" * 60)
-
-request_id = 0
-
-for round_num in range(3):
-    print(f"\n--- Round {round_num + 1} ---")
-
-    for bat in BATTERIES:
-        request_id += 1
-        latency, result = send_and_receive(bat["ip"], request_id)
-
-        if latency is not None:
-            if "result" in result:
-                device = result["result"].get("device", "?")
-                print(f"{bat['name']}: OK ({latency:.0f}ms) - {device}")
-            else:
-                print(f"{bat['name']}: ERROR - {result}")
-        else:
-            print(f"{bat['name']}: {result}")
-
-        time.sleep(0.5)
-
-    time.sleep(2)
-
-sock.close()
-print("\n" + "=" * 60)
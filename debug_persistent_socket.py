@@ -1,79 +0,0 @@
-#!/usr/bin/env python3
-"""
-Test met persistente socket (zoals HA integratie doet).
-"""
-
-import socket
-import json
-import time
-
-BATTERIES = [
-    {"name": "Fase A", "ip": "192.168.6.80"},
-    {"name": "Fase B", "ip": "192.168.6.213"},
-    {"name": "Fase C", "ip": "192.168.6.144"},
-]
-PORT = 30000
-
-# Maak één persistente socket
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-sock.bind(("0.0.0.0", PORT))
-sock.setblocking(False)
-
-print("=" * 60)
-print("PERSISTENT SOCKET TEST")
-print("(Simuleert HA integratie gedrag)")
-print("=" * 60)
-
-import select
-
-def send_and_receive(ip, request_id, timeout=3.0):
-    """Stuur request en wacht op antwoord."""
-    request = {"id": request_id, "method": "Marstek.GetDevice", "params": {"ble_mac": "0"}}
-    sock.sendto(json.dumps(request).encode(), (ip, PORT))
-
-    start = time.time()
-    while time.time() - start < timeout:
-        # Check of er data beschikbaar is
-        ready, _, _ = select.select([sock], [], [], 0.1)
-        if ready:
-            try:
-                data, addr = sock.recvfrom(65535)
-                response = json.loads(data.decode())
-
-                # Check of dit de juiste response is
-                if response.get("id") == request_id and addr[0] == ip:
-                    elapsed = (time.time() - start) * 1000
-                    return elapsed, response
-                else:
-                    # Verkeerde response - log en ga door
-                    print(f"      [SKIP] Response id={response.get('id')} from {addr[0]} (expected id={request_id} from {ip})")
-            except Exception as e:
-                print(f"      [ERROR] {e}")
-
-    return None, "TIMEOUT"
-
-request_id = 0
-
-for round_num in range(3):
-    print(f"\n--- Round {round_num + 1} ---")
-
-    for bat in BATTERIES:
-        request_id += 1
-        latency, result = send_and_receive(bat["ip"], request_id)
-
-        if latency is not None:
-            if "result" in result:
-                device = result["result"].get("device", "?")
-                print(f"{bat['name']}: OK ({latency:.0f}ms) - {device}")
-            else:
-                print(f"{bat['name']}: ERROR - {result}")
-        else:
-            print(f"{bat['name']}: {result}")
-
-        time.sleep(0.5)  # Pauze tussen requests
-
-    time.sleep(2)  # Pauze tussen rounds
-
-sock.close()
-print("\n" + "=" * 60)
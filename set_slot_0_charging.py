@@ -2,11 +2,12 @@
 # -*- coding: utf-8 -*-
 """Script om slot 0 in te stellen voor laden 16u-17u @ 1000W voor alle batterijen."""
 
-import json
 import logging
-import socket
 import sys
-import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "archive" / "poller"))
+from marstek_api import ManualSlot, MarstekClient, RetryPolicy, ScheduleManager  # noqa: E402
 
 # Logging configuratie
 logging.basicConfig(
@@ -25,7 +26,12 @@ BATTERIES = [
 # API constanten
 PORT = 30000
 TIMEOUT = 2.0
-MODE_MANUAL = "Manual"
+
+# Exponentiële backoff met jitter tussen pogingen (i.p.v. vaste 0.5s)
+RETRY_POLICY = RetryPolicy(retries=2, base_delay=0.25, max_delay=2.0)
+
+# Alle batterijen tegelijk, met een pauze tussen writes per batterij
+SCHEDULE = ScheduleManager(pace_seconds=0.5, attempts=2)
 
 # Schedule configuratie
 SLOT_NUM = 0
@@ -34,158 +40,44 @@ END_TIME = "17:00"
 POWER = -1000  # Negatief = laden
 WEEK_SET = 127  # Alle dagen (1+2+4+8+16+32+64)
 ENABLE = 1  # Enabled
-
-
-class SimpleMarstekClient:
-    """Eenvoudige UDP client voor Marstek batterijen."""
-
-    def __init__(self, host: str, port: int = PORT):
-        """Initialiseer de client."""
-        self.host = host
-        self.port = port
-        self.sock = None
-        self._msg_id = 0
-
-    def __enter__(self):
-        """Context manager entry."""
-        self.connect()
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        """Context manager exit."""
-        self.disconnect()
-
-    def connect(self):
-        """Maak verbinding."""
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind(("0.0.0.0", PORT))
-        self.sock.settimeout(TIMEOUT)
-        _LOGGER.debug(f"Socket gebonden op 0.0.0.0:{PORT}")
-
-    def disconnect(self):
-        """Verbreek verbinding."""
-        if self.sock:
-            self.sock.close()
-            self.sock = None
-
-    def send_command(self, method: str, params: dict, max_retries: int = 3) -> dict | None:
-        """Verstuur een command en wacht op response."""
-        if not self.sock:
-            raise RuntimeError("Niet verbonden")
-
-        self._msg_id += 1
-        payload = {
-            "id": self._msg_id,
-            "method": method,
-            "params": params,
-        }
-
-        payload_str = json.dumps(payload)
-
-        for attempt in range(max_retries):
-            _LOGGER.debug(f"Verzenden naar {self.host}:{self.port} (poging {attempt+1}/{max_retries}): {payload_str}")
-
-            # Verstuur command
-            self.sock.sendto(payload_str.encode(), (self.host, self.port))
-
-            # Wacht op response(s) - batterij kan meerdere packets sturen
-            try:
-                # Verzamel alle responses binnen timeout periode
-                start_time = time.time()
-                responses = []
-
-                while time.time() - start_time < TIMEOUT:
-                    try:
-                        self.sock.settimeout(0.5)
-                        resp_data, addr = self.sock.recvfrom(65535)
-
-                        # Skip echo's (batterij stuurt soms request terug)
-                        if resp_data.decode() == payload_str:
-                            _LOGGER.debug("Echo ontvangen, negeren")
-                            continue
-
-                        response = json.loads(resp_data.decode())
-                        responses.append(response)
-
-                        # Check of dit de juiste response is
-                        if response.get("id") == self._msg_id:
-                            if "error" in response:
-                                error = response["error"]
-                                _LOGGER.error(f"API fout: {error}")
-                                return None
-                            if "result" in response:
-                                _LOGGER.debug(f"Geldig antwoord ontvangen: {response}")
-                                return response.get("result")
-
-                    except socket.timeout:
-                        continue
-                    except json.JSONDecodeError as e:
-                        _LOGGER.warning(f"JSON decode fout: {e}")
-                        continue
-
-                # Geen geldige response gevonden
-                if responses:
-                    _LOGGER.warning(f"Responses ontvangen maar geen match: {responses}")
-
-                if attempt < max_retries - 1:
-                    _LOGGER.info(f"Opnieuw proberen over 0.5s...")
-                    time.sleep(0.5)
-
-            except Exception as e:
-                _LOGGER.error(f"Onverwachte fout: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(0.5)
-
-        _LOGGER.error(f"Geen geldige response na {max_retries} pogingen van {self.host}")
-        return None
-
-    def set_es_mode(self, config: dict) -> bool:
-        """Stel energy system mode in."""
-        result = self.send_command(
-            "ES.SetMode",
-            {"id": 0, "config": config}
-        )
-
-        if result and result.get("set_result"):
-            return True
-        return False
-
-
-def set_slot_charging(battery: dict) -> bool:
-    """Stel slot 0 in voor laden 16u-17u @ 1000W."""
-    print(f"\n{'='*80}")
-    print(f"Configureren slot {SLOT_NUM} voor: {battery['name']}")
-    print(f"IP adres: {battery['ip']}")
-    print(f"Schema: {START_TIME}-{END_TIME}, {abs(POWER)}W laden, alle dagen")
-    print(f"{'='*80}")
-
-    config = {
-        "mode": MODE_MANUAL,
-        "manual_cfg": {
-            "time_num": SLOT_NUM,
-            "start_time": START_TIME,
-            "end_time": END_TIME,
-            "week_set": WEEK_SET,
-            "power": POWER,
-            "enable": ENABLE,
-        },
+# Overige slots (1-9) uitschakelen, zodat oude schedules uit de app niet
+# meer meeladen (PROBLEEM 4)
+CLEAR_UNUSED = True
+
+
+def set_slot_charging(batteries: list) -> dict:
+    """Stel slot 0 in voor laden 16u-17u @ 1000W, voor alle batterijen tegelijk."""
+    slot = ManualSlot(
+        time_num=SLOT_NUM,
+        start_time=START_TIME,
+        end_time=END_TIME,
+        week_set=WEEK_SET,
+        power=POWER,
+        enable=ENABLE,
+    )
+    clients = {
+        MarstekClient(battery['ip'], PORT, timeout=TIMEOUT, retry_policy=RETRY_POLICY): battery
+        for battery in batteries
     }
-
     try:
-        with SimpleMarstekClient(battery['ip']) as client:
-            success = client.set_es_mode(config)
-
-            if success:
-                print(f"[OK] Slot {SLOT_NUM} succesvol ingesteld voor {battery['name']}")
-                return True
-            else:
-                print(f"[FOUT] Batterij weigerde slot {SLOT_NUM} configuratie voor {battery['name']}")
-                return False
-
+        results = SCHEDULE.apply_all({client: [slot] for client in clients}, clear_unused=CLEAR_UNUSED)
     except Exception as e:
-        print(f"[FOUT] Fout bij configureren van slot {SLOT_NUM} voor {battery['name']}: {e}")
+        print(f"[FOUT] Fout bij configureren van slot {SLOT_NUM}: {e}")
         _LOGGER.exception("Uitgebreide fout informatie:")
-        return False
+        return {battery['name']: False for battery in batteries}
+
+    outcome = {}
+    for client, result in zip(clients, results):
+        battery = clients[client]
+        print(f"\n{'='*80}")
+        print(f"Slots voor: {battery['name']} ({battery['ip']})")
+        print(f"Geschreven: {result.written or '-'}, ongewijzigd: {result.skipped}")
+        if result.ok:
+            print(f"[OK] Slot {SLOT_NUM} succesvol ingesteld ({result.elapsed * 1000:.0f}ms)")
+        else:
+            print(f"[FOUT] Slots {result.failed} niet bevestigd: {result.error or 'geen bevestiging'}")
+        outcome[battery['name']] = result.ok
+    return outcome
 
 
 def main():
@@ -196,17 +88,11 @@ def main():
     print(f"Power: {POWER}W (laden)")
     print(f"Dagen: Alle dagen")
     print(f"Status: Enabled")
+    if CLEAR_UNUSED:
+        print("Overige slots: worden uitgeschakeld")
     print()
 
-    results = {}
-    for i, battery in enumerate(BATTERIES):
-        result = set_slot_charging(battery)
-        results[battery['name']] = result
-
-        # Delay tussen batterijen om conflicts te vermijden
-        if i < len(BATTERIES) - 1:
-            print("\nWacht 1 seconde voor volgende batterij...")
-            time.sleep(1)
+    results = set_slot_charging(BATTERIES)
 
     # Samenvatting
     print(f"\n{'='*80}")
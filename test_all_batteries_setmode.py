@@ -3,9 +3,17 @@
 Test ES.SetMode op alle 3 batterijen om te zien welke werkt en welke faalt.
 """
 
-import socket
-import json
-import time
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "archive" / "poller"))
+from marstek_api import (  # noqa: E402
+    CircuitOpenError,
+    ManualSlot,
+    MarstekApiError,
+    MarstekClient,
+    RetryPolicy,
+)
 
 BATTERIES = [
     {"name": "Fase A (schuin - d828)", "ip": "192.168.6.80"},
@@ -23,88 +31,37 @@ def test_setmode(name, ip):
     print(f"IP: {ip}")
     print("="*60)
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.settimeout(TIMEOUT)
-
-    try:
-        # Marstek devices vereisen source port 30000!
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.bind(("0.0.0.0", PORT))
-        print(f"Using source port: {PORT}")
-    except Exception as e:
-        print(f"Socket error: {e}")
-        return
+    # Geen retries: we willen zien of de batterij de eerste keer antwoordt
+    client = MarstekClient(ip, PORT, timeout=TIMEOUT, retry_policy=RetryPolicy(retries=0))
 
     # Eerst device info ophalen
-    request = {
-        "id": 1,
-        "method": "Marstek.GetDevice",
-        "params": {"ble_mac": "0"}
-    }
-
-    sock.sendto(json.dumps(request).encode(), (ip, PORT))
-
     try:
-        data, addr = sock.recvfrom(65535)
-        device_info = json.loads(data.decode())
-        if "result" in device_info:
-            print(f"Device: {device_info['result'].get('device')}, FW: v{device_info['result'].get('ver')}")
+        device = client.get_device()
+        if device:
+            print(f"Device: {device.device}, FW: v{device.ver}")
         else:
-            print(f"Device info response: {device_info}")
-    except socket.timeout:
-        print("GetDevice: TIMEOUT")
-    except Exception as e:
+            print("GetDevice: TIMEOUT")
+    except (MarstekApiError, CircuitOpenError) as e:
         print(f"GetDevice error: {e}")
 
-    time.sleep(0.5)
-
-    # Nu ES.SetMode testen
-    request = {
-        "id": 2,
-        "method": "ES.SetMode",
-        "params": {
-            "id": 0,
-            "config": {
-                "mode": "Manual",
-                "manual_cfg": {
-                    "time_num": 9,
-                    "start_time": "00:00",
-                    "end_time": "00:00",
-                    "week_set": 0,
-                    "power": 0,
-                    "enable": 0
-                }
-            }
-        }
-    }
-
+    # Nu ES.SetMode testen (slot 9 leeg)
     print(f"\nSending ES.SetMode to {ip}...")
-    sock.sendto(json.dumps(request).encode(), (ip, PORT))
-
     try:
-        data, addr = sock.recvfrom(65535)
-        response = json.loads(data.decode())
-
-        if "result" in response:
-            print(f"[OK] SUCCESS: {response['result']}")
-        elif "error" in response:
-            err = response['error']
-            code = err.get('code', '?')
-            msg = err.get('message', '?')
-            print(f"[FAIL] ERROR {code}: {msg}")
-            if code == -32601:
-                print("   -> ES.SetMode is NOT SUPPORTED op dit device!")
+        result = client.call("ES.SetMode", {
+            "id": 0,
+            "config": {"mode": "Manual", "manual_cfg": ManualSlot.disabled(9).as_dict()}
+        })
+        if result is None:
+            print("[FAIL] TIMEOUT: Geen response ontvangen")
         else:
-            print(f"[?] UNKNOWN: {response}")
-
-    except socket.timeout:
-        print("[FAIL] TIMEOUT: Geen response ontvangen")
-    except Exception as e:
+            print(f"[OK] SUCCESS: {result}")
+    except MarstekApiError as e:
+        print(f"[FAIL] ERROR {e.code}: {e.message}")
+        if e.code == -32601:
+            print("   -> ES.SetMode is NOT SUPPORTED op dit device!")
+    except CircuitOpenError as e:
         print(f"[FAIL] ERROR: {e}")
 
-    sock.close()
-    return
-
 def main():
     print("="*60)
     print("ES.SetMode TEST OP ALLE BATTERIJEN")
@@ -112,7 +69,6 @@ def main():
 
     for bat in BATTERIES:
         test_setmode(bat["name"], bat["ip"])
-        time.sleep(1)
 
     print("\n" + "="*60)
     print("TEST COMPLETE")
@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 """Quick connectivity test voor alle batterijen."""
 
-import socket
-import json
-import time
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "archive" / "poller"))
+from marstek_api import CircuitOpenError, MarstekApiError, MarstekClient  # noqa: E402
 
 BATTERIES = [
     {"name": "Fase A", "ip": "192.168.6.80"},
@@ -13,36 +15,22 @@ BATTERIES = [
 PORT = 30000
 
 def test_battery(name, ip):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.settimeout(3.0)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    client = MarstekClient(ip, PORT, timeout=3.0)
 
     try:
-        sock.bind(("0.0.0.0", PORT))
-    except:
-        pass
-
-    request = {"id": 1, "method": "Marstek.GetDevice", "params": {"ble_mac": "0"}}
-    sock.sendto(json.dumps(request).encode(), (ip, PORT))
+        device = client.get_device()
+    except (MarstekApiError, CircuitOpenError) as e:
+        print(f"{name} ({ip}): ERROR - {e}")
+        return False
 
-    try:
-        data, _ = sock.recvfrom(65535)
-        response = json.loads(data.decode())
-        if "result" in response:
-            r = response["result"]
-            print(f"{name} ({ip}): OK - {r.get('device')} v{r.get('ver')}")
-            return True
-        elif "error" in response:
-            print(f"{name} ({ip}): ERROR - {response['error']}")
-            return False
-    except socket.timeout:
+    if device is None:
         print(f"{name} ({ip}): TIMEOUT - niet bereikbaar")
         return False
-    finally:
-        sock.close()
+
+    print(f"{name} ({ip}): OK - {device.device} v{device.ver}")
+    return True
 
 print("Connectivity test...")
 print("-" * 50)
 for bat in BATTERIES:
     test_battery(bat["name"], bat["ip"])
-    time.sleep(0.5)